@@ -0,0 +1,133 @@
+"""
+End-to-end generation benchmark against the local mock BFL API.
+
+Runs `count` generations through `api_utils.agenerate_image` with at most
+`concurrency` in flight, and reports latency percentiles, throughput, API
+requests per image and peak Python heap per concurrent task. Nothing is sent
+to the real API and no credits are spent.
+
+Usage:
+    python benchmarks/bench_generation.py --count 64 --concurrency 16
+    python benchmarks/bench_generation.py --server-url http://127.0.0.1:8765  # external mock_bfl_server.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(count: int, concurrency: int, model_id: str):
+    from api_utils import agenerate_image
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await agenerate_image(
+                    api_key="mock-key",
+                    model_id=model_id,
+                    prompt=f"benchmark image {index}",
+                    width=1024,
+                    height=1024,
+                    steps=28,
+                    guidance_scale=2.5,
+                    seed=index,
+                    finetune_id="mock-finetune-0" if model_id == "flux-pro-finetuned" else None,
+                    priority="batch",
+                    use_cache=False,
+                )
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                failures.append(e)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=64, help="number of generations")
+    parser.add_argument("--concurrency", type=int, default=16, help="generations in flight at once")
+    parser.add_argument("--model", default="flux-pro-1.1", help="model ID to benchmark")
+    parser.add_argument("--server-url", help="use a running mock server instead of an in-process one")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--queue-time", type=float, default=0.5)
+    parser.add_argument("--generation-time", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--download-cut-rate", type=float, default=0.0, help="fraction of image downloads cut off halfway")
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--max-active-tasks", type=int, default=0, help="mock API limit of unfinished tasks (429 above)")
+    args = parser.parse_args()
+
+    server = None
+    if args.server_url:
+        base_url = args.server_url
+    else:
+        from mock_bfl_server import MockBFLServer, MockSettings
+
+        settings = MockSettings(
+            latency=args.latency,
+            queue_time=args.queue_time,
+            generation_time=args.generation_time,
+            error_rate=args.error_rate,
+            download_cut_rate=args.download_cut_rate,
+            image_size=args.image_size,
+            max_active_tasks=args.max_active_tasks,
+        )
+        server = MockBFLServer(settings=settings).start()
+        base_url = server.url
+
+    # Configuration is read at import time: point the client to the mock and isolate its data
+    os.environ["BFL_API_BASE_URL"] = base_url
+    os.environ["FLUX_GUI_DATA_DIR"] = tempfile.mkdtemp(prefix="flux-bench-")
+    sys.path.insert(0, SRC_DIR)
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    latencies, failures, wall_time = asyncio.run(run(args.count, args.concurrency, args.model))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    import httpx
+
+    stats = httpx.get(f"{base_url}/_stats").json()
+    api_requests = sum(count for route, count in stats.items() if route not in ("/_stats", "rate_limited", "downloads_cut"))
+    images = len(latencies)
+
+    print(f"Generations:         {images} ok, {len(failures)} failed, concurrency {args.concurrency}")
+    print(f"Wall time:           {wall_time:.2f} s")
+    print(f"Throughput:          {images / wall_time:.2f} images/s")
+    print(
+        "Latency (s):         "
+        f"p50 {percentile(latencies, 0.5):.3f}  p90 {percentile(latencies, 0.9):.3f}  "
+        f"p99 {percentile(latencies, 0.99):.3f}  max {max(latencies, default=0):.3f}"
+    )
+    print(f"Requests per image:  {api_requests / max(images, 1):.1f} ({', '.join(f'{route}: {count}' for route, count in sorted(stats.items()))})")
+    print(f"Peak heap per task:  {(peak - baseline) / max(1, min(args.concurrency, args.count)) / 1024:.0f} KiB")
+    if failures:
+        print(f"First failure:       {failures[0]}")
+
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Cold start benchmark of the client modules and CLIs.
+
+For each target, runs a fresh interpreter several times and reports the median
+import time measured by `python -X importtime`, the wall-clock time of the
+whole process, and which heavy dependencies (gradio, PIL, httpx, requests)
+the import pulled in. The interpreter's own start (`python -c pass`) is
+reported as the baseline. The scripts' command lines are then timed end to
+end (`python <script> --help`), which is what a user waits for.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7] [--top 10] [--cli bfl_finetune.py ...] [target ...]
+Targets are module names from src/ (e.g. api_utils, batch_cli, bfl_finetune, webui).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "src"))
+DEFAULT_TARGETS = ["api_utils", "batch_cli", "bfl_finetune", "webui"]
+DEFAULT_CLI = ["bfl_finetune.py", "batch_cli.py", "dataset_prep.py", "finetune_eval.py", "serve.py"]
+HEAVY_MODULES = ("gradio", "PIL", "httpx", "requests", "numpy", "fire")
+
+
+def run_once(code: str) -> tuple:
+    """
+    Run `code` in a fresh interpreter, returns (wall seconds, stdout, importtime lines)
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_time = time.perf_counter() - start
+    lines = [line for line in process.stderr.splitlines() if line.startswith("import time:")]
+    return wall_time, process.stdout, lines
+
+
+def parse_importtime(lines: list) -> list:
+    """
+    (module name, nesting depth, cumulative seconds) of every import, in the order
+    they are reported (a module comes right after the imports it triggered)
+    """
+    imports = []
+    for line in lines[1:]:  # the first line is the header
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative_us) / 1e6))
+    return imports
+
+
+def direct_imports(imports: list, target: str) -> list:
+    """
+    (cumulative seconds, name) of the modules imported directly by `target`
+    """
+    names = [name for name, _, _ in imports]
+    if target not in names:
+        return []
+    index = names.index(target)
+    depth = imports[index][1]
+    children = []
+    for name, child_depth, seconds in reversed(imports[:index]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 1:
+            children.append((seconds, name))
+    return children
+
+
+def bench_target(target: str, runs: int, top: int):
+    code = f"import sys; import {target}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    walls, import_times = [], []
+    for _ in range(runs):
+        wall_time, stdout, lines = run_once(code)
+        imports = parse_importtime(lines)
+        walls.append(wall_time)
+        import_times.append(next((seconds for name, _, seconds in imports if name == target), 0.0))
+    heavy = stdout.strip() or "none"
+    print(f"{target:<14} import {statistics.median(import_times) * 1000:7.1f} ms   process {statistics.median(walls) * 1000:7.1f} ms   loads: {heavy}")
+    for seconds, name in sorted(direct_imports(imports, target), reverse=True)[:top]:
+        print(f"    {seconds * 1000:7.1f} ms  {name}")
+
+
+def bench_cli(script: str, runs: int):
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], cwd=SRC_DIR, capture_output=True, check=True)
+        walls.append(time.perf_counter() - start)
+    print(f"{script + ' --help':<30} process {statistics.median(walls) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--runs", type=int, default=7, help="interpreter starts per target (median reported)")
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest direct imports of each target")
+    parser.add_argument("--cli", nargs="*", default=DEFAULT_CLI, help="scripts timed end to end with --help")
+    args = parser.parse_args()
+
+    baseline = statistics.median(run_once("pass")[0] for _ in range(args.runs))
+    print(f"{'python -c pass':<14} process {baseline * 1000:7.1f} ms (baseline)")
+    for target in args.targets:
+        bench_target(target, args.runs, args.top)
+    for script in args.cli:
+        bench_cli(script, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Peak RSS of building the finetune request body, in-memory vs streaming.
+
+Each measurement runs in a fresh subprocess so peaks do not leak between runs.
+The streaming body is consumed chunk by chunk, as the HTTP client does while
+sending it; the legacy body is built the way `requests` serializes `json=payload`.
+
+Usage:
+    python benchmarks/bench_upload_memory.py [size_mb ...]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DEFAULT_SIZES_MB = [16, 64, 256]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_legacy(zip_path: str):
+    import base64
+    import json
+
+    with open(zip_path, "rb") as file:
+        encoded_zip = base64.b64encode(file.read()).decode("utf-8")
+    payload = {"finetune_comment": "bench", "file_data": encoded_zip}
+    body = json.dumps(payload).encode("utf-8")
+    return len(body)
+
+
+def build_streaming(zip_path: str):
+    sys.path.insert(0, SRC_DIR)
+    from streaming_upload import Base64JsonBody
+
+    body = Base64JsonBody(zip_path, {"finetune_comment": "bench"})
+    sent = sum(len(chunk) for chunk in body)
+    assert sent == len(body)
+    return sent
+
+
+def measure(method: str, zip_path: str):
+    """
+    Run in the child process: print baseline and peak RSS around building the body
+    """
+    baseline = peak_rss_mb()
+    size = {"legacy": build_legacy, "streaming": build_streaming}[method](zip_path)
+    print(f"{baseline:.1f} {peak_rss_mb():.1f} {size}")
+
+
+def make_zip(path: str, size_mb: int):
+    # Random (incompressible) content, like already-compressed images
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        with archive.open("data.bin", "w") as entry:
+            for _ in range(size_mb):
+                entry.write(os.urandom(1024 * 1024))
+
+
+def main(sizes_mb):
+    print(f"{'ZIP size':>10} {'method':>10} {'peak RSS':>12} {'over baseline':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes_mb:
+            zip_path = os.path.join(tmp, f"dataset_{size_mb}.zip")
+            make_zip(zip_path, size_mb)
+            for method in ("legacy", "streaming"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", method, zip_path],
+                    check=True, capture_output=True, text=True,
+                ).stdout.split()
+                baseline, peak = float(output[0]), float(output[1])
+                print(f"{size_mb:>8}MB {method:>10} {peak:>10.1f}MB {peak - baseline:>12.1f}MB")
+            os.remove(zip_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES_MB)
@@ -0,0 +1,305 @@
+"""
+Local stand-in for the BFL API, to exercise the client without spending credits.
+
+Implements the endpoints used by the GUI: generation submits (`/v1/flux-pro*`,
+`/v1/*-finetuned`), `/v1/get_result`, `/v1/finetune`, `/v1/my_finetunes`,
+`/v1/finetune_details`, `/v1/delete_finetune`, plus a `/delivery/...` route
+serving the result images (with Range support). Latency, queue, generation and
+training times, error, moderation and cut download rates, image sizes and a
+limit of active tasks (answered with 429s) are configurable. `GET /_stats` returns the request counts per route.
+
+Usage:
+    python benchmarks/mock_bfl_server.py --port 8765 --queue-time 0.5 --generation-time 2
+    BFL_API_BASE_URL=http://127.0.0.1:8765 python src/webui.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+
+class MockSettings:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        queue_time: float = 0.5,
+        generation_time: float = 2.0,
+        error_rate: float = 0.0,
+        moderation_rate: float = 0.0,
+        http_error_rate: float = 0.0,
+        download_cut_rate: float = 0.0,
+        image_size: int = 1024,
+        finetunes: int = 5,
+        training_time: float = 60.0,
+        max_active_tasks: int = 0,
+        seed: int = None,
+    ):
+        self.latency = latency  # added to every response, in seconds
+        self.queue_time = queue_time  # time a task stays queued, without progress
+        self.generation_time = generation_time  # time from leaving the queue to Ready
+        self.error_rate = error_rate  # fraction of tasks ending with status Error
+        self.moderation_rate = moderation_rate  # fraction of tasks ending Content Moderated
+        self.http_error_rate = http_error_rate  # fraction of API requests answered with a 503
+        self.download_cut_rate = download_cut_rate  # fraction of image downloads cut off halfway
+        self.image_size = image_size  # side of the square result images, in pixels
+        self.finetunes = finetunes
+        self.training_time = training_time  # time from a finetune submit to Ready
+        self.max_active_tasks = max_active_tasks  # submits beyond this many unfinished tasks get a 429 (0: no limit)
+        self.random = random.Random(seed)
+
+
+def _make_image(side: int) -> bytes:
+    # Noise compresses like a real photo, unlike a flat color
+    image = Image.effect_noise((side, side), 64).convert("RGB")
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+class MockBFLServer:
+    """
+    Threaded mock server, usable in-process (start/stop) or from the command line
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: MockSettings = None):
+        self.settings = settings or MockSettings()
+        self.tasks = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.image = _make_image(self.settings.image_size)
+        self.finetune_ids = [f"mock-finetune-{i}" for i in range(self.settings.finetunes)]
+        self.trainings = {}  # finetune id -> submit time, for finetunes submitted to the mock
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-bfl", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _new_task(self, payload: dict) -> str:
+        task_id = str(uuid.uuid4())
+        roll = self.settings.random.random()
+        outcome = "Ready"
+        if roll < self.settings.error_rate:
+            outcome = "Error"
+        elif roll < self.settings.error_rate + self.settings.moderation_rate:
+            outcome = "Content Moderated"
+        with self.lock:
+            self.tasks[task_id] = {"created": time.monotonic(), "payload": payload, "outcome": outcome}
+        return task_id
+
+    def _active_tasks(self) -> int:
+        finished_after = self.settings.queue_time + self.settings.generation_time
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for task in self.tasks.values() if now - task["created"] < finished_after)
+
+    def _training_progress(self, finetune_id: str) -> float:
+        """
+        Training progress of a finetune, None for the pre-existing (already Ready) ones
+        """
+        with self.lock:
+            submitted = self.trainings.get(finetune_id)
+        if submitted is None:
+            return None
+        return min(1.0, (time.monotonic() - submitted) / self.settings.training_time) if self.settings.training_time else 1.0
+
+    def _result(self, task_id: str) -> dict:
+        training = self._training_progress(task_id)
+        if training is not None:
+            if training < 1:
+                return {"id": task_id, "status": "Pending", "progress": round(training, 3)}
+            return {"id": task_id, "status": "Ready", "result": None, "progress": None}
+        with self.lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            return {"id": task_id, "status": "Task not found"}
+        elapsed = time.monotonic() - task["created"]
+        if elapsed < self.settings.queue_time:
+            return {"id": task_id, "status": "Pending", "progress": None}
+        generating = elapsed - self.settings.queue_time
+        if generating < self.settings.generation_time:
+            return {"id": task_id, "status": "Pending", "progress": round(generating / self.settings.generation_time, 3)}
+        if task["outcome"] != "Ready":
+            return {"id": task_id, "status": task["outcome"]}
+        return {
+            "id": task_id,
+            "status": "Ready",
+            "result": {"sample": f"{self.url}/delivery/{task_id}.jpg", "prompt": task["payload"].get("prompt")},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body, content_type: str = "application/json", headers: dict = None):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                try:
+                    self.send_response(code)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    for name, value in (headers or {}).items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client went away (e.g. a cancelled request)
+                    pass
+
+            def _deliver(self):
+                """
+                Serve the result image, honoring Range requests, and maybe cut the transfer short
+                """
+                data, code, headers = server.image, 200, {"Accept-Ranges": "bytes", "ETag": '"mock-image"'}
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if match and self.headers.get("If-Range", '"mock-image"') == '"mock-image"':
+                    start = int(match.group(1))
+                    if start >= len(data):
+                        return self._send(416, b"", headers={"Content-Range": f"bytes */{len(data)}"})
+                    code = 206
+                    headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+                    data = data[start:]
+                if server.settings.random.random() >= server.settings.download_cut_rate:
+                    return self._send(code, data, "image/jpeg", headers=headers)
+                with server.lock:
+                    server.stats["downloads_cut"] += 1
+                try:
+                    self.send_response(code)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(data)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data[: len(data) // 2])
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True
+
+            def _begin(self, route: str) -> bool:
+                """
+                Count the request, apply the latency and maybe fail it. Returns False if failed.
+                """
+                with server.lock:
+                    server.stats[route] += 1
+                if server.settings.latency:
+                    time.sleep(server.settings.latency)
+                if route.startswith("/v1/") and server.settings.random.random() < server.settings.http_error_rate:
+                    self._send(503, {"detail": "Service temporarily unavailable (mock)"})
+                    return False
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                route = "/delivery" if url.path.startswith("/delivery/") else url.path
+                if route == "/_stats":
+                    with server.lock:
+                        return self._send(200, dict(server.stats))
+                if not self._begin(route):
+                    return
+                if route == "/delivery":
+                    return self._deliver()
+                if route == "/v1/get_result":
+                    return self._send(200, server._result(query.get("id", [""])[0]))
+                if route == "/v1/my_finetunes":
+                    return self._send(200, {"finetunes": server.finetune_ids})
+                if route == "/v1/finetune_details":
+                    finetune_id = query.get("finetune_id", [""])[0]
+                    training = server._training_progress(finetune_id)
+                    status = "Pending" if training is not None and training < 1 else "Ready"
+                    return self._send(200, {"finetune_details": {"finetune_comment": f"comment of {finetune_id}", "status": status}})
+                self._send(404, {"detail": "Not Found"})
+
+            def do_POST(self):
+                route = urlparse(self.path).path
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if not self._begin(route):
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    return self._send(422, {"detail": "Invalid JSON"})
+                if route == "/v1/delete_finetune":
+                    return self._send(200, {"message": "deleted"})
+                if route == "/v1/finetune":
+                    finetune_id = str(uuid.uuid4())
+                    with server.lock:
+                        server.finetune_ids.append(finetune_id)
+                        server.trainings[finetune_id] = time.monotonic()
+                    return self._send(200, {"id": finetune_id})
+                if route.startswith("/v1/flux-pro") or route.endswith("-finetuned"):
+                    if server.settings.max_active_tasks and server._active_tasks() >= server.settings.max_active_tasks:
+                        with server.lock:
+                            server.stats["rate_limited"] += 1
+                        return self._send(429, {"detail": "Too many active tasks (mock)"}, headers={"Retry-After": "1"})
+                    task_id = server._new_task(payload)
+                    return self._send(200, {"id": task_id, "polling_url": f"{server.url}/v1/get_result?id={task_id}"})
+                self._send(404, {"detail": "Not Found"})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--queue-time", type=float, default=0.5, help="seconds a task stays queued")
+    parser.add_argument("--generation-time", type=float, default=2.0, help="seconds from dequeue to Ready")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--moderation-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--download-cut-rate", type=float, default=0.0, help="fraction of image downloads cut off halfway")
+    parser.add_argument("--image-size", type=int, default=1024, help="side of the result images in pixels")
+    parser.add_argument("--training-time", type=float, default=60.0, help="seconds from a finetune submit to Ready")
+    parser.add_argument("--max-active-tasks", type=int, default=0, help="answer submits with a 429 above this many unfinished tasks")
+    args = parser.parse_args()
+    settings = MockSettings(
+        latency=args.latency,
+        queue_time=args.queue_time,
+        generation_time=args.generation_time,
+        error_rate=args.error_rate,
+        moderation_rate=args.moderation_rate,
+        http_error_rate=args.http_error_rate,
+        download_cut_rate=args.download_cut_rate,
+        image_size=args.image_size,
+        training_time=args.training_time,
+        max_active_tasks=args.max_active_tasks,
+    )
+    server = MockBFLServer(args.host, args.port, settings)
+    print(f"Mock BFL API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,135 @@
-import requests
-import base64
-from io import BytesIO
-from PIL import Image
-import json
-import socket
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
 import time
-import bfl_finetune
+import json
+from concurrent.futures import as_completed
+from typing import TYPE_CHECKING
+from http_client import api_url, get_async_client, get_session
+from downloads import submit_download
+from endpoints import Region, get_endpoint_registry, is_connect_error
+from image_prompt import encode_image_prompt
+from config import JOB_OWNER_TIMEOUT, JOB_RESUME_MAX_AGE, SCHEDULER_RATE_LIMIT_RETRIES
+from instrumentation import get_logger, log_event, metrics, span
+from job_registry import get_job_registry, key_fingerprint
+from output_store import get_output_store
+from poller import TaskFailedError, get_poller, normalize_progress
+from result_cache import cache_key, get_result_cache
+from scheduler import get_scheduler
+from single_flight import get_single_flight
+
+# requests, httpx, PIL and bfl_finetune are imported where they are used, so that
+# importing the client core (e.g. from a CLI) stays fast
+if TYPE_CHECKING:
+    from PIL import Image
 
-def get_model_endpoint(model_id: str) -> str:
+logger = get_logger("api")
+
+def get_model_endpoint(model_id: str, region: Region = None) -> str:
     """
-    Get the correct API endpoint for the given model
+    Get the correct API endpoint for the given model, in a region or on API_BASE_URL
     """
+    url = region.url if region is not None else api_url
     endpoints = {
-        "flux-pro": "https://api.us1.bfl.ai/v1/flux-pro",
-        "flux-pro-1.1": "https://api.us1.bfl.ai/v1/flux-pro-1.1",
-        "flux-pro-1.1-ultra": "https://api.us1.bfl.ai/v1/flux-pro-1.1-ultra",
-        "flux-pro-finetuned": "https://api.us1.bfl.ai/v1/flux-pro-finetuned"
+        "flux-pro": url("flux-pro"),
+        "flux-pro-1.1": url("flux-pro-1.1"),
+        "flux-pro-1.1-ultra": url("flux-pro-1.1-ultra"),
+        "flux-pro-finetuned": url("flux-pro-finetuned")
     }
-    return endpoints.get(model_id, "https://api.us1.bfl.ai/v1/flux-pro-1.1")  # Default to flux-pro-1.1 if model not found
+    return endpoints.get(model_id, url("flux-pro-1.1"))  # Default to flux-pro-1.1 if model not found
 
-def test_dns_resolution(hostname: str) -> bool:
+def poll_for_result(api_key: str, task_id: str, model_id: str = None, priority: str = "interactive", on_progress=None, polling_url: str = None) -> dict:
     """
-    Test if a hostname can be resolved
+    Wait for the result of a task, tracked by the shared background poller
+    polling_url is the one returned with the task, in the region that accepted it
     """
-    try:
-        socket.gethostbyname(hostname)
-        return True
-    except socket.gaierror:
-        return False
+    return get_poller().register(api_key, task_id, model_id=model_id, priority=priority, on_progress=on_progress, polling_url=polling_url).result()
 
-def poll_for_result(api_key: str, task_id: str, max_attempts: int = 30, delay: float = 2.0) -> dict:
+def download_image(url: str, task_id: str = None) -> "Image.Image":
     """
-    Poll the API for the result of a task
+    Download an image through download_image_file and return it as a PIL Image
+    Without a task_id, the file is named after the URL
     """
-    headers = {
-        "x-key": api_key.strip(),
-        "Accept": "application/json"
-    }
-    
-    polling_url = f"https://api.us1.bfl.ai/v1/get_result?id={task_id}"
-    
-    for attempt in range(max_attempts):
-        try:
-            response = requests.get(polling_url, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            
-            # Print debug information
-            print(f"Polling attempt {attempt + 1}/{max_attempts}")
-            print(f"Response status: {response.status_code}")
-            print(f"Response content: {result}")
-            
-            if result.get("status") == "Ready":
-                return result
-            elif result.get("status") in ["Error", "Request Moderated", "Content Moderated"]:
-                raise Exception(f"Task failed with status: {result.get('status')}")
-                
-            time.sleep(delay)
-            
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Polling request failed: {str(e)}")
-        except json.JSONDecodeError:
-            raise Exception("Failed to parse polling response")
-            
-    raise Exception("Max polling attempts reached")
+    return load_image(download_image_file(url, task_id or _url_name(url)))
 
-def download_image(url: str) -> Image.Image:
+def download_image_file(url: str, task_id: str) -> str:
     """
-    Download an image from a URL and return it as a PIL Image
+    Download an image to the output directory, keeping its original encoding. Runs on the
+    download pool with retries and Range resume, and blocks until done. Returns the file path.
     """
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return Image.open(BytesIO(response.content))
-    except Exception as e:
-        raise Exception(f"Failed to download image: {str(e)}")
+    with span("download"):
+        return submit_download(url, task_id).result()
 
-def generate_image(
-    api_key: str,
-    model_id: str,
+def load_image(path: str) -> "Image.Image":
+    """
+    Decode a downloaded image file, for callers that need the pixels
+    """
+    from PIL import Image
+
+    with span("decode"):
+        image = Image.open(path)
+        image.load()
+    return image
+
+async def apoll_for_result(api_key: str, task_id: str, model_id: str = None, priority: str = "interactive", on_progress=None, polling_url: str = None) -> dict:
+    """
+    Async counterpart of poll_for_result, awaiting the shared poller without holding a thread
+    on_progress is called on the caller's event loop
+    """
+    if on_progress is not None:
+        loop = asyncio.get_running_loop()
+        callback = on_progress
+        on_progress = lambda result: loop.call_soon_threadsafe(callback, result)
+    future = get_poller().register(api_key, task_id, model_id=model_id, priority=priority, on_progress=on_progress, polling_url=polling_url)
+    return await asyncio.wrap_future(future)
+
+async def adownload_image(url: str, task_id: str = None) -> "Image.Image":
+    """
+    Async counterpart of download_image
+    """
+    path = await adownload_image_file(url, task_id or _url_name(url))
+    return await asyncio.to_thread(load_image, path)
+
+async def adownload_image_file(url: str, task_id: str) -> str:
+    """
+    Async counterpart of download_image_file, awaiting the download pool
+    """
+    with span("download"):
+        return await asyncio.wrap_future(submit_download(url, task_id))
+
+def build_payload(
     prompt: str,
     width: int,
     height: int,
     steps: int,
     guidance_scale: float,
     seed: int = -1,
-    image_prompt: str = None,
+    image_prompt=None,
     finetune_id: str = None,
     finetune_strength: float = 1.0,
     use_raw_mode: bool = False,
     prompt_upsample: bool = True,
     interval: float = 2.0
-) -> list:
+) -> dict:
     """
-    Generate images using the BFL API
-    Returns a list of PIL Image objects
+    Build the JSON payload of a generation request (the model is part of the URL)
     """
-    headers = {
-        "x-key": api_key.strip(),  # Use x-key header as per API spec
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-
-    # Remove model from payload since it's in the URL
     payload = {
         "prompt": prompt,
         "width": width,
         "height": height,
         "steps": steps,
         "guidance_scale": guidance_scale,
-        "seed": seed if seed != -1 else None,
+        "seed": int(seed) if seed not in (None, -1) else None,
         "prompt_upsampling": prompt_upsample,
         "interval": interval
     }
 
+    image_prompt = encode_image_prompt(image_prompt)
     if image_prompt:
-        # Convert image to base64
-        buffered = BytesIO()
-        image_prompt.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        payload["image_prompt"] = img_str
+        payload["image_prompt"] = image_prompt
 
     if finetune_id:
         payload["finetune_id"] = finetune_id
@@ -128,69 +138,426 @@ def generate_image(
     if use_raw_mode:
         payload["raw"] = True  # Changed from raw_mode to raw as per API spec
 
+    return payload
+
+def _finetune_inference_kwargs(payload: dict, finetune_id: str, finetune_strength: float) -> dict:
+    """
+    Keyword arguments for bfl_finetune.finetune_inference from a generation payload
+    """
+    kwargs = {key: value for key, value in payload.items() if key not in ("image_prompt", "raw")}
+    kwargs["finetune_id"] = finetune_id
+    kwargs["finetune_strength"] = finetune_strength
+    kwargs["raw"] = payload.get("raw", False)
+    return kwargs
+
+def _result_image_url(result: dict) -> str:
+    if "result" in result and "sample" in result["result"]:
+        return result["result"]["sample"]
+    log_event(logger, logging.WARNING, "No image URL found in result", result=result)
+    return None
+
+def _url_name(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+def _job_params(payload: dict) -> dict:
+    # The encoded image prompt is too large to be kept as metadata
+    return {key: value for key, value in payload.items() if key != "image_prompt"}
+
+def _cache_metadata(model_id: str, payload: dict, result: dict) -> dict:
+    return {"model_id": model_id, "params": _job_params(payload), "result": result}
+
+def _archive(task_id: str, model_id: str, params: dict, local_path: str, result: dict = None):
+    # The history archive is best effort: it must never fail a generation
+    reported = result.get("result") if isinstance(result, dict) else None
+    if params.get("seed") is None and isinstance(reported, dict) and reported.get("seed") is not None:
+        # Random seed: keep the one the API picked, so the image can be reproduced
+        params = {**params, "seed": reported["seed"]}
     try:
-        # Special handling for finetuned model
-        if model_id == "flux-pro-finetuned":
-            # Use bfl_finetune.finetune_inference for correct endpoint and polling
-            resp = bfl_finetune.finetune_inference(
-                finetune_id=finetune_id,
-                finetune_strength=finetune_strength,
-                api_key=api_key,
-                prompt=prompt,
-                width=width,
-                height=height,
-                steps=steps,
-                guidance_scale=guidance_scale,
-                seed=seed if seed != -1 else None,
-                prompt_upsampling=prompt_upsample,
-                interval=interval,
-                raw=use_raw_mode
-            )
-            # The rest of the logic expects a task/result structure
-            task_id = resp.get("id")
-            if not task_id:
-                raise Exception("No task ID received from API (finetuned)")
-            result = poll_for_result(api_key, task_id)
-            if "result" in result and "sample" in result["result"]:
-                image_url = result["result"]["sample"]
-                print(f"Downloading image from: {image_url}")
-                image = download_image(image_url)
-                return [image]
-            else:
-                print("No image URL found in result (finetuned)")
-                print(f"Full result: {result}")
-                return []
-        # Default: base model logic
-        endpoint = get_model_endpoint(model_id)
-        hostname = endpoint.split("//")[1].split("/")[0]
-        # Test DNS resolution
-        if not test_dns_resolution(hostname):
-            raise Exception(f"Could not resolve hostname: {hostname}. Please check your internet connection and DNS settings.")
-        print(f"Making request to: {endpoint}")
-        print(f"Headers: {headers}")
-        print(f"Payload: {payload}")
-        response = requests.post(endpoint, headers=headers, json=payload)
-        print(f"Response status: {response.status_code}")
-        print(f"Response headers: {response.headers}")
-        print(f"Response content: {response.text}")
-        response.raise_for_status()
-        task_response = response.json()
-        task_id = task_response.get("id")
-        if not task_id:
-            raise Exception("No task ID received from API")
-        result = poll_for_result(api_key, task_id)
-        if "result" in result and "sample" in result["result"]:
-            image_url = result["result"]["sample"]
-            print(f"Downloading image from: {image_url}")
-            image = download_image(image_url)
-            return [image]
+        get_output_store().add(local_path, task_id, model_id, params)
+    except Exception as e:
+        log_event(logger, logging.WARNING, "Could not archive the result", task_id=task_id, error=str(e))
+
+def _record_failure(task_id: str, error: Exception):
+    status = error.status if isinstance(error, TaskFailedError) else "Failed"
+    metrics.increment("tasks.failed")
+    log_event(logger, logging.WARNING, "Task failed", task_id=task_id, status=status, error=str(error))
+    get_job_registry().update_job(task_id, status=status, error=str(error))
+
+_resumed_keys = {}  # key fingerprint -> time of the last resume
+_resumed_keys_lock = threading.Lock()
+
+def resume_pending_jobs(api_key: str) -> int:
+    """
+    Resume tracking the unfinished generations submitted with this API key by a process that
+    stopped (checked at most once per JOB_OWNER_TIMEOUT per key, so jobs of a crashed web
+    worker are picked up by the others). Results are saved to the output directory and
+    recorded in the job registry. Returns the number of resumed jobs.
+    """
+    if not api_key or not api_key.strip():
+        return 0
+    fingerprint = key_fingerprint(api_key)
+    with _resumed_keys_lock:
+        if time.time() - _resumed_keys.get(fingerprint, 0) < JOB_OWNER_TIMEOUT:
+            return 0
+        _resumed_keys[fingerprint] = time.time()
+    registry = get_job_registry()
+    registry.expire_stale(JOB_RESUME_MAX_AGE)
+    # Only jobs no running process tracks: other web workers keep their own
+    jobs = registry.claim_unfinished("generation", api_key=api_key)
+    if jobs:
+        threading.Thread(target=_complete_resumed_jobs, args=(api_key, jobs), name="job-resume", daemon=True).start()
+    return len(jobs)
+
+def _complete_resumed_jobs(api_key: str, jobs: list):
+    registry = get_job_registry()
+    futures = {get_poller().register(api_key, job["id"], model_id=job["model_id"], polling_url=job["polling_url"]): job for job in jobs}
+    for future in as_completed(futures):
+        task_id = futures[future]["id"]
+        try:
+            image_url = _result_image_url(future.result())
+            if not image_url:
+                raise Exception("No image URL found in result")
+            local_path = download_image_file(image_url, task_id)
+        except Exception as e:
+            _record_failure(task_id, e)
+            continue
+        _archive(task_id, futures[future]["model_id"], futures[future]["params"], local_path, future.result())
+        registry.update_job(task_id, status="Ready", result_url=image_url, local_path=local_path)
+
+# Stages reported to on_status callbacks, in order
+GENERATION_STAGES = ("waiting", "submitting", "queued", "generating", "downloading", "done")
+
+def _notify(on_status, stage: str, progress: float = None):
+    if on_status is None:
+        return
+    try:
+        on_status(stage, progress)
+    except Exception:
+        # A broken status consumer must not fail the generation
+        log_event(logger, logging.DEBUG, "Status callback failed", stage=stage)
+
+def _progress_callback(on_status):
+    """
+    Poller on_progress callback forwarding the task's progress as a status update
+    """
+    if on_status is None:
+        return None
+
+    def on_progress(result: dict):
+        progress = normalize_progress(result.get("progress"))
+        _notify(on_status, "generating" if progress is not None else "queued", progress)
+
+    return on_progress
+
+def _loop_callback(callback):
+    """
+    callback, called on the running event loop whichever thread invokes it
+    """
+    loop = asyncio.get_running_loop()
+    loop_thread = threading.get_ident()
+
+    def call(*args):
+        if threading.get_ident() == loop_thread:
+            callback(*args)
         else:
-            print("No image URL found in result")
-            print(f"Full result: {result}")
-            return []
+            loop.call_soon_threadsafe(callback, *args)
+
+    return call
+
+def _rate_limited_response(error: Exception):
+    """
+    The 429 response behind a request error, or None
+    """
+    response = getattr(error, "response", None)
+    return response if response is not None and response.status_code == 429 else None
+
+def _retry_after(response) -> float:
+    retry_after = response.headers.get("Retry-After")
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+def _submit_once(session, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float) -> tuple:
+    import bfl_finetune
+
+    # Special handling for finetuned model
+    if model_id == "flux-pro-finetuned":
+        # Use bfl_finetune.finetune_inference for correct endpoint and polling
+        with span("submit"):
+            resp = bfl_finetune.finetune_inference(api_key=api_key, **_finetune_inference_kwargs(payload, finetune_id, finetune_strength))
+        metrics.increment("requests.submit")
+        # The rest of the logic expects a task/result structure
+        task_id = resp.get("id")
+        if not task_id:
+            raise Exception("No task ID received from API (finetuned)")
+        return task_id, resp.get("polling_url")
+    # Default: base model logic, on the fastest healthy region
+    registry = get_endpoint_registry()
+    regions = registry.submit_order()
+    for index, region in enumerate(regions):
+        endpoint = get_model_endpoint(model_id, region)
+        log_event(logger, logging.DEBUG, "Submitting task", endpoint=endpoint, payload=payload)
+        try:
+            with span("submit"):
+                response = session.post(endpoint, json=payload)
+        except Exception as e:
+            # Nothing reached the region: the submit can go to the next one without paying twice
+            if not is_connect_error(e) or index == len(regions) - 1:
+                raise
+            registry.report_failure(region, e)
+            continue
+        break
+    metrics.increment("requests.submit")
+    log_event(logger, logging.DEBUG, "Submit response", status=response.status_code, body=response.text)
+    response.raise_for_status()
+    task_response = response.json()
+    task_id = task_response.get("id")
+    if not task_id:
+        raise Exception("No task ID received from API")
+    # Results are polled in the region that accepted the task
+    return task_id, task_response.get("polling_url") or f"{region.url('get_result')}?id={task_id}"
+
+def _submit(session, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float) -> tuple:
+    """
+    Submit a generation task at the pace allowed by the scheduler, returns its ID and polling URL
+    A 429 pauses every submit of the API key for Retry-After seconds, then the submit is retried
+    """
+    import requests
+
+    scheduler = get_scheduler()
+    for attempt in range(SCHEDULER_RATE_LIMIT_RETRIES + 1):
+        scheduler.throttle(api_key)
+        try:
+            return _submit_once(session, api_key, model_id, payload, finetune_id, finetune_strength)
+        except requests.exceptions.RequestException as e:
+            response = _rate_limited_response(e)
+            if response is None or attempt == SCHEDULER_RATE_LIMIT_RETRIES:
+                raise
+            scheduler.rate_limited(api_key, _retry_after(response))
+
+async def _asubmit_once(client, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float) -> tuple:
+    import bfl_finetune
+
+    if model_id == "flux-pro-finetuned":
+        with span("submit"):
+            resp = await bfl_finetune.afinetune_inference(api_key=api_key, **_finetune_inference_kwargs(payload, finetune_id, finetune_strength))
+        metrics.increment("requests.submit")
+        task_id = resp.get("id")
+        if not task_id:
+            raise Exception("No task ID received from API (finetuned)")
+        return task_id, resp.get("polling_url")
+    registry = get_endpoint_registry()
+    regions = registry.submit_order()
+    for index, region in enumerate(regions):
+        endpoint = get_model_endpoint(model_id, region)
+        log_event(logger, logging.DEBUG, "Submitting task", endpoint=endpoint, payload=payload)
+        try:
+            with span("submit"):
+                response = await client.post(endpoint, json=payload)
+        except Exception as e:
+            if not is_connect_error(e) or index == len(regions) - 1:
+                raise
+            registry.report_failure(region, e)
+            continue
+        break
+    metrics.increment("requests.submit")
+    log_event(logger, logging.DEBUG, "Submit response", status=response.status_code, body=response.text)
+    response.raise_for_status()
+    task_response = response.json()
+    task_id = task_response.get("id")
+    if not task_id:
+        raise Exception("No task ID received from API")
+    return task_id, task_response.get("polling_url") or f"{region.url('get_result')}?id={task_id}"
+
+async def _asubmit(client, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float) -> tuple:
+    """
+    Async counterpart of _submit
+    """
+    import httpx
+    import requests
+
+    scheduler = get_scheduler()
+    for attempt in range(SCHEDULER_RATE_LIMIT_RETRIES + 1):
+        await scheduler.athrottle(api_key)
+        try:
+            return await _asubmit_once(client, api_key, model_id, payload, finetune_id, finetune_strength)
+        except (httpx.HTTPStatusError, requests.exceptions.RequestException) as e:
+            response = _rate_limited_response(e)
+            if response is None or attempt == SCHEDULER_RATE_LIMIT_RETRIES:
+                raise
+            scheduler.rate_limited(api_key, _retry_after(response))
+
+def generate_image(
+    api_key: str,
+    model_id: str,
+    prompt: str,
+    width: int,
+    height: int,
+    steps: int,
+    guidance_scale: float,
+    seed: int = -1,
+    image_prompt: str = None,
+    finetune_id: str = None,
+    finetune_strength: float = 1.0,
+    use_raw_mode: bool = False,
+    prompt_upsample: bool = True,
+    interval: float = 2.0,
+    priority: str = "interactive",
+    use_cache: bool = True,
+    queue_group=None,
+    on_status=None
+) -> list:
+    """
+    Generate images using the BFL API
+    Fixed-seed results are served from the local result cache unless use_cache is False
+    (the fresh result is stored either way); identical fixed-seed generations requested while
+    one is in flight wait for its result instead of submitting their own task, use_cache or not
+    The generation waits for a slot of the API key's scheduler (see scheduler.py): interactive
+    jobs go first, and jobs sharing a queue_group are interleaved fairly with other groups
+    on_status(stage, progress) is called as the generation moves through GENERATION_STAGES
+    ("waiting" for a local slot, "submitting", "queued" by the API, "generating" with a
+    progress fraction when the API reports one, "downloading", "done"), from the poller
+    thread for the polling stages
+    Returns a list of local image file paths, in their original encoding (see load_image)
+    """
+    # The pooled session already carries the x-key and Accept headers
+    session = get_session(api_key)
+    resume_pending_jobs(api_key)
+    payload = build_payload(
+        prompt, width, height, steps, guidance_scale, seed, image_prompt,
+        finetune_id, finetune_strength, use_raw_mode, prompt_upsample, interval
+    )
+    key = cache_key(model_id, payload)
+    if key:
+        if use_cache:
+            cached = get_result_cache().get(key)
+            if cached:
+                _notify(on_status, "done", 1.0)
+                return [cached[1]]
+        # Identical fixed-seed generations of the key already in flight share their task (see
+        # single_flight.py), with or without use_cache: it only skips stored results. Per key,
+        # so that a failure of one key never fails another's request
+        generate = functools.partial(_generate, session, api_key, model_id, payload, finetune_id, finetune_strength, key, priority, queue_group)
+        return list(get_single_flight().do(("generation", key_fingerprint(api_key), key), generate, on_status))
+    return _generate(session, api_key, model_id, payload, finetune_id, finetune_strength, key, priority, queue_group, on_status)
+
+def _generate(session, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float, key: str, priority: str, queue_group, on_status) -> list:
+    import requests
+
+    try:
+        _notify(on_status, "waiting")
+        with get_scheduler().slot(api_key, priority, queue_group):
+            _notify(on_status, "submitting")
+            task_id, polling_url = _submit(session, api_key, model_id, payload, finetune_id, finetune_strength)
+            get_job_registry().record_job(task_id, "generation", api_key, model_id, _job_params(payload), polling_url=polling_url)
+            _notify(on_status, "queued")
+            try:
+                result = poll_for_result(api_key, task_id, model_id=model_id, priority=priority, on_progress=_progress_callback(on_status), polling_url=polling_url)
+                image_url = _result_image_url(result)
+                if not image_url:
+                    get_job_registry().update_job(task_id, status="Failed", error="No image URL found in result")
+                    return []
+                log_event(logger, logging.DEBUG, "Downloading image", task_id=task_id)
+                _notify(on_status, "downloading", 1.0)
+                local_path = download_image_file(image_url, task_id)
+                if key:
+                    get_result_cache().put(key, _cache_metadata(model_id, payload, result), local_path)
+                _archive(task_id, model_id, _job_params(payload), local_path, result)
+            except Exception as e:
+                _record_failure(task_id, e)
+                raise
+        get_job_registry().update_job(task_id, status="Ready", result_url=image_url, local_path=local_path)
+        _notify(on_status, "done", 1.0)
+        return [local_path]
     except requests.exceptions.RequestException as e:
         raise Exception(f"API request failed: {str(e)}")
     except json.JSONDecodeError:
         raise Exception("Failed to parse API response")
     except Exception as e:
-        raise Exception(f"Image generation failed: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Image generation failed: {str(e)}")
+
+async def agenerate_image(
+    api_key: str,
+    model_id: str,
+    prompt: str,
+    width: int,
+    height: int,
+    steps: int,
+    guidance_scale: float,
+    seed: int = -1,
+    image_prompt: str = None,
+    finetune_id: str = None,
+    finetune_strength: float = 1.0,
+    use_raw_mode: bool = False,
+    prompt_upsample: bool = True,
+    interval: float = 2.0,
+    priority: str = "interactive",
+    use_cache: bool = True,
+    queue_group=None,
+    on_status=None
+) -> list:
+    """
+    Async counterpart of generate_image: submit, poll and download without blocking a thread
+    on_status is always called on the caller's event loop, also when an identical generation
+    in flight from another thread or loop is shared
+    Fixed-seed results are served from the local result cache unless use_cache is False
+    (the fresh result is stored either way)
+    Returns a list of local image file paths, in their original encoding (see load_image)
+    """
+    client = get_async_client(api_key)
+    resume_pending_jobs(api_key)
+    # Encode the image prompt off the event loop (a no-op when already cached)
+    image_prompt = await asyncio.to_thread(encode_image_prompt, image_prompt)
+    payload = build_payload(
+        prompt, width, height, steps, guidance_scale, seed, image_prompt,
+        finetune_id, finetune_strength, use_raw_mode, prompt_upsample, interval
+    )
+    key = cache_key(model_id, payload)
+    if key:
+        if use_cache:
+            cached = await asyncio.to_thread(get_result_cache().get, key)
+            if cached:
+                _notify(on_status, "done", 1.0)
+                return [cached[1]]
+        generate = functools.partial(_agenerate, client, api_key, model_id, payload, finetune_id, finetune_strength, key, priority, queue_group)
+        # A flight led from another thread or event loop notifies from there
+        flight_status = _loop_callback(on_status) if on_status is not None else None
+        return list(await get_single_flight().ado(("generation", key_fingerprint(api_key), key), generate, flight_status))
+    return await _agenerate(client, api_key, model_id, payload, finetune_id, finetune_strength, key, priority, queue_group, on_status)
+
+async def _agenerate(client, api_key: str, model_id: str, payload: dict, finetune_id: str, finetune_strength: float, key: str, priority: str, queue_group, on_status) -> list:
+    import httpx
+    import requests
+
+    try:
+        _notify(on_status, "waiting")
+        async with get_scheduler().aslot(api_key, priority, queue_group):
+            _notify(on_status, "submitting")
+            task_id, polling_url = await _asubmit(client, api_key, model_id, payload, finetune_id, finetune_strength)
+            get_job_registry().record_job(task_id, "generation", api_key, model_id, _job_params(payload), polling_url=polling_url)
+            _notify(on_status, "queued")
+            try:
+                result = await apoll_for_result(api_key, task_id, model_id=model_id, priority=priority, on_progress=_progress_callback(on_status), polling_url=polling_url)
+                image_url = _result_image_url(result)
+                if not image_url:
+                    get_job_registry().update_job(task_id, status="Failed", error="No image URL found in result")
+                    return []
+                log_event(logger, logging.DEBUG, "Downloading image", task_id=task_id)
+                _notify(on_status, "downloading", 1.0)
+                local_path = await adownload_image_file(image_url, task_id)
+                if key:
+                    await asyncio.to_thread(get_result_cache().put, key, _cache_metadata(model_id, payload, result), local_path)
+                await asyncio.to_thread(_archive, task_id, model_id, _job_params(payload), local_path, result)
+            except Exception as e:
+                _record_failure(task_id, e)
+                raise
+        get_job_registry().update_job(task_id, status="Ready", result_url=image_url, local_path=local_path)
+        _notify(on_status, "done", 1.0)
+        return [local_path]
+    except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+        raise Exception(f"API request failed: {str(e)}")
+    except json.JSONDecodeError:
+        raise Exception("Failed to parse API response")
+    except Exception as e:
+        raise Exception(f"Image generation failed: {str(e)}")
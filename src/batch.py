@@ -0,0 +1,65 @@
+"""
+Batch generation: fan one click out into several generation jobs (seed sweep
+and/or one prompt per line) and run them concurrently under a concurrency cap.
+"""
+import asyncio
+import functools
+import uuid
+
+from api_utils import agenerate_image
+from image_prompt import encode_image_prompt
+from config import BATCH_CONCURRENCY, MAX_SEED
+
+
+def expand_jobs(prompt: str, seed: int = -1, count: int = 1, split_lines: bool = False) -> list:
+    """
+    Expand a prompt into a list of jobs ({"prompt", "seed"} dicts).
+    With split_lines, every non-empty line is its own prompt. Each prompt gets `count`
+    variants: random seeds if seed is -1, otherwise a sweep seed, seed + 1, ...
+    """
+    if split_lines:
+        prompts = [line.strip() for line in prompt.splitlines() if line.strip()]
+    else:
+        prompts = [prompt]
+    seed = -1 if seed is None else int(seed)
+    jobs = []
+    for job_prompt in prompts:
+        for i in range(int(count)):
+            job_seed = -1 if seed == -1 else (seed + i) % (MAX_SEED + 1)
+            jobs.append({"prompt": job_prompt, "seed": job_seed})
+    return jobs
+
+
+async def agenerate_batch(jobs: list, concurrency: int = BATCH_CONCURRENCY, on_status=None, **params):
+    """
+    Run every job through agenerate_image with at most `concurrency` tasks in flight.
+    `params` are the generation settings shared by all jobs.
+    Yields (index, job, images, error) tuples in completion order; a failed job yields
+    its exception instead of aborting the rest of the batch.
+    on_status(index, stage, progress) relays the status updates of every job.
+    """
+    # A single job is an interactive generation, anything larger is bulk work
+    params.setdefault("priority", "interactive" if len(jobs) == 1 else "batch")
+    # The jobs of one batch share a queue group, interleaved fairly with other users' work
+    params.setdefault("queue_group", uuid.uuid4().hex)
+    # Encode the shared image prompt once for the whole batch
+    if params.get("image_prompt") is not None:
+        params["image_prompt"] = await asyncio.to_thread(encode_image_prompt, params["image_prompt"])
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def run(index, job):
+        async with semaphore:
+            try:
+                job_status = functools.partial(on_status, index) if on_status is not None else None
+                return index, job, await agenerate_image(**params, **job, on_status=job_status), None
+            except Exception as e:
+                return index, job, [], e
+
+    tasks = [asyncio.create_task(run(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer went away (e.g. the Gradio event was cancelled): stop pending jobs
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,233 @@
+"""
+Headless batch generation from a JSONL or CSV file of jobs.
+
+Each job is one JSON object (or CSV row) with a `prompt` and optionally `id`,
+`model` (display name or model ID), `width`, `height`, `steps`,
+`guidance_scale`, `seed`, `finetune_id`, `finetune_strength`, `raw`,
+`prompt_upsampling`, `interval` and `image_prompt` (path to an image).
+
+Jobs run concurrently through the same scheduler, poller and result cache as
+the GUI. Every finished job is appended to `manifest.jsonl` in the output
+directory as soon as it completes; the manifest doubles as the checkpoint, so
+running the same command again skips the jobs already rendered.
+
+Usage:
+    export BFL_API_KEY=<your api key>
+    python batch_cli.py render jobs.jsonl --output_dir=renders --concurrency=8
+"""
+import csv
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+# asyncio, api_utils and batch are imported by the commands that run jobs, so that
+# --help and the job file helpers start without them
+from config import AVAILABLE_MODELS, BATCH_CONCURRENCY
+from instrumentation import configure_logging
+
+MANIFEST_NAME = "manifest.jsonl"
+# Job fields, with their type and default value
+JOB_FIELDS = {
+    "prompt": (str, ""),
+    "model": (str, "flux-pro-1.1"),
+    "width": (int, 1024),
+    "height": (int, 1024),
+    "steps": (int, 40),
+    "guidance_scale": (float, 2.5),
+    "seed": (int, -1),
+    "finetune_id": (str, None),
+    "finetune_strength": (float, 1.0),
+    "raw": (bool, False),
+    "prompt_upsampling": (bool, True),
+    "interval": (float, 2.0),
+    "image_prompt": (str, None),
+}
+
+
+def _parse_value(kind, value):
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return kind(value)
+
+
+def _output_name(job_id: str) -> str:
+    """
+    File name (without extension) of a job's image in the output directory
+    """
+    return re.sub(r"[^\w.-]", "_", job_id)
+
+
+def load_jobs(jobs_path: str) -> list:
+    """
+    Read and validate the jobs of a .jsonl or .csv file, filling in defaults.
+    Jobs without an `id` are numbered after their position in the file.
+    Raises ValueError for ids that would share an output file name.
+    """
+    with open(jobs_path, "r", encoding="utf-8", newline="") as f:
+        if jobs_path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    model_ids = set(AVAILABLE_MODELS.values())
+    jobs = []
+    seen_names = {}
+    for position, row in enumerate(rows):
+        job = {"id": str(row.get("id") or position)}
+        for field, (kind, default) in JOB_FIELDS.items():
+            value = row.get(field)
+            job[field] = default if value in (None, "") else _parse_value(kind, value)
+        if not job["prompt"].strip():
+            raise ValueError(f"Job {job['id']} has no prompt")
+        job["model"] = AVAILABLE_MODELS.get(job["model"], job["model"])
+        if job["model"] not in model_ids:
+            raise ValueError(f"Job {job['id']} has an unknown model: {job['model']}")
+        if job["model"] == "flux-pro-finetuned" and not job["finetune_id"]:
+            raise ValueError(f"Job {job['id']} uses a finetuned model without a finetune_id")
+        # Compared case-insensitively: "A" and "a" are one file on macOS and Windows
+        name = _output_name(job["id"]).lower()
+        if name in seen_names:
+            if seen_names[name] == job["id"]:
+                raise ValueError(f"Duplicate job id: {job['id']}")
+            raise ValueError(f"Job ids {seen_names[name]} and {job['id']} map to the same output file name")
+        seen_names[name] = job["id"]
+        jobs.append(job)
+    return jobs
+
+
+def load_manifest(output_dir: str) -> dict:
+    """
+    Latest manifest record of every job already processed, by job ID
+    """
+    records = {}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line cut short by a crash
+                    continue
+                records[record["id"]] = record
+    return records
+
+
+def _output_file(output_dir: str, job_id: str, image_path: str) -> str:
+    path = os.path.join(output_dir, f"{_output_name(job_id)}{os.path.splitext(image_path)[1]}")
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        # Results already live in the output or cache directory: link rather than copy
+        os.link(image_path, path)
+    except OSError:
+        shutil.copyfile(image_path, path)
+    return path
+
+
+def _generation_kwargs(job: dict) -> dict:
+    return {
+        "model_id": job["model"],
+        "prompt": job["prompt"],
+        "width": job["width"],
+        "height": job["height"],
+        "steps": job["steps"],
+        "guidance_scale": job["guidance_scale"],
+        "seed": job["seed"],
+        "image_prompt": job["image_prompt"],
+        "finetune_id": job["finetune_id"],
+        "finetune_strength": job["finetune_strength"],
+        "use_raw_mode": job["raw"],
+        "prompt_upsample": job["prompt_upsampling"],
+        "interval": job["interval"],
+    }
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+async def arender(jobs: list, output_dir: str, api_key: str, concurrency: int = BATCH_CONCURRENCY, use_cache: bool = True, report_every: float = 5.0) -> dict:
+    """
+    Render jobs that have no successful manifest record yet, appending to the manifest
+    as each one finishes. Returns a summary of the run.
+    """
+    from batch import agenerate_batch
+
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_manifest(output_dir)
+    pending = [job for job in jobs if done.get(job["id"], {}).get("status") != "ok"]
+    summary = {"total": len(jobs), "skipped": len(jobs) - len(pending), "ok": 0, "failed": 0}
+    if not pending:
+        return summary
+
+    start = time.monotonic()
+    last_report = start
+    with open(os.path.join(output_dir, MANIFEST_NAME), "a", encoding="utf-8") as manifest:
+        async for index, job, images, error in agenerate_batch(
+            [_generation_kwargs(job) for job in pending],
+            concurrency=concurrency,
+            api_key=api_key,
+            use_cache=use_cache,
+            priority="batch",
+        ):
+            job = pending[index]
+            record = {"id": job["id"], "finished_at": time.time(), "job": job}
+            if error is None and images:
+                record["status"] = "ok"
+                record["files"] = [_output_file(output_dir, job["id"], image) for image in images]
+                summary["ok"] += 1
+            else:
+                record["status"] = "failed"
+                record["error"] = str(error) if error is not None else "No image returned"
+                summary["failed"] += 1
+            # One line per job, flushed to disk right away: the manifest is the checkpoint
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+
+            now = time.monotonic()
+            finished = summary["ok"] + summary["failed"]
+            if now - last_report >= report_every or finished == len(pending):
+                last_report = now
+                rate = finished / (now - start)
+                eta = (len(pending) - finished) / rate if rate else 0
+                print(
+                    f"[{finished}/{len(pending)}] {summary['ok']} ok, {summary['failed']} failed, "
+                    f"{rate * 60:.1f} images/min, elapsed {_format_duration(now - start)}, ETA {_format_duration(eta)}",
+                    file=sys.stderr,
+                    flush=True,
+                )
+    summary["seconds"] = round(time.monotonic() - start, 1)
+    return summary
+
+
+def render(jobs_path: str, output_dir: str = "renders", concurrency: int = BATCH_CONCURRENCY, api_key: str = None, use_cache: bool = True, dry_run: bool = False):
+    """
+    Render every job of a .jsonl or .csv file into output_dir. Safe to interrupt and
+    run again: jobs recorded as done in the manifest are skipped.
+    """
+    import asyncio
+
+    from api_utils import build_payload
+
+    api_key = api_key or os.environ.get("BFL_API_KEY")
+    if not api_key:
+        raise ValueError("Provide your API key via --api_key or an environment variable BFL_API_KEY")
+    configure_logging()
+    jobs = load_jobs(jobs_path)
+    if dry_run:
+        # Validate the jobs (and image prompts) without calling the API
+        for job in jobs:
+            build_payload(**{key: value for key, value in _generation_kwargs(job).items() if key != "model_id"})
+        done = load_manifest(output_dir)
+        return {"total": len(jobs), "pending": sum(1 for job in jobs if done.get(job["id"], {}).get("status") != "ok")}
+    return asyncio.run(arender(jobs, output_dir, api_key, concurrency=concurrency, use_cache=use_cache))
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(cli.module_commands(globals()), __doc__)
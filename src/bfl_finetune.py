@@ -37,46 +37,43 @@ progress: null
 """
 
 import os
-import base64
-import requests
+# requests is imported where it is used: listing the CLI's commands never loads it
+from http_client import api_url, get_async_client, get_session
+from job_registry import get_job_registry, key_fingerprint
+from single_flight import get_single_flight
+from streaming_upload import Base64JsonBody
 
-def request_finetuning(
-    zip_path,
-    finetune_comment,
-    trigger_word="TOK",
-    mode="general",
-    api_key=None,
-    iterations=300,
-    learning_rate=0.00001,
-    captioning=True,
-    priority="quality",
-    finetune_type="full",
-    lora_rank=32,
-):
+def _resolve_api_key(api_key=None):
     if api_key is None:
         if "BFL_API_KEY" not in os.environ:
             raise ValueError(
                 "Provide your API key via --api_key or an environment variable BFL_API_KEY"
             )
         api_key = os.environ["BFL_API_KEY"]
+    return api_key
 
+def _finetuning_body(
+    zip_path,
+    finetune_comment,
+    trigger_word,
+    mode,
+    iterations,
+    learning_rate,
+    captioning,
+    priority,
+    finetune_type,
+    lora_rank,
+):
     if not os.path.exists(zip_path):
         raise FileNotFoundError(f"ZIP file not found at {zip_path}")
 
     assert mode in ["character", "product", "style", "general"]
 
-    with open(zip_path, "rb") as file:
-        encoded_zip = base64.b64encode(file.read()).decode("utf-8")
-
-    url = "https://api.us1.bfl.ai/v1/finetune"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
-    payload = {
+    # The ZIP is base64-encoded chunk by chunk while the request is sent, instead of
+    # holding the whole encoded archive (several times its size) in memory
+    fields = {
         "finetune_comment": finetune_comment,
         "trigger_word": trigger_word,
-        "file_data": encoded_zip,
         "iterations": iterations,
         "mode": mode,
         "learning_rate": learning_rate,
@@ -85,11 +82,40 @@ def request_finetuning(
         "lora_rank": lora_rank,
         "finetune_type": finetune_type,
     }
+    return Base64JsonBody(zip_path, fields, file_field="file_data")
+
+def _record_finetune(resp, api_key, fields):
+    # Keep track of the submitted finetune in the local job registry
+    if isinstance(resp, dict) and resp.get("id"):
+        get_job_registry().record_job(resp["id"], "finetune", api_key, params=fields)
+    return resp
+
+def request_finetuning(
+    zip_path,
+    finetune_comment,
+    trigger_word="TOK",
+    mode="general",
+    api_key=None,
+    iterations=300,
+    learning_rate=0.00001,
+    captioning=True,
+    priority="quality",
+    finetune_type="full",
+    lora_rank=32,
+):
+    import requests
 
-    response = requests.post(url, headers=headers, json=payload)
+    api_key = _resolve_api_key(api_key)
+    url = api_url("finetune")
+    body = _finetuning_body(
+        zip_path, finetune_comment, trigger_word, mode, iterations,
+        learning_rate, captioning, priority, finetune_type, lora_rank,
+    )
+
+    response = get_session(api_key).post(url, data=body, headers=body.headers)
     try:
         response.raise_for_status()
-        return response.json()
+        return _record_finetune(response.json(), api_key, body.fields)
     except requests.exceptions.RequestException as e:
         raise requests.exceptions.RequestException(
             f"Finetune request failed:\n{str(e)}\n{response.content.decode()}"
@@ -99,46 +125,37 @@ def finetune_progress(
     finetune_id,
     api_key=None,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
-    url = "https://api.us1.bfl.ai/v1/get_result"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    import requests
+
+    api_key = _resolve_api_key(api_key)
+    url = api_url("get_result")
     payload = {
         "id": finetune_id,
     }
 
-    response = requests.get(url, headers=headers, params=payload)
+    response = get_session(api_key).get(url, params=payload)
     try:
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise requests.exceptions.RequestException(
-            f"Finetune progress failed:\n{str(e)}\n{response.content.decode()}"
+            f"Finetune progress failed:\n{str(e)}\n{response.content.decode()}",
+            response=response,
         )
 
 def finetune_list(
     api_key=None,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
-    url = "https://api.us1.bfl.ai/v1/my_finetunes"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    api_key = _resolve_api_key(api_key)
+    # Concurrent identical calls share one request (see single_flight.py)
+    return get_single_flight().do(("finetune_list", key_fingerprint(api_key)), lambda notify: _finetune_list(api_key))
 
-    response = requests.get(url, headers=headers)
+def _finetune_list(api_key):
+    import requests
+
+    url = api_url("my_finetunes")
+
+    response = get_session(api_key).get(url)
     try:
         response.raise_for_status()
         return response.json()
@@ -151,22 +168,21 @@ def finetune_details(
     finetune_id,
     api_key=None,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
-    url = "https://api.us1.bfl.ai/v1/finetune_details"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    api_key = _resolve_api_key(api_key)
+    return get_single_flight().do(
+        ("finetune_details", key_fingerprint(api_key), finetune_id),
+        lambda notify: _finetune_details(finetune_id, api_key),
+    )
+
+def _finetune_details(finetune_id, api_key):
+    import requests
+
+    url = api_url("finetune_details")
     payload = {
         "finetune_id": finetune_id,
     }
 
-    response = requests.get(url, headers=headers, params=payload)
+    response = get_session(api_key).get(url, params=payload)
     try:
         response.raise_for_status()
         return response.json()
@@ -179,23 +195,16 @@ def finetune_delete(
     finetune_id,
     api_key=None,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
+    import requests
 
-    url = "https://api.us1.bfl.ai/v1/delete_finetune"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    api_key = _resolve_api_key(api_key)
+
+    url = api_url("delete_finetune")
     payload = {
         "finetune_id": finetune_id,
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = get_session(api_key).post(url, json=payload)
     try:
         response.raise_for_status()
         return response.json()
@@ -211,53 +220,40 @@ def finetune_inference(
     api_key=None,
     **kwargs,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
+    import requests
 
-    url = f"https://api.us1.bfl.ai/v1/{endpoint}"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    api_key = _resolve_api_key(api_key)
+
+    url = api_url(endpoint)
     payload = {
         "finetune_id": finetune_id,
         "finetune_strength": finetune_strength,
         **kwargs,
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = get_session(api_key).post(url, json=payload)
     try:
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise requests.exceptions.RequestException(
-            f"Finetune inference failed:\n{str(e)}\n{response.content.decode()}"
+            f"Finetune inference failed:\n{str(e)}\n{response.content.decode()}",
+            response=response,
         )
 
 def get_inference(
     id,
     api_key=None,
 ):
-    if api_key is None:
-        if "BFL_API_KEY" not in os.environ:
-            raise ValueError(
-                "Provide your API key via --api_key or an environment variable BFL_API_KEY"
-            )
-        api_key = os.environ["BFL_API_KEY"]
-    url = "https://api.us1.bfl.ai/v1/get_result"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Key": api_key,
-    }
+    import requests
+
+    api_key = _resolve_api_key(api_key)
+    url = api_url("get_result")
     payload = {
         "id": id,
     }
 
-    response = requests.get(url, headers=headers, params=payload)
+    response = get_session(api_key).get(url, params=payload)
     try:
         response.raise_for_status()
         return response.json()
@@ -266,6 +262,103 @@ def get_inference(
             f"Inference retrieval failed:\n{str(e)}\n{response.content.decode()}"
         )
 
+# Async counterparts, for callers running on an event loop (e.g. the Gradio handlers)
+
+async def _arequest(api_key, method, url, error_message, **kwargs):
+    # Only the async functions need httpx: keep it out of the CLI's startup
+    import httpx
+    import requests
+
+    client = get_async_client(api_key)
+    try:
+        response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        body = e.response.text if isinstance(e, httpx.HTTPStatusError) else ""
+        # Surface the same exception type as the synchronous functions (the response,
+        # if any, is kept for status checks such as 429 handling)
+        raise requests.exceptions.RequestException(f"{error_message}:\n{str(e)}\n{body}", response=getattr(e, "response", None))
+
+async def arequest_finetuning(
+    zip_path,
+    finetune_comment,
+    trigger_word="TOK",
+    mode="general",
+    api_key=None,
+    iterations=300,
+    learning_rate=0.00001,
+    captioning=True,
+    priority="quality",
+    finetune_type="full",
+    lora_rank=32,
+):
+    api_key = _resolve_api_key(api_key)
+    body = _finetuning_body(
+        zip_path, finetune_comment, trigger_word, mode, iterations,
+        learning_rate, captioning, priority, finetune_type, lora_rank,
+    )
+    resp = await _arequest(
+        api_key, "POST", api_url("finetune"), "Finetune request failed",
+        content=body.aiter_chunks(), headers=body.headers,
+    )
+    return _record_finetune(resp, api_key, body.fields)
+
+async def afinetune_progress(
+    finetune_id,
+    api_key=None,
+):
+    api_key = _resolve_api_key(api_key)
+    return await _arequest(api_key, "GET", api_url("get_result"), "Finetune progress failed", params={"id": finetune_id})
+
+async def afinetune_list(
+    api_key=None,
+):
+    api_key = _resolve_api_key(api_key)
+    return await get_single_flight().ado(
+        ("finetune_list", key_fingerprint(api_key)),
+        lambda notify: _arequest(api_key, "GET", api_url("my_finetunes"), "Finetune listing failed"),
+    )
+
+async def afinetune_details(
+    finetune_id,
+    api_key=None,
+):
+    api_key = _resolve_api_key(api_key)
+    return await get_single_flight().ado(
+        ("finetune_details", key_fingerprint(api_key), finetune_id),
+        lambda notify: _arequest(api_key, "GET", api_url("finetune_details"), "Finetune details failed", params={"finetune_id": finetune_id}),
+    )
+
+async def afinetune_delete(
+    finetune_id,
+    api_key=None,
+):
+    api_key = _resolve_api_key(api_key)
+    return await _arequest(api_key, "POST", api_url("delete_finetune"), "Finetune deletion failed", json={"finetune_id": finetune_id})
+
+async def afinetune_inference(
+    finetune_id,
+    finetune_strength=1.2,
+    endpoint="flux-pro-1.1-ultra-finetuned",
+    api_key=None,
+    **kwargs,
+):
+    api_key = _resolve_api_key(api_key)
+    payload = {
+        "finetune_id": finetune_id,
+        "finetune_strength": finetune_strength,
+        **kwargs,
+    }
+    return await _arequest(api_key, "POST", api_url(endpoint), "Finetune inference failed", json=payload)
+
+async def aget_inference(
+    id,
+    api_key=None,
+):
+    api_key = _resolve_api_key(api_key)
+    return await _arequest(api_key, "GET", api_url("get_result"), "Inference retrieval failed", params={"id": id})
+
 if __name__ == "__main__":
-    import fire
-    fire.Fire() 
\ No newline at end of file
+    import cli
+    cli.main(cli.module_commands(globals()), __doc__)
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+Command line entry point of the scripts (bfl_finetune.py, batch_cli.py, ...).
+
+Commands are plain functions, called through python-fire:
+`python script.py <command> [value ...] [--name=value | --name value | --flag | --noflag]`.
+Importing fire costs more than 200 ms (it pulls in IPython when installed), so
+--help is answered here without it; every other command line is parsed by fire,
+imported only then.
+"""
+import inspect
+import sys
+
+
+def module_commands(namespace: dict) -> dict:
+    """
+    Commands of a script: the public, non-async functions defined in it (not imported)
+    """
+    return {
+        name: value for name, value in namespace.items()
+        if inspect.isfunction(value) and not name.startswith("_") and value.__module__ == namespace["__name__"]
+        and not inspect.iscoroutinefunction(value)
+    }
+
+
+def _summary(fn) -> str:
+    return (inspect.getdoc(fn) or "").split("\n")[0]
+
+
+def _usage(doc: str, commands: dict) -> str:
+    lines = [inspect.cleandoc(doc), ""] if doc else []
+    lines.append("Commands:")
+    for name, fn in commands.items():
+        lines.append(f"  {name}{inspect.signature(fn)}")
+        if _summary(fn):
+            lines.append(f"      {_summary(fn)}")
+    return "\n".join(lines)
+
+
+def _command_usage(name: str, fn) -> str:
+    doc = inspect.getdoc(fn)
+    return f"{name}{inspect.signature(fn)}" + (f"\n\n{doc}" if doc else "")
+
+
+def help_text(commands, doc: str = None, argv: list = None):
+    """
+    The --help text of a command line, or None when it does not ask for help
+    """
+    if callable(commands):
+        if argv and argv[-1] in ("-h", "--help"):
+            return _command_usage(commands.__name__, commands)
+        return None
+    if not argv or argv == ["-h"] or argv == ["--help"]:
+        return _usage(doc, commands)
+    if argv[0] in commands and argv[-1] in ("-h", "--help"):
+        return _command_usage(argv[0], commands[argv[0]])
+    return None
+
+
+def main(commands, doc: str = None, argv: list = None):
+    """
+    Run the command line: commands is a function (the command line holds its arguments) or a
+    {name: function} dict (the first argument picks the command). doc is shown by --help.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    text = help_text(commands, doc, argv)
+    if text is not None:
+        print(text)
+        return
+    import fire
+    fire.Fire(commands, command=argv)
@@ -1,3 +1,5 @@
+import os
+
 # Available models with their BFL API ID
 # To get the finetuned version, append "-finetuned". Flux Pro 1.1 cannot be finetuned.
 AVAILABLE_MODELS = {
@@ -25,3 +27,149 @@ PRIORITY = {
 }
 
 MAX_SEED = 2**64 - 1
+
+# Finetune dataset preprocessing (see dataset_prep.py)
+FINETUNE_MAX_RESOLUTION = 1024  # longest image side used by the trainer
+FINETUNE_MAX_RESOLUTION_BY_PRIORITY = {"high_res_only": 1440}
+FINETUNE_JPEG_QUALITY = 95
+FINETUNE_NEAR_DUPLICATE_DISTANCE = 4  # max Hamming distance between perceptual hashes (out of 64 bits)
+
+# Batch generation (see batch.py)
+BATCH_MAX_SIZE = 64  # maximum number of images generated in one click
+BATCH_CONCURRENCY = 4  # default number of tasks in flight at once
+BATCH_MAX_CONCURRENCY = 16
+UI_STATUS_INTERVAL = 0.25  # minimum seconds between two progress updates sent to the browser
+
+# Image prompts (Redux) are downscaled and JPEG-encoded before upload (see image_prompt.py)
+IMAGE_PROMPT_MAX_SIDE = 1024  # longest side, in pixels, of the uploaded reference image
+IMAGE_PROMPT_JPEG_QUALITY = 90
+IMAGE_PROMPT_CACHE_SIZE = 32  # encoded image prompts kept in memory
+
+# Local application data (result cache, ...), override with FLUX_GUI_DATA_DIR
+DATA_DIR = os.environ.get("FLUX_GUI_DATA_DIR", os.path.join(os.path.expanduser("~"), ".flux-pro-gui"))
+
+# Content-addressed cache of fixed-seed generations (see result_cache.py)
+RESULT_CACHE_DIR = os.path.join(DATA_DIR, "results")
+RESULT_CACHE_MAX_BYTES = 2 * 1024**3  # least recently used entries are evicted above this size
+
+# Local registry of submitted generations and finetunes (see job_registry.py)
+JOB_REGISTRY_PATH = os.path.join(DATA_DIR, "jobs.sqlite3")
+JOB_RESUME_MAX_AGE = 24 * 3600  # unfinished tasks older than this (seconds) are not resumed
+# Processes recording jobs heartbeat this often; the unfinished jobs of a process silent for
+# JOB_OWNER_TIMEOUT seconds are resumed by the next process that needs them
+JOB_OWNER_HEARTBEAT = 10.0
+JOB_OWNER_TIMEOUT = 60.0
+# Generated images, streamed here as downloaded and served to the gallery from disk
+OUTPUT_DIR = os.path.join(DATA_DIR, "outputs")
+DOWNLOAD_CHUNK_SIZE = 256 * 1024  # bytes written per chunk while streaming a result image
+# Result image downloads (see downloads.py), run on their own pool, apart from submits and polls
+DOWNLOAD_WORKERS = 8  # result images downloaded at once
+DOWNLOAD_RETRIES = 5  # attempts after the first, resumed with a Range request where possible
+DOWNLOAD_BACKOFF = 0.5  # seconds before the first retry, doubled on each retry
+DOWNLOAD_MAX_BACKOFF = 8.0
+
+# Parameter sweeps and their contact sheets (see sweep.py)
+SWEEP_MAX_CELLS = 64  # combinations generated by one sweep, all submitted at once
+SWEEP_CELL_SIZE = 384  # width, in pixels, of each image on the contact sheet
+SWEEP_LABEL_SIZE = 18  # font size of the contact sheet labels
+SWEEP_SHEET_QUALITY = 90  # JPEG quality of the saved contact sheets
+SWEEP_DIR = os.path.join(OUTPUT_DIR, "sweeps")
+
+# Finetune A/B evaluations (see finetune_eval.py)
+EVAL_DIR = os.path.join(DATA_DIR, "evaluations")  # rendered cells and comparison sheets
+EVAL_MAX_CELLS = 128  # images in one evaluation (prompts x seeds x finetunes x strengths)
+EVAL_MAX_SEEDS = 4  # seeds per prompt offered in the Inference tab
+
+# Archive of every generated image, browsed in the History tab (see output_store.py)
+OUTPUT_STORE_DIR = os.path.join(DATA_DIR, "store")
+OUTPUT_THUMBNAIL_SIZE = 256  # longest side of the thumbnails, in pixels
+OUTPUT_THUMBNAIL_QUALITY = 80  # WebP quality of the thumbnails
+OUTPUT_THUMBNAIL_WORKERS = 2  # processes generating thumbnails in the background
+HISTORY_PAGE_SIZE = 48  # images per page of the History tab
+
+# Finetune catalog shared by the Inference and Finetuning tabs (see finetune_catalog.py)
+FINETUNE_CATALOG_TTL = 60  # seconds before a listing is refreshed
+FINETUNE_CATALOG_WORKERS = 8  # concurrent finetune_details requests
+FINETUNE_CATALOG_IDLE_TIMEOUT = 15 * 60  # stop background refreshes for keys unused this long
+
+# Background tracking of submitted finetunes until they finish training (see finetune_tracker.py)
+FINETUNE_TRACK_INITIAL_DELAY = 10.0  # seconds before the first progress poll of a new finetune
+FINETUNE_TRACK_BACKOFF = 1.5  # delay multiplier between consecutive polls
+FINETUNE_TRACK_MAX_DELAY = 120.0
+FINETUNE_TRACK_HISTORY = 500  # progress samples kept per finetune
+FINETUNE_TRACK_MAX_AGE = 7 * 24 * 3600  # unfinished finetunes older than this (seconds) are not resumed
+FINETUNE_MONITOR_INTERVAL = 5.0  # seconds between two refreshes of the finetune table in the browser
+
+# Logged string values (payloads, responses) are truncated to this length (see instrumentation.py)
+LOG_MAX_FIELD_LENGTH = 200
+
+# Shared HTTP client settings (see http_client.py)
+API_BASE_URL = os.environ.get("BFL_API_BASE_URL", "https://api.us1.bfl.ai")
+HTTP_POOL_SIZE = 16  # keep-alive connections kept per API key
+HTTP_TIMEOUT = (5.0, 60.0)  # (connect, read) timeouts in seconds
+HTTP_RETRIES = 3  # retries for connection errors and 5xx responses on idempotent requests
+HTTP_BACKOFF_FACTOR = 0.5
+
+# API regions (see endpoints.py): generation submits go to the fastest healthy region and are
+# polled in the region that accepted them, finetunes are managed on API_BASE_URL.
+# e.g. BFL_API_REGIONS="us1=https://api.us1.bfl.ai,eu1=https://api.eu1.bfl.ai"
+API_REGIONS = dict(
+    region.strip().split("=", 1) for region in os.environ.get("BFL_API_REGIONS", "").split(",") if "=" in region
+) or {"default": API_BASE_URL}
+ENDPOINT_PROBE_INTERVAL = 30.0  # seconds between two health and latency probes of every region
+ENDPOINT_PROBE_TIMEOUT = 3.0
+ENDPOINT_MAX_FAILURES = 2  # consecutive failed probes before a region stops receiving submits
+ENDPOINT_LATENCY_SMOOTHING = 0.3  # weight of the newest probe in the moving average latency
+
+# Web UI deployment (see webui.py). serve.py starts WEB_WORKERS processes sharing the data
+# directory, on consecutive ports, to be put behind a reverse proxy. Without a host or port,
+# Gradio's defaults apply (GRADIO_SERVER_NAME, GRADIO_SERVER_PORT or the first free port from 7860).
+WEB_HOST = os.environ.get("FLUX_GUI_HOST")
+WEB_PORT = int(os.environ["FLUX_GUI_PORT"]) if os.environ.get("FLUX_GUI_PORT") else None
+WEB_WORKERS = max(1, int(os.environ.get("FLUX_GUI_WORKERS", "1")))
+WEB_WORKER_INDEX = int(os.environ.get("FLUX_GUI_WORKER_INDEX", "0"))
+WEB_RESTART_DELAY = 5.0  # seconds before serve.py restarts a worker that exited
+# Gradio queue: runs of each group of handlers allowed at once, per worker process,
+# e.g. FLUX_GUI_QUEUE_CONCURRENCY="generate=32,train=1"
+QUEUE_CONCURRENCY = {
+    "generate": 16,  # Generate clicks, each running up to BATCH_MAX_CONCURRENCY tasks
+    "train": 2,  # dataset preprocessing and upload of new finetunes
+    "finetunes": 8,  # finetune listings, status, deletion and monitor refreshes
+    "history": 8,  # History tab pages
+    **{
+        name.strip(): int(limit)
+        for name, limit in (item.split("=", 1) for item in os.environ.get("FLUX_GUI_QUEUE_CONCURRENCY", "").split(",") if "=" in item)
+    },
+}
+QUEUE_DEFAULT_CONCURRENCY = 4  # any other handler
+QUEUE_MAX_SIZE = 256  # events waiting in a worker's queue before new ones are rejected
+
+# Per-API-key job scheduling (see scheduler.py)
+SCHEDULER_MAX_CONCURRENCY = 24  # generations in flight (submitted, not yet downloaded) per API key, split between web workers
+SCHEDULER_SUBMIT_RATE = 5.0  # submit requests per second per API key
+SCHEDULER_SUBMIT_BURST = 10
+SCHEDULER_RATE_LIMIT_RETRIES = 5  # submits answered with a 429 are queued again this many times
+# Queue order: lower ranks are served first
+SCHEDULER_PRIORITIES = {"interactive": 0, "batch": 1}
+# With several web workers, submit rate limits are shared through this database
+SCHEDULER_SHARED_STATE = WEB_WORKERS > 1
+SCHEDULER_STATE_PATH = os.path.join(DATA_DIR, "scheduler.sqlite3")
+
+# Result polling schedule (see poller.py)
+POLL_INITIAL_DELAY = 0.5  # first polls are fast, most tasks finish within seconds
+POLL_BACKOFF = 1.5  # delay multiplier between consecutive polls
+POLL_MAX_DELAY = 5.0
+POLL_MAX_ERRORS = 5  # consecutive transient errors tolerated before giving up on a task
+# Ceiling (seconds) before a task is reported as timed out, by model ID
+POLL_TIMEOUTS = {
+    "flux-pro": 180,
+    "flux-pro-1.1": 180,
+    "flux-pro-1.1-ultra": 420,
+    "flux-pro-finetuned": 420,
+}
+POLL_DEFAULT_TIMEOUT = 300
+# Multiplier applied to the ceiling: bulk work may sit longer in the API queue
+POLL_TIMEOUT_FACTORS = {
+    "interactive": 1.0,
+    "batch": 3.0,
+}
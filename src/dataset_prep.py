@@ -0,0 +1,192 @@
+"""
+Local preprocessing of finetuning datasets before upload.
+
+Images in the ZIP are decoded over a process pool, downscaled to the resolution
+the trainer actually uses, re-encoded as JPEG without EXIF metadata, and
+deduplicated (exact copies by content hash, near copies by perceptual hash).
+Caption files (`<image name>.txt`) follow their image. The result is repacked
+into a new, much smaller archive.
+
+Usage:
+    python dataset_prep.py preprocess_dataset finetuning.zip --output_path=finetuning_small.zip
+"""
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from config import (
+    FINETUNE_JPEG_QUALITY,
+    FINETUNE_MAX_RESOLUTION,
+    FINETUNE_MAX_RESOLUTION_BY_PRIORITY,
+    FINETUNE_NEAR_DUPLICATE_DISTANCE,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def max_resolution_for(priority: str = None) -> int:
+    """
+    Longest image side used by the trainer for the given finetune priority
+    """
+    return FINETUNE_MAX_RESOLUTION_BY_PRIORITY.get(priority, FINETUNE_MAX_RESOLUTION)
+
+
+def difference_hash(image) -> int:
+    """
+    64-bit perceptual (difference) hash of a PIL image: similar images have close hashes
+    """
+    from PIL import Image
+
+    pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def _process_image(zip_path: str, name: str, max_side: int, quality: int):
+    """
+    Worker: decode, downscale and re-encode one image of the archive.
+    Returns (name, content hash, perceptual hash, encoded JPEG bytes), with None bytes if undecodable.
+    """
+    from PIL import Image, ImageOps
+
+    with zipfile.ZipFile(zip_path) as archive:
+        data = archive.read(name)
+    content_hash = hashlib.sha256(data).hexdigest()
+    try:
+        image = Image.open(BytesIO(data))
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        # No exif argument: the re-encoded file carries no metadata
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    except Exception:
+        return name, content_hash, None, None
+    return name, content_hash, difference_hash(image), output.getvalue()
+
+
+def output_stems(names: list) -> dict:
+    """
+    Stem of each image in the repacked archive, where every image becomes `<stem>.jpg`.
+    Images sharing a stem (e.g. cat.png and cat.jpg) keep their extension in it (cat_png,
+    cat_jpg), numbered if that still collides; stems are compared case-insensitively.
+    """
+    stem_counts = Counter(os.path.splitext(name)[0].lower() for name in names)
+    used = set()
+    stems = {}
+    for name in sorted(names):
+        stem, extension = os.path.splitext(name)
+        candidate = stem if stem_counts[stem.lower()] == 1 else f"{stem}_{extension.lstrip('.').lower()}"
+        unique, number = candidate, 2
+        while unique.lower() in used:
+            unique, number = f"{candidate}_{number}", number + 1
+        used.add(unique.lower())
+        stems[name] = unique
+    return stems
+
+
+def preprocess_dataset(
+    zip_path,
+    output_path=None,
+    max_side=FINETUNE_MAX_RESOLUTION,
+    quality=FINETUNE_JPEG_QUALITY,
+    near_duplicate_distance=FINETUNE_NEAR_DUPLICATE_DISTANCE,
+    workers=None,
+):
+    """
+    Preprocess a finetuning ZIP and write the repacked archive to output_path
+    (a temporary file by default). Returns (output_path, report dict).
+    """
+    if not os.path.exists(zip_path):
+        raise FileNotFoundError(f"ZIP file not found at {zip_path}")
+
+    with zipfile.ZipFile(zip_path) as archive:
+        names = sorted(info.filename for info in archive.infolist() if not info.is_dir())
+    image_names = [name for name in names if name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")]
+    captions = {os.path.splitext(name)[0]: name for name in names if name.lower().endswith(".txt")}
+
+    report = {
+        "images_in": len(image_names),
+        "images_out": 0,
+        "exact_duplicates": 0,
+        "near_duplicates": 0,
+        "undecodable": 0,
+        "bytes_in": os.path.getsize(zip_path),
+        "bytes_out": 0,
+    }
+
+    # Spawned, not forked: this runs in a web UI thread while other threads (poller, tracker,
+    # HTTP pools) may hold locks a forked child would inherit in a held state
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(
+            _process_image,
+            [zip_path] * len(image_names),
+            image_names,
+            [max_side] * len(image_names),
+            [quality] * len(image_names),
+        ))
+
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(suffix=".zip", prefix="finetune_")
+        os.close(fd)
+
+    # When duplicates are found, keep the copy that has a caption
+    results.sort(key=lambda result: (os.path.splitext(result[0])[0] not in captions, result[0]))
+    seen_content = set()
+    kept_hashes = []
+    kept = []
+    for name, content_hash, perceptual_hash, data in results:
+        if data is None:
+            report["undecodable"] += 1
+            continue
+        if content_hash in seen_content:
+            report["exact_duplicates"] += 1
+            continue
+        seen_content.add(content_hash)
+        if any(bin(perceptual_hash ^ kept_hash).count("1") <= near_duplicate_distance for kept_hash in kept_hashes):
+            report["near_duplicates"] += 1
+            continue
+        kept_hashes.append(perceptual_hash)
+        kept.append((name, data))
+
+    stems = output_stems([name for name, _ in kept])
+    with zipfile.ZipFile(zip_path) as source, zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED) as target:
+        for name, data in kept:
+            stem = os.path.splitext(name)[0]
+            # JPEG is already compressed, storing avoids a useless deflate pass
+            target.writestr(f"{stems[name]}.jpg", data)
+            if stem in captions:
+                # A renamed image takes its caption along under the new name
+                caption_name = captions[stem] if stems[name] == stem else f"{stems[name]}.txt"
+                target.writestr(caption_name, source.read(captions[stem]), zipfile.ZIP_DEFLATED)
+            report["images_out"] += 1
+
+    report["bytes_out"] = os.path.getsize(output_path)
+    return output_path, report
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"{report['images_out']}/{report['images_in']} images kept "
+        f"({report['exact_duplicates']} exact duplicates, {report['near_duplicates']} near duplicates, "
+        f"{report['undecodable']} unreadable removed), "
+        f"{report['bytes_in'] / 1024**2:.1f} MB -> {report['bytes_out'] / 1024**2:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(cli.module_commands(globals()), __doc__)
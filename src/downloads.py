@@ -0,0 +1,200 @@
+"""
+Resumable, validated downloads of result images.
+
+Result images are paid for and their signed delivery URLs expire soon after
+the task finishes, so a transient failure must not lose them. Downloads stream
+to a `.part` file next to their destination and are retried with exponential
+backoff; a retry only asks for the missing bytes with an HTTP Range request
+(guarded by If-Range, so a file that changed is fetched again in full). A
+finished file is checked against the announced size and for a complete PNG,
+JPEG or WebP image before it is moved in place.
+
+Downloads run on a dedicated thread pool, so slow CDN fetches never hold the
+threads or the event loop that submit and poll tasks.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import DOWNLOAD_BACKOFF, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MAX_BACKOFF, DOWNLOAD_RETRIES, DOWNLOAD_WORKERS, OUTPUT_DIR
+from http_client import get_session
+from instrumentation import get_logger, log_event, metrics
+
+logger = get_logger("downloads")
+
+# Delivery answers that a retry cannot fix (expired or invalid signed URL)
+PERMANENT_STATUS_CODES = (400, 401, 403, 404, 410)
+
+
+class DownloadError(Exception):
+    """
+    A download failed; `retryable` is False when retrying cannot help (expired URL, not an image)
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def image_extension(header: bytes) -> str:
+    """
+    File extension of an encoded image from its first bytes, None if it is not a PNG, JPEG or WebP
+    """
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def validate_image_file(path: str, expected_size: int = None) -> str:
+    """
+    Check that a file is a complete PNG, JPEG or WebP image of the expected size, without
+    decoding it. Returns its extension, raises DownloadError otherwise.
+    """
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"size mismatch, got {size} bytes instead of {expected_size}")
+    with open(path, "rb") as f:
+        header = f.read(16)
+        f.seek(max(0, size - 16))
+        trailer = f.read()
+    extension = image_extension(header)
+    if extension is None:
+        raise DownloadError("the response is not a PNG, JPEG or WebP image", retryable=False)
+    if extension == "png":
+        complete = trailer.endswith(b"IEND\xaeB`\x82")
+    elif extension == "jpg":
+        complete = b"\xff\xd9" in trailer
+    else:
+        complete = int.from_bytes(header[4:8], "little") + 8 == size
+    if not complete:
+        raise DownloadError(f"truncated {extension} image ({size} bytes)")
+    return extension
+
+
+def _content_range(header: str) -> tuple:
+    """
+    (first byte, total size or None) of a Content-Range header
+    """
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", header or "")
+    if match is None:
+        return None, None
+    return int(match.group(1)), None if match.group(2) == "*" else int(match.group(2))
+
+
+def _fetch(url: str, part_path: str, validator: str = None) -> tuple:
+    """
+    Stream url into part_path, after the bytes it already holds when the server supports
+    ranges. Returns (expected total size or None, ETag or Last-Modified of the file).
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if validator:
+            headers["If-Range"] = validator
+    # Anonymous session: delivery URLs are signed and must not receive the API key
+    with get_session().get(url, stream=True, headers=headers) as response:
+        if response.status_code == 416:
+            # Nothing left to fetch, the part file is validated as it is
+            return None, validator
+        if response.status_code in PERMANENT_STATUS_CODES:
+            raise DownloadError(f"{response.status_code} {response.reason}", retryable=False)
+        response.raise_for_status()
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status_code == 206:
+            start, total = _content_range(response.headers.get("Content-Range"))
+            if start != offset:
+                os.remove(part_path)
+                raise DownloadError(f"unexpected range {response.headers.get('Content-Range')}")
+            mode = "ab"
+            metrics.increment("downloads.resumed")
+        else:
+            # Full response: no range support, or the file changed since the first attempt
+            length = response.headers.get("Content-Length")
+            total = int(length) if length and not response.headers.get("Content-Encoding") else None
+            mode = "wb"
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    return total, validator
+
+
+def _remove_partial(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def download_file(url: str, name: str, output_dir: str = OUTPUT_DIR) -> str:
+    """
+    Download an image to output_dir/<name>.<extension> in the calling thread, retrying and
+    resuming failed transfers. Returns the file path, raises DownloadError.
+    """
+    import requests
+
+    os.makedirs(output_dir, exist_ok=True)
+    part_path = os.path.join(output_dir, f"{name}.part")
+    validator = None
+    error = None
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        if attempt:
+            metrics.increment("downloads.retries")
+            log_event(logger, logging.WARNING, "Retrying download", name=name, attempt=attempt, error=str(error))
+            time.sleep(min(DOWNLOAD_BACKOFF * 2 ** (attempt - 1), DOWNLOAD_MAX_BACKOFF))
+        try:
+            total, validator = _fetch(url, part_path, validator)
+            if total is not None and os.path.getsize(part_path) < total:
+                # Keep what was received, the next attempt asks for the rest
+                raise DownloadError(f"connection closed after {os.path.getsize(part_path)} of {total} bytes")
+            try:
+                extension = validate_image_file(part_path, total)
+            except DownloadError:
+                # The bytes on disk cannot be trusted: start over
+                _remove_partial(part_path)
+                raise
+        except DownloadError as e:
+            error = e
+            if not e.retryable:
+                _remove_partial(part_path)
+                break
+            continue
+        except (requests.exceptions.RequestException, OSError) as e:
+            error = e
+            continue
+        path = os.path.join(output_dir, f"{name}.{extension}")
+        os.replace(part_path, path)
+        metrics.increment("requests.download")
+        return path
+    metrics.increment("downloads.failures")
+    # A retryable failure keeps its part file: resuming the job later continues from it
+    raise DownloadError(f"Failed to download image: {error}", retryable=getattr(error, "retryable", True))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_download_pool() -> ThreadPoolExecutor:
+    """
+    Get the process-wide download pool, creating it on first use
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+    return _pool
+
+
+def submit_download(url: str, name: str, output_dir: str = OUTPUT_DIR) -> Future:
+    """
+    Run download_file on the download pool, returns its future
+    """
+    return get_download_pool().submit(download_file, url, name, output_dir)
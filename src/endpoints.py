@@ -0,0 +1,169 @@
+"""
+Registry of the API regions generation tasks can be submitted to.
+
+Regions are configured with BFL_API_REGIONS (see config.py). A background
+thread health-checks and latency-probes every region each
+ENDPOINT_PROBE_INTERVAL seconds; submits go to the healthy region with the
+lowest moving average latency, and fail over to the next one when a region
+cannot be reached. There is no DNS lookup of its own before a submit:
+requests resolve host names through urllib3/httpx, once per new connection
+of the pooled keep-alive sessions (see http_client.py).
+
+A task must be polled where it was submitted: callers keep the polling URL
+returned by the region that accepted it (see poller.py).
+"""
+import logging
+import threading
+import time
+
+from config import (
+    API_BASE_URL,
+    API_REGIONS,
+    ENDPOINT_LATENCY_SMOOTHING,
+    ENDPOINT_MAX_FAILURES,
+    ENDPOINT_PROBE_INTERVAL,
+    ENDPOINT_PROBE_TIMEOUT,
+)
+from instrumentation import get_logger, log_event, metrics
+
+logger = get_logger("endpoints")
+
+def is_connect_error(error: Exception) -> bool:
+    """
+    True if a request failed before reaching the server (DNS, refused, connect timeout),
+    i.e. it is safe to send it again, even a paid submit, to another region
+    """
+    import httpx
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, requests.exceptions.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class Region:
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.healthy = True  # optimistic until the first probe
+        self.latency = None  # moving average of the probe round trips, in seconds
+        self.failures = 0
+        self.last_error = None
+        self.probed_at = None
+
+    def url(self, path: str) -> str:
+        """
+        Full URL of an API route in this region, e.g. region.url("get_result")
+        """
+        return f"{self.base_url}/v1/{path.lstrip('/')}"
+
+
+class EndpointRegistry:
+    """
+    Health, latency and routing of the configured API regions
+    """
+
+    def __init__(self, regions: dict = API_REGIONS, probe_interval: float = ENDPOINT_PROBE_INTERVAL):
+        self.regions = [Region(name, base_url) for name, base_url in regions.items()]
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._prober = None
+        # Finetunes are managed on API_BASE_URL: it comes first when nothing is known yet
+        self.regions.sort(key=lambda region: region.base_url != API_BASE_URL.rstrip("/"))
+
+    def _ensure_probing(self):
+        # A single region has nowhere to fail over to, nothing to probe
+        if len(self.regions) > 1 and self._prober is None:
+            with self._lock:
+                if self._prober is None:
+                    self._prober = threading.Thread(target=self._probe_loop, name="endpoint-prober", daemon=True)
+                    self._prober.start()
+
+    def submit_order(self) -> list:
+        """
+        Regions in the order submits should try them: healthy ones by latency (unprobed
+        first in configuration order), then the unhealthy ones as a last resort
+        """
+        self._ensure_probing()
+        with self._lock:
+            return sorted(
+                self.regions,
+                key=lambda region: (not region.healthy, region.latency if region.latency is not None else -1),
+            )
+
+    def report_failure(self, region: Region, error: Exception):
+        """
+        A request could not reach the region: stop sending submits there until a probe succeeds
+        """
+        metrics.increment("endpoints.failovers")
+        with self._lock:
+            region.healthy = False
+            region.failures = max(region.failures, ENDPOINT_MAX_FAILURES)
+            region.last_error = str(error)
+        log_event(logger, logging.WARNING, "Region unreachable, failing over", region=region.name, error=str(error))
+
+    def probe(self, region: Region):
+        """
+        Time a request to the region; any answer below 500 counts as healthy
+        """
+        from http_client import get_probe_session
+
+        start = time.perf_counter()
+        try:
+            response = get_probe_session().get(region.url("get_result"), timeout=ENDPOINT_PROBE_TIMEOUT)
+            if response.status_code >= 500:
+                raise Exception(f"{response.status_code} {response.reason}")
+            latency = time.perf_counter() - start
+        except Exception as e:
+            with self._lock:
+                region.failures += 1
+                region.last_error = str(e)
+                region.probed_at = time.time()
+                if region.failures >= ENDPOINT_MAX_FAILURES and region.healthy:
+                    region.healthy = False
+                    log_event(logger, logging.WARNING, "Region unhealthy", region=region.name, error=str(e))
+            metrics.increment("endpoints.probe_failures")
+            return
+        with self._lock:
+            if not region.healthy:
+                log_event(logger, logging.INFO, "Region healthy again", region=region.name)
+            region.healthy = True
+            region.failures = 0
+            region.last_error = None
+            region.probed_at = time.time()
+            region.latency = latency if region.latency is None else (
+                ENDPOINT_LATENCY_SMOOTHING * latency + (1 - ENDPOINT_LATENCY_SMOOTHING) * region.latency
+            )
+        metrics.observe("endpoint_probe", latency)
+
+    def _probe_loop(self):
+        while True:
+            for region in self.regions:
+                self.probe(region)
+            time.sleep(self.probe_interval)
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {"region": region.name, "url": region.base_url, "healthy": region.healthy, "latency": region.latency, "error": region.last_error}
+                for region in self.regions
+            ]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_endpoint_registry() -> EndpointRegistry:
+    """
+    Get the process-wide endpoint registry, creating it on first use
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = EndpointRegistry()
+    return _registry
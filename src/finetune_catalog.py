@@ -0,0 +1,166 @@
+"""
+Cached, incrementally refreshed catalog of the finetunes of each API key.
+
+Both tabs read the same in-memory snapshot instead of calling `finetune_list`
+on every click. A refresh lists the finetune IDs once, then fetches details
+concurrently only for new IDs and for finetunes that are still training.
+Stale snapshots are served immediately while being refreshed in the
+background, and recently used keys are kept fresh by a background thread.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bfl_finetune
+from config import FINETUNE_CATALOG_IDLE_TIMEOUT, FINETUNE_CATALOG_TTL, FINETUNE_CATALOG_WORKERS
+from job_registry import key_fingerprint
+
+# Statuses of finetunes whose details may still change
+TRAINING_STATUSES = ("Pending", "Queued", "Running", "In Progress", "Training")
+
+
+def summarize_details(finetune_id: str, details) -> dict:
+    """
+    Flatten a finetune_details response into {"id", "comment", "status", "details"}
+    """
+    info = details.get("finetune_details", details) if isinstance(details, dict) else {}
+    if not isinstance(info, dict):
+        info = {}
+    status = info.get("status") or (details.get("status") if isinstance(details, dict) else None)
+    return {
+        "id": finetune_id,
+        "comment": info.get("finetune_comment", ""),
+        "status": status or "",
+        "details": details,
+    }
+
+
+class _Snapshot:
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.finetunes = {}  # id -> summary, in listing order
+        self.fetched_at = 0.0
+        self.used_at = time.time()
+        self.error = None
+        self.lock = threading.Lock()  # serializes refreshes of this key
+        self.refreshing = False
+
+
+class FinetuneCatalog:
+    """
+    TTL cache of finetune listings and details, per API key
+    """
+
+    def __init__(self, ttl: float = FINETUNE_CATALOG_TTL, workers: int = FINETUNE_CATALOG_WORKERS):
+        self.ttl = ttl
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        # Separate pools: a refresh waits on its details requests, it must not starve them
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="finetune-catalog-refresh")
+        self._details_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finetune-catalog-details")
+        self._refresher = None
+
+    def _snapshot(self, api_key: str) -> _Snapshot:
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            snapshot = self._snapshots.get(fingerprint)
+            if snapshot is None:
+                snapshot = self._snapshots[fingerprint] = _Snapshot(api_key.strip())
+            snapshot.used_at = time.time()
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="finetune-catalog-scheduler", daemon=True)
+                self._refresher.start()
+        return snapshot
+
+    def get(self, api_key: str, force: bool = False) -> list:
+        """
+        Finetune summaries of an API key. Fetched synchronously on first use (or with force),
+        otherwise served from memory and refreshed in the background once older than the TTL.
+        Raises if the first listing fails.
+        """
+        snapshot = self._snapshot(api_key)
+        age = time.time() - snapshot.fetched_at
+        if force or not snapshot.fetched_at:
+            self._refresh(snapshot)
+            if snapshot.error is not None and not snapshot.fetched_at:
+                raise snapshot.error
+        elif age > self.ttl:
+            self._refresh_in_background(snapshot)
+        return list(snapshot.finetunes.values())
+
+    def ids(self, api_key: str, force: bool = False) -> list:
+        return [finetune["id"] for finetune in self.get(api_key, force=force)]
+
+    def invalidate(self, api_key: str):
+        """
+        Force the next read of this key's catalog to fetch the listing again
+        """
+        self._snapshot(api_key).fetched_at = 0.0
+
+    def _refresh_in_background(self, snapshot: _Snapshot):
+        with self._lock:
+            if snapshot.refreshing:
+                return
+            snapshot.refreshing = True
+        self._refresh_pool.submit(self._refresh, snapshot)
+
+    def _refresh(self, snapshot: _Snapshot):
+        with snapshot.lock:
+            try:
+                resp = bfl_finetune.finetune_list(api_key=snapshot.api_key)
+                if not isinstance(resp, dict) or "finetunes" not in resp:
+                    raise Exception(f"Unexpected finetune listing: {resp}")
+                ids = [item.get("id", "") if isinstance(item, dict) else item for item in resp["finetunes"]]
+                previous = snapshot.finetunes
+                # Only new finetunes, those still training and failed fetches need their details (re)fetched
+                to_fetch = [
+                    finetune_id for finetune_id in ids
+                    if finetune_id not in previous
+                    or previous[finetune_id]["details"] is None
+                    or previous[finetune_id]["status"] in TRAINING_STATUSES
+                ]
+                fetched = dict(zip(to_fetch, self._details_pool.map(self._fetch_details, [snapshot.api_key] * len(to_fetch), to_fetch)))
+                finetunes = {}
+                for finetune_id in ids:
+                    summary = fetched.get(finetune_id) or previous.get(finetune_id)
+                    finetunes[finetune_id] = summary or {"id": finetune_id, "comment": "", "status": "", "details": None}
+                snapshot.finetunes = finetunes
+                snapshot.fetched_at = time.time()
+                snapshot.error = None
+            except Exception as e:
+                snapshot.error = e
+            finally:
+                snapshot.refreshing = False
+
+    @staticmethod
+    def _fetch_details(api_key: str, finetune_id: str) -> dict:
+        try:
+            return summarize_details(finetune_id, bfl_finetune.finetune_details(finetune_id, api_key=api_key))
+        except Exception:
+            # Keep the previous summary, if any; the details are fetched again on the next refresh
+            return None
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl)
+            now = time.time()
+            with self._lock:
+                snapshots = list(self._snapshots.values())
+            for snapshot in snapshots:
+                if snapshot.fetched_at and now - snapshot.used_at < FINETUNE_CATALOG_IDLE_TIMEOUT and now - snapshot.fetched_at >= self.ttl:
+                    self._refresh_in_background(snapshot)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_finetune_catalog() -> FinetuneCatalog:
+    """
+    Get the process-wide finetune catalog, creating it on first use
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = FinetuneCatalog()
+    return _catalog
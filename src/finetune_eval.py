@@ -0,0 +1,266 @@
+"""
+Finetune A/B evaluation: render one prompt set with several finetunes and
+strengths, and compare the results side by side.
+
+An evaluation is a grid with one row per (prompt, seed) and one column per
+(finetune, strength). Seeds are pinned (derived from the prompt text unless a
+base seed is given), so every evaluation of a prompt set asks for the same
+images and the only thing that changes along a row is the finetune. Comparing
+e.g. a LoRA rank 16 and a rank 32 finetune of one dataset, or two training
+lengths, is one run. The cells run concurrently through the finetuned model's
+endpoint (bfl_finetune.finetune_inference) under the API key's scheduler.
+
+Finished cells are kept in the evaluation store (EVAL_DIR), apart from the
+size-bounded result cache. Running an evaluation again, or extending it with
+another finetune, strength or prompt, only generates the cells never rendered
+before.
+
+Usage:
+    export BFL_API_KEY=<your api key>
+    python finetune_eval.py compare prompts.txt --finetunes=<id>,<id> --strengths=0.8,1,1.2
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import textwrap
+import threading
+
+from api_utils import build_payload
+from batch import agenerate_batch
+from config import AVAILABLE_MODELS, EVAL_DIR, EVAL_MAX_CELLS, MAX_SEED
+from instrumentation import configure_logging, metrics
+from result_cache import cache_key
+from sweep import compose_sheet, parse_values, save_contact_sheet
+
+FINETUNE_MODEL_ID = AVAILABLE_MODELS["Flux1 Pro Finetune"]
+ROW_LABEL_WIDTH = 280
+ROW_LABEL_CHARS = 26  # characters per line of the prompt shown on each row
+ROW_LABEL_LINES = 4
+
+
+def pinned_seed(prompt: str, index: int = 0) -> int:
+    """
+    Seed of the index-th image of a prompt, the same in every evaluation
+    """
+    digest = hashlib.sha256(f"{index}:{prompt}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % (MAX_SEED + 1)
+
+
+def evaluation_jobs(prompts: list, finetune_ids: list, strengths: list, seeds_per_prompt: int = 1, seed: int = -1) -> list:
+    """
+    Jobs ({"prompt", "seed", "finetune_id", "finetune_strength"}) of an evaluation, row by row:
+    every finetune at every strength for each prompt and seed. With seed -1 the seeds are
+    pinned per prompt (see pinned_seed), otherwise every prompt uses seed, seed + 1, ...
+    Raises ValueError for an empty or too large evaluation.
+    """
+    prompts = [prompt.strip() for prompt in prompts if prompt and prompt.strip()]
+    finetune_ids = list(dict.fromkeys(finetune_id.strip() for finetune_id in finetune_ids if finetune_id and finetune_id.strip()))
+    if not prompts:
+        raise ValueError("Enter at least one prompt to evaluate")
+    if not finetune_ids:
+        raise ValueError("Select at least one finetune to evaluate")
+    if not strengths:
+        raise ValueError("Enter at least one finetune strength")
+    columns = [(finetune_id, strength) for finetune_id in finetune_ids for strength in strengths]
+    size = len(prompts) * int(seeds_per_prompt) * len(columns)
+    if size > EVAL_MAX_CELLS:
+        raise ValueError(f"Evaluation too large: {size} images, the maximum is {EVAL_MAX_CELLS}")
+    seed = -1 if seed is None else int(seed)
+    jobs = []
+    for prompt in prompts:
+        for i in range(int(seeds_per_prompt)):
+            job_seed = pinned_seed(prompt, i) if seed == -1 else (seed + i) % (MAX_SEED + 1)
+            for finetune_id, strength in columns:
+                jobs.append({"prompt": prompt, "seed": job_seed, "finetune_id": finetune_id, "finetune_strength": strength})
+    return jobs
+
+
+def cell_key(job: dict, settings: dict) -> str:
+    """
+    Key of an evaluation cell: the result cache key of its generation request
+    """
+    return cache_key(FINETUNE_MODEL_ID, build_payload(**job, **settings))
+
+
+class EvaluationStore:
+    """
+    Finished evaluation cells: a cells.jsonl index of {"key", "image", "job"} records and the
+    images, hard-linked from the generation outputs when the file system allows it.
+    Processes sharing the directory see each other's cells.
+    """
+
+    def __init__(self, directory: str = EVAL_DIR):
+        self.directory = directory
+        self._index_path = os.path.join(directory, "cells.jsonl")
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        cells = {}
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        cells[record["key"]] = record["image"]
+                    except (ValueError, KeyError):
+                        # A line cut off by a crash
+                        continue
+        except FileNotFoundError:
+            pass
+        return cells
+
+    def lookup(self, keys: list) -> dict:
+        """
+        Image paths of the cells already rendered ({key: path}), among keys
+        """
+        with self._lock:
+            cells = self._load()
+        return {key: cells[key] for key in keys if key in cells and os.path.isfile(cells[key])}
+
+    def add(self, key: str, job: dict, image_path: str) -> str:
+        """
+        Keep the image of a finished cell, returns its path in the store
+        """
+        target = os.path.join(self.directory, "images", key[:2], f"{key}{os.path.splitext(image_path)[1].lower() or '.jpg'}")
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{threading.get_ident()}.tmp"
+            try:
+                os.link(image_path, tmp_path)
+            except OSError:
+                shutil.copyfile(image_path, tmp_path)
+            os.replace(tmp_path, target)
+        with self._lock:
+            # One short line per cell, appended: concurrent writers never interleave
+            with open(self._index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "image": target, "job": job}) + "\n")
+        return target
+
+
+async def aevaluate(jobs: list, api_key: str, on_status=None, store: EvaluationStore = None, use_cache: bool = True, **settings):
+    """
+    Render the cells of an evaluation that are not in the store, all at once. `settings` are
+    the generation settings shared by every cell (width, height, steps, guidance_scale,
+    use_raw_mode, prompt_upsample, interval). Yields the same (index, job, images, error)
+    tuples as agenerate_batch, stored cells first. Without use_cache, every cell is rendered again.
+    """
+    store = store or get_evaluation_store()
+    keys = [cell_key(job, settings) for job in jobs]
+    stored = await asyncio.to_thread(store.lookup, keys) if use_cache else {}
+    missing = [index for index, key in enumerate(keys) if key not in stored]
+    metrics.increment("finetune_eval.stored_cells", len(jobs) - len(missing))
+    for index, key in enumerate(keys):
+        if key in stored:
+            if on_status is not None:
+                on_status(index, "done", 1.0)
+            yield index, jobs[index], [stored[key]], None
+    if not missing:
+        return
+
+    def missing_status(position, stage, progress):
+        on_status(missing[position], stage, progress)
+
+    async for position, job, images, error in agenerate_batch(
+        [jobs[index] for index in missing],
+        concurrency=len(missing),
+        on_status=missing_status if on_status is not None else None,
+        api_key=api_key,
+        model_id=FINETUNE_MODEL_ID,
+        use_cache=use_cache,
+        **settings,
+    ):
+        index = missing[position]
+        if error is None and images:
+            images = [await asyncio.to_thread(store.add, keys[index], job, images[0])]
+        yield index, job, images, error
+
+
+def comparison_sheet(jobs: list, images: list, finetune_names: dict = None, aspect_ratio: float = 1.0):
+    """
+    Side-by-side sheet of an evaluation as a PIL image: a column per finetune and strength
+    (named from finetune_names, {id: name}, when given), a row per prompt and seed.
+    images[i] is the file of jobs[i] (None when it failed).
+    """
+    finetune_names = finetune_names or {}
+    columns = list(dict.fromkeys((job["finetune_id"], job["finetune_strength"]) for job in jobs))
+    column_labels = [
+        [finetune_names.get(finetune_id) or finetune_id[:13], f"Strength {strength:g}"] for finetune_id, strength in columns
+    ]
+    row_labels = []
+    for job in jobs[::len(columns)]:
+        lines = textwrap.wrap(job["prompt"], ROW_LABEL_CHARS) or [""]
+        if len(lines) > ROW_LABEL_LINES:
+            lines = lines[:ROW_LABEL_LINES - 1] + [f"{lines[ROW_LABEL_LINES - 1][:ROW_LABEL_CHARS - 1]}…"]
+        row_labels.append(lines + [f"seed {job['seed']}"])
+    return compose_sheet(images, len(columns), column_labels, row_labels, aspect_ratio, row_label_width=ROW_LABEL_WIDTH)
+
+
+def save_comparison_sheet(image) -> str:
+    return save_contact_sheet(image, directory=os.path.join(EVAL_DIR, "sheets"), prefix="comparison")
+
+
+def compare(
+    prompts_path: str,
+    finetunes,
+    strengths="1",
+    seeds: int = 1,
+    seed: int = -1,
+    width: int = 1024,
+    height: int = 1024,
+    steps: int = 40,
+    guidance_scale: float = 2.5,
+    api_key: str = None,
+    use_cache: bool = True,
+):
+    """
+    Evaluate every prompt of a text file (one per line) with each finetune at each strength,
+    save the comparison sheet and return its path. Cells rendered by earlier runs are reused.
+    """
+    api_key = api_key or os.environ.get("BFL_API_KEY")
+    if not api_key:
+        raise ValueError("Provide your API key via --api_key or an environment variable BFL_API_KEY")
+    configure_logging()
+    with open(prompts_path, "r", encoding="utf-8") as f:
+        prompts = f.read().splitlines()
+    # fire passes "a,b" as a tuple and a single value as a string or a number
+    finetunes = [str(finetune) for finetune in finetunes] if isinstance(finetunes, (list, tuple)) else str(finetunes).split(",")
+    strengths = parse_values("finetune_strength", ",".join(map(str, strengths)) if isinstance(strengths, (list, tuple)) else str(strengths))
+    jobs = evaluation_jobs(prompts, finetunes, strengths, seeds, seed)
+
+    async def run():
+        images = [None] * len(jobs)
+        finished = 0
+        async for index, job, results, error in aevaluate(
+            jobs, api_key, use_cache=use_cache, width=width, height=height, steps=steps, guidance_scale=guidance_scale,
+        ):
+            finished += 1
+            images[index] = results[0] if results else None
+            outcome = "ok" if error is None else f"failed: {error}"
+            print(f"[{finished}/{len(jobs)}] {job['finetune_id']} x {job['finetune_strength']:g} seed {job['seed']}: {outcome}", file=sys.stderr, flush=True)
+        return images
+
+    images = asyncio.run(run())
+    return save_comparison_sheet(comparison_sheet(jobs, images, aspect_ratio=height / width))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_evaluation_store() -> EvaluationStore:
+    """
+    Get the process-wide evaluation store, creating it on first use
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EvaluationStore()
+    return _store
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(cli.module_commands(globals()), __doc__)
@@ -0,0 +1,261 @@
+"""
+Background tracking of submitted finetunes until they finish training.
+
+Every finetune submitted from the GUI (or left unfinished by a process that
+stopped) is followed by a single shared thread instead of manual status clicks.
+Like generations, finetunes are owned in the job registry by one process, so
+web workers sharing it never poll the same finetune. Each
+finetune is polled on its own schedule: backoff from FINETUNE_TRACK_INITIAL_DELAY
+up to FINETUNE_TRACK_MAX_DELAY, sooner when the reported progress says training
+is about to end. Every poll is kept in a bounded progress history, from which
+the remaining training time is estimated, and status changes are written to
+the job registry. When a finetune reaches a final status, the finetune catalog
+of its key is invalidated so that both tabs list it with its new status.
+Network errors and server errors are retried; a permanent client error (e.g.
+the finetune was deleted) or a finetune still unfinished after
+FINETUNE_TRACK_MAX_AGE ends the tracking and marks the job Failed.
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+
+import bfl_finetune
+from config import (
+    FINETUNE_TRACK_BACKOFF,
+    FINETUNE_TRACK_HISTORY,
+    FINETUNE_TRACK_INITIAL_DELAY,
+    FINETUNE_TRACK_MAX_AGE,
+    FINETUNE_TRACK_MAX_DELAY,
+    JOB_OWNER_TIMEOUT,
+)
+from downloads import PERMANENT_STATUS_CODES
+from finetune_catalog import TRAINING_STATUSES, get_finetune_catalog
+from instrumentation import get_logger, log_event, metrics
+from job_registry import get_job_registry, key_fingerprint
+from poller import normalize_progress
+
+logger = get_logger("finetune_tracker")
+
+
+class _TrackedFinetune:
+    def __init__(self, api_key: str, finetune_id: str, comment: str, started_at: float):
+        self.api_key = api_key
+        self.finetune_id = finetune_id
+        self.comment = comment
+        self.started_at = started_at
+        self.status = "Pending"
+        self.progress = None
+        self.error = None
+        self.attempt = 0
+        self.history = deque(maxlen=FINETUNE_TRACK_HISTORY)  # (time, status, progress) of every poll
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.status) and self.status not in TRAINING_STATUSES
+
+    def eta(self) -> float:
+        """
+        Estimated seconds of training left, None once finished or without a reported progress
+        """
+        if self.finished or not self.progress:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed * (1 - self.progress) / self.progress
+
+    def next_delay(self) -> float:
+        delay = min(FINETUNE_TRACK_INITIAL_DELAY * FINETUNE_TRACK_BACKOFF ** self.attempt, FINETUNE_TRACK_MAX_DELAY)
+        eta = self.eta()
+        if eta is not None:
+            delay = min(delay, max(FINETUNE_TRACK_INITIAL_DELAY, eta))
+        return delay
+
+    def summary(self) -> dict:
+        return {
+            "id": self.finetune_id,
+            "comment": self.comment,
+            "status": self.status,
+            "progress": self.progress,
+            "eta": self.eta(),
+            "error": self.error,
+            "started_at": self.started_at,
+            "history": list(self.history),
+        }
+
+
+class FinetuneTracker:
+    """
+    Single background loop polling every finetune still training, with per-finetune backoff
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._finetunes = {}  # finetune id -> _TrackedFinetune
+        self._schedule = []  # heap of (due time, finetune id)
+        self._versions = {}  # key fingerprint -> number of tracked status or progress changes
+        self._ready = {}  # key fingerprint -> number of finetunes that became Ready
+        self._resumed_keys = {}  # key fingerprint -> time of the last resume
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="finetune-tracker", daemon=True)
+            self._thread.start()
+
+    def track(self, api_key: str, finetune_id: str, comment: str = "", started_at: float = None):
+        """
+        Follow a finetune until it reaches a final status. Tracking an already tracked
+        finetune does nothing.
+        """
+        api_key = api_key.strip()
+        with self._lock:
+            if finetune_id in self._finetunes:
+                return
+            self._finetunes[finetune_id] = _TrackedFinetune(api_key, finetune_id, comment, started_at or time.time())
+            self._bump(api_key)
+            heapq.heappush(self._schedule, (time.time() + FINETUNE_TRACK_INITIAL_DELAY, finetune_id))
+            self._ensure_started()
+            self._wakeup.notify()
+        metrics.increment("finetune_tracker.tracked")
+
+    def resume(self, api_key: str) -> int:
+        """
+        Track the unfinished finetunes submitted with this API key by a process that stopped
+        (checked at most once per JOB_OWNER_TIMEOUT per key, so the finetunes of a crashed web
+        worker are picked up by another one). Finetunes are claimed in the job registry: each is
+        polled by a single process. Returns the number of resumed finetunes.
+        """
+        if not api_key or not api_key.strip():
+            return 0
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            if time.time() - self._resumed_keys.get(fingerprint, 0) < JOB_OWNER_TIMEOUT:
+                return 0
+            self._resumed_keys[fingerprint] = time.time()
+        jobs = get_job_registry().claim_unfinished("finetune", api_key=api_key, since=time.time() - FINETUNE_TRACK_MAX_AGE)
+        for job in jobs:
+            self.track(api_key, job["id"], job["params"].get("finetune_comment", ""), started_at=job["created_at"])
+        return len(jobs)
+
+    def finetunes(self, api_key: str) -> list:
+        """
+        Summaries of the finetunes tracked for this API key, most recently submitted first
+        """
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            tracked = [finetune for finetune in self._finetunes.values() if key_fingerprint(finetune.api_key) == fingerprint]
+            summaries = [finetune.summary() for finetune in tracked]
+        return sorted(summaries, key=lambda summary: summary["started_at"], reverse=True)
+
+    def get(self, finetune_id: str) -> dict:
+        with self._lock:
+            finetune = self._finetunes.get(finetune_id)
+            return finetune.summary() if finetune is not None else None
+
+    def version(self, api_key: str) -> int:
+        """
+        Counter increased whenever a finetune of this key is tracked or changes status or progress
+        """
+        return self._versions.get(key_fingerprint(api_key), 0)
+
+    def ready_count(self, api_key: str) -> int:
+        """
+        Number of tracked finetunes of this key that became Ready in this process
+        """
+        return self._ready.get(key_fingerprint(api_key), 0)
+
+    def _bump(self, api_key: str):
+        fingerprint = key_fingerprint(api_key)
+        self._versions[fingerprint] = self._versions.get(fingerprint, 0) + 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._schedule or self._schedule[0][0] > time.time():
+                    self._wakeup.wait(self._schedule[0][0] - time.time() if self._schedule else None)
+                _, finetune_id = heapq.heappop(self._schedule)
+                finetune = self._finetunes[finetune_id]
+            self._poll(finetune)
+            if not finetune.finished:
+                with self._lock:
+                    heapq.heappush(self._schedule, (time.time() + finetune.next_delay(), finetune_id))
+
+    def _poll(self, finetune: _TrackedFinetune):
+        if time.time() - finetune.started_at > FINETUNE_TRACK_MAX_AGE:
+            self._give_up(finetune, f"Still unfinished {FINETUNE_TRACK_MAX_AGE / 86400:g} days after submission")
+            return
+        try:
+            resp = bfl_finetune.finetune_progress(finetune.finetune_id, api_key=finetune.api_key)
+            status = resp.get("status") or finetune.status
+            progress = normalize_progress(resp.get("progress"))
+        except Exception as e:
+            if getattr(getattr(e, "response", None), "status_code", None) in PERMANENT_STATUS_CODES:
+                # Polling again cannot help (e.g. the finetune was deleted on the server)
+                self._give_up(finetune, str(e))
+                return
+            # Keep tracking: the next poll comes later, after the usual backoff
+            finetune.error = str(e)
+            finetune.attempt += 1
+            metrics.increment("finetune_tracker.errors")
+            log_event(logger, logging.WARNING, "Finetune progress poll failed", finetune_id=finetune.finetune_id, error=str(e))
+            return
+        metrics.increment("finetune_tracker.polls")
+        if status == "Ready":
+            progress = 1.0
+        elif progress is None:
+            progress = finetune.progress
+        changed = status != finetune.status or progress != finetune.progress
+        with self._lock:
+            finetune.history.append((time.time(), status, progress))
+            # Backoff restarts on status changes only: progress moves on every poll while training
+            finetune.attempt = 0 if status != finetune.status else finetune.attempt + 1
+            finetune.status = status
+            finetune.progress = progress
+            finetune.error = None
+            if changed:
+                self._bump(finetune.api_key)
+        if not changed:
+            return
+        registry = get_job_registry()
+        if not finetune.finished:
+            registry.update_job(finetune.finetune_id, status="Pending", progress=finetune.progress)
+            return
+        log_event(logger, logging.INFO, "Finetune finished", finetune_id=finetune.finetune_id, status=status)
+        if status == "Ready":
+            registry.update_job(finetune.finetune_id, status=status, progress=progress)
+            fingerprint = key_fingerprint(finetune.api_key)
+            with self._lock:
+                self._ready[fingerprint] = self._ready.get(fingerprint, 0) + 1
+        else:
+            registry.update_job(finetune.finetune_id, status=status, error=str(resp.get("details") or status))
+        get_finetune_catalog().invalidate(finetune.api_key)
+
+    def _give_up(self, finetune: _TrackedFinetune, error: str):
+        """
+        Stop tracking a finetune that cannot finish, recording it as Failed
+        """
+        with self._lock:
+            finetune.status = "Failed"
+            finetune.error = error
+            self._bump(finetune.api_key)
+        metrics.increment("finetune_tracker.abandoned")
+        log_event(logger, logging.WARNING, "Stopped tracking finetune", finetune_id=finetune.finetune_id, error=error)
+        get_job_registry().update_job(finetune.finetune_id, status="Failed", error=error)
+        get_finetune_catalog().invalidate(finetune.api_key)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_finetune_tracker() -> FinetuneTracker:
+    """
+    Get the process-wide finetune tracker, creating it on first use
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = FinetuneTracker()
+    return _tracker
@@ -1,6 +1,39 @@
+import os
 import gradio as gr
 import bfl_finetune
-from config import CAPTIONING_MODES, FINETUNE_TYPE, LORA_RANKS, PRIORITY
+from finetune_catalog import get_finetune_catalog
+from finetune_tracker import get_finetune_tracker
+from dataset_prep import format_report, max_resolution_for, preprocess_dataset
+from config import CAPTIONING_MODES, FINETUNE_MONITOR_INTERVAL, FINETUNE_TYPE, LORA_RANKS, PRIORITY, QUEUE_CONCURRENCY
+
+FINETUNE_TABLE_HEADERS = ["ID", "Comment", "Status", "Progress", "ETA"]
+
+
+def format_eta(seconds) -> str:
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
+
+def finetune_rows(api_key: str) -> list:
+    """
+    Rows of the finetune table: tracked finetunes first, with their live status, progress
+    and ETA, then the rest of the catalog
+    """
+    tracked = get_finetune_tracker().finetunes(api_key)
+    rows = []
+    for finetune in tracked:
+        progress = "" if finetune["progress"] is None else f"{finetune['progress']:.0%}"
+        status = finetune["status"] if not finetune["error"] else f"{finetune['status']} (last poll failed)"
+        rows.append([finetune["id"], finetune["comment"], status, progress, format_eta(finetune["eta"])])
+    tracked_ids = {finetune["id"] for finetune in tracked}
+    for item in get_finetune_catalog().get(api_key):
+        if item["id"] not in tracked_ids:
+            rows.append([item["id"], item["comment"], item["status"], "", ""])
+    return rows
 
 
 def create_finetuning_view(model_state: gr.State, api_key_input: gr.Textbox):
@@ -8,7 +41,10 @@ def create_finetuning_view(model_state: gr.State, api_key_input: gr.Textbox):
         with gr.Column(variant="panel", scale=1):
             gr.Markdown("# Your finetunes")
             list_button = gr.Button("List My Finetunes")
-            finetune_list_output = gr.Dataframe(headers=["ID", "Comment", "Status"], interactive=False)
+            finetune_list_output = gr.Dataframe(headers=FINETUNE_TABLE_HEADERS, interactive=False)
+            # Live status of the finetunes being trained, pushed while the tab is open
+            monitor_timer = gr.Timer(FINETUNE_MONITOR_INTERVAL)
+            monitor_version = gr.State(-1)
             selected_finetune = gr.Textbox(label="Selected Finetune ID", interactive=True)
             status_button = gr.Button("Check Status/Details")
             status_output = gr.Textbox(label="Finetune Status/Details", interactive=False)
@@ -26,10 +62,11 @@ def create_finetuning_view(model_state: gr.State, api_key_input: gr.Textbox):
             lr_input = gr.Slider(label="Learning rate", info="Learning rate for fine-tuning.", minimum=1e-6, maximum=5e-3, value=1e-4, interactive=True)
             use_captioning_input = gr.Checkbox(label="Use auto-captioning", info="Whether to enable captioning during finetuning.", value=False)
             priority_input = gr.Radio(label="Priority", info="Priority of the job.", choices=PRIORITY, value=list(PRIORITY.keys())[0], interactive=True)
+            preprocess_input = gr.Checkbox(label="Preprocess dataset", info="Downscale images to the training resolution, strip metadata and drop duplicates before uploading.", value=True)
             train_button = gr.Button(value="Train", variant="primary")
             train_status_box = gr.Textbox(label="Training Status", value="", interactive=False)
 
-    def train_callback(dataset, trigger_word, comment, type_val, rank_val, iterations, lr, use_captioning, priority, api_key):
+    def train_callback(dataset, trigger_word, comment, type_val, rank_val, iterations, lr, use_captioning, priority, preprocess, api_key):
         if not dataset or not api_key:
             return "Error: Please upload a dataset (ZIP) and provide an API key."
         try:
@@ -40,34 +77,64 @@ def create_finetuning_view(model_state: gr.State, api_key_input: gr.Textbox):
             type_val = finetune_type_map.get(type_val, type_val)
 
             zip_path = dataset.name
-            resp = bfl_finetune.request_finetuning(zip_path, comment, trigger_word, api_key=api_key, iterations=iterations, learning_rate=lr, captioning=use_captioning, priority=priority, finetune_type=type_val, lora_rank=rank_val)
+            prep_message = ""
+            if preprocess:
+                zip_path, report = preprocess_dataset(zip_path, max_side=max_resolution_for(priority))
+                if not report["images_out"]:
+                    os.remove(zip_path)
+                    return f"Error: no usable image in the dataset ({format_report(report)})"
+                prep_message = f"\nPreprocessing: {format_report(report)}"
+            try:
+                resp = bfl_finetune.request_finetuning(zip_path, comment, trigger_word, api_key=api_key, iterations=iterations, learning_rate=lr, captioning=use_captioning, priority=priority, finetune_type=type_val, lora_rank=rank_val)
+            finally:
+                if preprocess:
+                    os.remove(zip_path)
+            get_finetune_catalog().invalidate(api_key)
             finetune_id = resp.get("id", "unknown")
-            return f"Finetuning submitted (finetune id: {finetune_id})"
+            if "id" in resp:
+                get_finetune_tracker().track(api_key, finetune_id, comment)
+            return f"Finetuning submitted (finetune id: {finetune_id}){prep_message}"
         except Exception as e:
             return f"Error submitting finetuning: {e}"
 
     def list_finetunes(api_key):
+        if not api_key:
+            return [["Error", "Please provide an API key.", "", "", ""]]
         try:
-            resp = bfl_finetune.finetune_list(api_key=api_key)
-            if not isinstance(resp, dict) or "finetunes" not in resp:
-                # Show the error as a single row
-                return [["Error", str(resp), ""]]
-            rows = []
-            for item in resp.get("finetunes", []):
-                if isinstance(item, dict):
-                    rows.append([item.get("id", ""), item.get("finetune_comment", ""), item.get("status", "")])
-                else:
-                    rows.append([item, "", ""])
-            return rows
+            # Also follow the finetunes a previous run left training
+            get_finetune_tracker().resume(api_key)
+            # Served from the shared catalog, only new or training finetunes are fetched again
+            return finetune_rows(api_key)
         except Exception as e:
-            return [["Error", str(e), ""]]
+            # Show the error as a single row
+            return [["Error", str(e), "", "", ""]]
+
+    def refresh_monitor(api_key, seen_version):
+        # Only push a new table when a tracked finetune changed since the last push
+        if not api_key:
+            return gr.skip(), seen_version
+        version = get_finetune_tracker().version(api_key)
+        if version == seen_version or (seen_version == -1 and not version):
+            return gr.skip(), seen_version
+        try:
+            return finetune_rows(api_key), version
+        except Exception:
+            return gr.skip(), seen_version
 
     def status_finetune(finetune_id, api_key):
         if not finetune_id or not api_key:
             return "Please provide a finetune ID and API key."
         try:
             resp = bfl_finetune.finetune_details(finetune_id, api_key=api_key)
-            return str(resp)
+            tracked = get_finetune_tracker().get(finetune_id)
+            if tracked is None or not tracked["history"]:
+                return str(resp)
+            started_at = tracked["started_at"]
+            history = "\n".join(
+                f"+{(polled_at - started_at) / 60:.0f} min: {status}" + ("" if progress is None else f" {progress:.0%}")
+                for polled_at, status, progress in tracked["history"]
+            )
+            return f"{resp}\n\nProgress history:\n{history}"
         except Exception as e:
             return f"Error: {e}"
 
@@ -76,18 +143,23 @@ def create_finetuning_view(model_state: gr.State, api_key_input: gr.Textbox):
             return "Please provide a finetune ID and API key."
         try:
             resp = bfl_finetune.finetune_delete(finetune_id, api_key=api_key)
+            get_finetune_catalog().invalidate(api_key)
             return str(resp)
         except Exception as e:
             return f"Error: {e}"
 
     train_button.click(
         fn=train_callback,
-        inputs=[dataset, trigger_word_input, comment_input, type_input, rank_input, iteration_input, lr_input, use_captioning_input, priority_input, api_key_input],
+        inputs=[dataset, trigger_word_input, comment_input, type_input, rank_input, iteration_input, lr_input, use_captioning_input, priority_input, preprocess_input, api_key_input],
         outputs=train_status_box,
-        queue=False
+        # Preprocessing and upload are heavy: few at a time, the other submissions wait in the queue
+        concurrency_limit=QUEUE_CONCURRENCY["train"],
+        concurrency_id="train",
     )
-    list_button.click(fn=list_finetunes, inputs=[api_key_input], outputs=finetune_list_output)
-    status_button.click(fn=status_finetune, inputs=[selected_finetune, api_key_input], outputs=status_output)
-    delete_button.click(fn=delete_finetune, inputs=[selected_finetune, api_key_input], outputs=delete_output)
+    finetunes_queue = {"concurrency_limit": QUEUE_CONCURRENCY["finetunes"], "concurrency_id": "finetunes"}
+    list_button.click(fn=list_finetunes, inputs=[api_key_input], outputs=finetune_list_output, **finetunes_queue)
+    monitor_timer.tick(fn=refresh_monitor, inputs=[api_key_input, monitor_version], outputs=[finetune_list_output, monitor_version], show_progress="hidden", **finetunes_queue)
+    status_button.click(fn=status_finetune, inputs=[selected_finetune, api_key_input], outputs=status_output, **finetunes_queue)
+    delete_button.click(fn=delete_finetune, inputs=[selected_finetune, api_key_input], outputs=delete_output, **finetunes_queue)
 
     return finetuning_view
@@ -0,0 +1,83 @@
+import math
+import time
+import gradio as gr
+from config import AVAILABLE_MODELS, HISTORY_PAGE_SIZE, QUEUE_CONCURRENCY
+from output_store import get_output_store
+
+ALL_MODELS = "All models"
+MODEL_NAMES = {model_id: name for name, model_id in AVAILABLE_MODELS.items()}
+
+
+def format_record(record: dict) -> str:
+    """
+    Markdown summary of an archived image
+    """
+    lines = [
+        f"**Prompt:** {record['prompt'] or '(none)'}",
+        f"**Model:** {MODEL_NAMES.get(record['model_id'], record['model_id'])}",
+        f"**Seed:** {record['seed'] if record['seed'] is not None else 'random'}",
+    ]
+    if record["finetune_id"]:
+        lines.append(f"**Finetune:** {record['finetune_id']} (strength {record['params'].get('finetune_strength', 1.0)})")
+    params = record["params"]
+    if params.get("width") and params.get("height"):
+        lines.append(f"**Size:** {params['width']} × {params['height']}, {params.get('steps', '?')} steps, guidance {params.get('guidance_scale', '?')}")
+    lines.append(f"**Generated:** {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['created_at']))}")
+    lines.append(f"**File:** `{record['path']}` ({record['bytes'] / 1024:.0f} KiB)")
+    return "  \n".join(lines)
+
+
+def create_history_view(history_tab: gr.Tab):
+    with gr.Row() as history_view:
+        with gr.Column(variant="panel", scale=3):
+            with gr.Row(equal_height=True):
+                search_input = gr.Textbox(label="Search prompts", placeholder="Words of the prompt", scale=3)
+                model_filter = gr.Dropdown(label="Model", choices=[ALL_MODELS, *AVAILABLE_MODELS.keys()], value=ALL_MODELS, interactive=True)
+                search_button = gr.Button("Search")
+            history_gallery = gr.Gallery(
+                label="Past generations",
+                columns=8,
+                height=768,
+                object_fit="cover",
+                allow_preview=False,
+                interactive=False,
+            )
+            with gr.Row(equal_height=True):
+                previous_button = gr.Button("Previous page")
+                page_info = gr.Markdown("")
+                next_button = gr.Button("Next page")
+        with gr.Column(variant="panel", scale=1):
+            selected_image = gr.Image(label="Original", type="filepath", interactive=False)
+            selected_info = gr.Markdown("Select an image to see its original and generation settings.")
+    page_state = gr.State(0)
+    # IDs of the images on the current page, to resolve gallery selections
+    page_ids = gr.State([])
+
+    def load_page(query, model_name, page):
+        # Only the current page is queried, and only its thumbnails are sent to the browser
+        store = get_output_store()
+        model_id = AVAILABLE_MODELS.get(model_name)
+        total = store.count(query, model_id)
+        pages = max(1, math.ceil(total / HISTORY_PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+        records = store.search(query, model_id, limit=HISTORY_PAGE_SIZE, offset=page * HISTORY_PAGE_SIZE)
+        items = [(record["thumbnail_path"] or record["path"], record["prompt"][:80]) for record in records]
+        return items, f"Page {page + 1} / {pages} · {total} images", page, [record["id"] for record in records]
+
+    def show_record(ids, evt: gr.SelectData):
+        record = get_output_store().get(ids[evt.index]) if evt.index < len(ids) else None
+        if record is None:
+            return None, "Image not found."
+        return record["path"], format_record(record)
+
+    page_outputs = [history_gallery, page_info, page_state, page_ids]
+    history_queue = {"concurrency_limit": QUEUE_CONCURRENCY["history"], "concurrency_id": "history"}
+    history_tab.select(fn=load_page, inputs=[search_input, model_filter, page_state], outputs=page_outputs, **history_queue)
+    search_button.click(fn=lambda query, model_name: load_page(query, model_name, 0), inputs=[search_input, model_filter], outputs=page_outputs, **history_queue)
+    search_input.submit(fn=lambda query, model_name: load_page(query, model_name, 0), inputs=[search_input, model_filter], outputs=page_outputs, **history_queue)
+    model_filter.change(fn=lambda query, model_name: load_page(query, model_name, 0), inputs=[search_input, model_filter], outputs=page_outputs, **history_queue)
+    previous_button.click(fn=lambda query, model_name, page: load_page(query, model_name, page - 1), inputs=[search_input, model_filter, page_state], outputs=page_outputs, **history_queue)
+    next_button.click(fn=lambda query, model_name, page: load_page(query, model_name, page + 1), inputs=[search_input, model_filter, page_state], outputs=page_outputs, **history_queue)
+    history_gallery.select(fn=show_record, inputs=[page_ids], outputs=[selected_image, selected_info], **history_queue)
+
+    return history_view
@@ -0,0 +1,150 @@
+"""
+Shared HTTP client layer for the BFL API.
+
+Every module talking to the API goes through `get_session` so that submits,
+polls and downloads reuse pooled keep-alive connections instead of opening a
+new TCP+TLS connection per request.
+
+`get_async_client` is the asyncio counterpart used by the `a*` coroutines, so a
+single event loop can keep many tasks in flight without a thread per task.
+
+requests and httpx are only imported when the first session or client is built:
+sync callers never load httpx, async callers only load what they use.
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+from config import API_BASE_URL, HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF_FACTOR
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_probe_session = None
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+
+def api_url(path: str) -> str:
+    """
+    Build the full URL of a BFL API route, e.g. api_url("get_result")
+    """
+    return f"{API_BASE_URL.rstrip('/')}/v1/{path.lstrip('/')}"
+
+
+def _build_session(api_key: str = None, pool_size: int = HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, retries: int = HTTP_RETRIES) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # Default timeout of every request, still overridable per call
+    session.request = functools.partial(session.request, timeout=timeout)
+    # POST submits are only retried on connection errors (nothing was sent), never on
+    # read errors or 5xx, so a task is never paid for twice.
+    retry = Retry(
+        total=retries,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept"] = "application/json"
+    if api_key:
+        session.headers["X-Key"] = api_key
+    return session
+
+
+def get_session(api_key: str = None) -> "requests.Session":
+    """
+    Get the pooled session for the given API key, creating it on first use.
+    Without an API key, returns an anonymous session (used for signed delivery URLs,
+    which must never receive the key).
+    """
+    key = api_key.strip() if api_key else None
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session(key)
+                _sessions[key] = session
+    return session
+
+
+def get_probe_session() -> "requests.Session":
+    """
+    Get the anonymous session of the region health probes (see endpoints.py), creating it on
+    first use. It never retries: a failed probe counts at once and its round trip has no backoff in it.
+    """
+    global _probe_session
+    with _sessions_lock:
+        if _probe_session is None:
+            _probe_session = _build_session(retries=0)
+    return _probe_session
+
+
+def close_sessions():
+    """
+    Close every pooled session and drop their connections
+    """
+    global _probe_session
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        if _probe_session is not None:
+            _probe_session.close()
+            _probe_session = None
+
+
+def _build_async_client(api_key: str = None, pool_size: int = HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, retries: int = HTTP_RETRIES) -> "httpx.AsyncClient":
+    import httpx
+
+    connect_timeout, read_timeout = timeout
+    headers = {"Accept": "application/json"}
+    if api_key:
+        headers["X-Key"] = api_key
+    # httpx transport retries only cover connection failures, so submits stay safe to retry
+    transport = httpx.AsyncHTTPTransport(
+        retries=retries,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    )
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        transport=transport,
+        follow_redirects=True,
+    )
+
+
+def get_async_client(api_key: str = None) -> "httpx.AsyncClient":
+    """
+    Get the pooled async client for the given API key on the running event loop.
+    Without an API key, returns an anonymous client (used for signed delivery URLs).
+    """
+    loop = asyncio.get_running_loop()
+    key = api_key.strip() if api_key else None
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(key)
+    if client is None or client.is_closed:
+        client = _build_async_client(key)
+        clients[key] = client
+    return client
+
+
+async def aclose_async_clients():
+    """
+    Close every async client bound to the running event loop
+    """
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
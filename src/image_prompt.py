@@ -0,0 +1,107 @@
+"""
+Encoding of image prompts (Redux) for generation requests.
+
+The API only needs the reference image at a limited resolution, so image
+prompts are downscaled and sent as JPEG rather than full-size lossless PNG.
+Encoded prompts are kept in a small in-memory LRU keyed by a hash of the
+source content: batches and repeat generations with the same reference image
+reuse the encoded string instead of decoding and encoding it again.
+"""
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from config import IMAGE_PROMPT_CACHE_SIZE, IMAGE_PROMPT_JPEG_QUALITY, IMAGE_PROMPT_MAX_SIDE
+from instrumentation import metrics, span
+
+_encoded = OrderedDict()  # content hash -> base64 string, least recently used first
+_lock = threading.Lock()
+_key_locks = {}  # content hash -> [lock held while it is being encoded, requests using it]
+
+
+def _content_hash(image) -> str:
+    """
+    Hash of the source image: file bytes for a path, pixels otherwise
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return f"file:{digest.hexdigest()}"
+    from PIL import Image
+
+    if isinstance(image, Image.Image):
+        digest.update(f"{image.mode}:{image.size}:".encode())
+    else:
+        # numpy array, as passed by a gr.Image of type "numpy"
+        digest.update(f"{image.dtype}:{image.shape}:".encode())
+    digest.update(image.tobytes())
+    return f"pixels:{digest.hexdigest()}"
+
+
+def _encode(image, max_side: int, quality: int) -> str:
+    from PIL import Image, ImageOps
+
+    if isinstance(image, str):
+        image = ImageOps.exif_transpose(Image.open(image))
+    elif not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        # JPEG has no alpha channel: flatten on white
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+def encode_image_prompt(image, max_side: int = IMAGE_PROMPT_MAX_SIDE, quality: int = IMAGE_PROMPT_JPEG_QUALITY) -> str:
+    """
+    Base64 JPEG of an image prompt, downscaled to max_side.
+    Accepts a file path, a PIL Image or a numpy array; any other string is assumed to be
+    already encoded and returned as is. Returns None for an empty image prompt.
+    """
+    if image is None or (isinstance(image, str) and not image):
+        return None
+    if isinstance(image, str) and not os.path.isfile(image):
+        return image
+    key = f"{_content_hash(image)}:{max_side}:{quality}"
+    with _lock:
+        if key in _encoded:
+            _encoded.move_to_end(key)
+            metrics.increment("image_prompt.hits")
+            return _encoded[key]
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        # Concurrent requests with the same reference wait for a single encoding
+        with entry[0]:
+            with _lock:
+                if key in _encoded:
+                    _encoded.move_to_end(key)
+                    metrics.increment("image_prompt.hits")
+                    return _encoded[key]
+            with span("image_prompt_encode"):
+                encoded = _encode(image, max_side, quality)
+            metrics.increment("image_prompt.misses")
+            with _lock:
+                _encoded[key] = encoded
+                while len(_encoded) > IMAGE_PROMPT_CACHE_SIZE:
+                    _encoded.popitem(last=False)
+        return encoded
+    finally:
+        with _lock:
+            # The last request waiting on the key drops its lock, whether it hit, missed or failed
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[key]
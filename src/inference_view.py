@@ -1,7 +1,44 @@
+import asyncio
 import gradio as gr
-from config import MAX_SEED, AVAILABLE_MODELS
-from api_utils import generate_image
-import bfl_finetune
+from config import MAX_SEED, AVAILABLE_MODELS, BATCH_MAX_SIZE, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, EVAL_MAX_SEEDS, FINETUNE_MONITOR_INTERVAL, QUEUE_CONCURRENCY, UI_STATUS_INTERVAL
+from batch import agenerate_batch, expand_jobs
+from sweep import SWEEP_PARAMETERS, agenerate_sweep, contact_sheet, format_value, parse_values, save_contact_sheet, sweep_jobs
+from finetune_catalog import get_finetune_catalog
+from finetune_eval import aevaluate, comparison_sheet, evaluation_jobs, save_comparison_sheet
+from finetune_tracker import get_finetune_tracker
+from instrumentation import format_metrics
+from result_cache import get_result_cache
+
+
+def format_cache_stats():
+    stats = get_result_cache().stats()
+    return f"Result cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes'] / 1024**2:.1f} MB)"
+
+
+def format_generation_status(statuses: list) -> str:
+    """
+    One-line summary of the (stage, progress) of every job; None for jobs not started yet
+    """
+    if len(statuses) == 1:
+        stage, progress = statuses[0] or ("waiting", None)
+        if stage == "generating" and progress is not None:
+            return f"Generating... {progress:.0%}"
+        return {"waiting": "Waiting for a free slot...", "submitting": "Submitting...", "queued": "Queued by the API...",
+                "generating": "Generating...", "downloading": "Downloading...", "done": "Done", "failed": "Failed"}[stage]
+    counts = {}
+    total_progress = 0.0
+    for status in statuses:
+        stage, progress = status or ("waiting", None)
+        counts[stage] = counts.get(stage, 0) + 1
+        if stage in ("downloading", "done"):
+            total_progress += 1
+        elif stage == "generating" and progress is not None:
+            total_progress += progress
+    parts = [f"**{total_progress / len(statuses):.0%}**", f"{counts.get('done', 0)}/{len(statuses)} done"]
+    for stage in ("downloading", "generating", "queued", "submitting", "waiting", "failed"):
+        if counts.get(stage):
+            parts.append(f"{counts[stage]} {stage}")
+    return " · ".join(parts)
 
 
 def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
@@ -70,6 +107,50 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
                         value=-1,
                         interactive=True,
                     )
+                    bypass_cache_input = gr.Checkbox(
+                        label="Bypass result cache",
+                        info="Fixed-seed results are reused from the local cache without spending API credits. If active, always call the API.",
+                        value=False,
+                        interactive=True,
+                    )
+
+                with gr.Column() as batch_settings:
+                    gr.Markdown("## Batch settings")
+                    batch_count_input = gr.Slider(
+                        label="Images per prompt",
+                        info="With a fixed seed, the batch sweeps seeds (seed, seed + 1, ...).",
+                        minimum=1,
+                        maximum=BATCH_MAX_SIZE,
+                        value=1,
+                        step=1,
+                        interactive=True,
+                    )
+                    split_prompt_lines_input = gr.Checkbox(
+                        label="One prompt per line",
+                        info="If active, every line of the prompt is generated as a separate prompt.",
+                        value=False,
+                        interactive=True,
+                    )
+                    batch_concurrency_input = gr.Slider(
+                        label="Concurrency",
+                        info="Maximum number of generations running at the same time.",
+                        minimum=1,
+                        maximum=BATCH_MAX_CONCURRENCY,
+                        value=BATCH_CONCURRENCY,
+                        step=1,
+                        interactive=True,
+                    )
+
+                with gr.Accordion("Parameter sweep", open=False) as sweep_settings:
+                    gr.Markdown(
+                        "Generate every combination of the values below, with one seed, and compare them on a contact sheet. "
+                        "Enter values as `2, 3, 4` or as a range `2:4:5` (5 values from 2 to 4). Empty fields use the settings above."
+                    )
+                    sweep_guidance_input = gr.Textbox(label="Guidance scale values", placeholder="2:4:5", max_lines=1)
+                    sweep_steps_input = gr.Textbox(label="Steps values", placeholder="20, 30, 40", max_lines=1)
+                    sweep_interval_input = gr.Textbox(label="Interval values", placeholder="1, 2, 3", max_lines=1)
+                    sweep_strength_input = gr.Textbox(label="Finetune strength values", placeholder="0.6:1.4:5", max_lines=1)
+                    sweep_button = gr.Button("Run sweep")
 
                 with gr.Column() as finetune_settings:
                     gr.Markdown("## Finetune settings")
@@ -92,6 +173,29 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
                     )
                     finetune_error_box = gr.Textbox(label="Finetune Error", value="", interactive=False, visible=True)
 
+                    with gr.Accordion("Compare finetunes", open=False):
+                        gr.Markdown(
+                            "Render a set of prompts with several finetunes and strengths, with pinned seeds, and compare them side by side. "
+                            "Images rendered by an earlier comparison are reused, so extending one only generates the new images."
+                        )
+                        compare_finetunes_input = gr.Dropdown(
+                            label="Finetunes to compare", choices=[], multiselect=True, allow_custom_value=True, interactive=True
+                        )
+                        compare_strengths_input = gr.Textbox(label="Strength values", value="1", placeholder="0.8, 1, 1.2", max_lines=1)
+                        compare_prompts_input = gr.TextArea(
+                            label="Prompts, one per line", placeholder="Leave empty to use the prompt of the Generate box", lines=3
+                        )
+                        compare_seeds_input = gr.Slider(
+                            label="Seeds per prompt",
+                            info="With a random seed (-1), seeds are derived from each prompt and stay the same across comparisons.",
+                            minimum=1,
+                            maximum=EVAL_MAX_SEEDS,
+                            value=1,
+                            step=1,
+                            interactive=True,
+                        )
+                        compare_button = gr.Button("Compare finetunes")
+
                     def show_element_if_not_empty(s: str):
                         return gr.update(visible=bool(s.strip()))
 
@@ -116,22 +220,52 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
 
                     # Populate the dropdown with available finetunes
                     def get_finetune_choices(api_key):
+                        if not api_key:
+                            return [], "Error: Please enter your API key"
                         try:
-                            resp = bfl_finetune.finetune_list(api_key=api_key)
-                            if not isinstance(resp, dict) or "finetunes" not in resp:
-                                return [], f"Error: {resp}"
-                            return [item.get("id", "") if isinstance(item, dict) else item for item in resp.get("finetunes", [])], ""
+                            return get_finetune_catalog().ids(api_key), ""
                         except Exception as e:
                             return [], f"Error: {e}"
 
                     def update_dropdown_and_clear(selected_choices, error_msg):
                         # If there are choices, set the value to the first one; otherwise, clear the value
-                        return gr.update(choices=selected_choices, value=selected_choices[0] if selected_choices else None), error_msg
+                        return (
+                            gr.update(choices=selected_choices, value=selected_choices[0] if selected_choices else None),
+                            gr.update(choices=selected_choices),
+                            error_msg,
+                        )
 
                     refresh_finetunes_btn.click(
                         lambda api_key: update_dropdown_and_clear(*get_finetune_choices(api_key)),
                         inputs=[api_key_input],
-                        outputs=[finetune_dropdown, finetune_error_box]
+                        outputs=[finetune_dropdown, compare_finetunes_input, finetune_error_box],
+                        concurrency_limit=QUEUE_CONCURRENCY["finetunes"],
+                        concurrency_id="finetunes",
+                    )
+
+                    # Add finetunes to the dropdown as soon as the tracker sees them become Ready
+                    finetune_ready_timer = gr.Timer(FINETUNE_MONITOR_INTERVAL)
+                    finetune_ready_count = gr.State(0)
+
+                    def refresh_ready_finetunes(api_key, seen_count):
+                        if not api_key:
+                            return gr.skip(), gr.skip(), seen_count
+                        ready_count = get_finetune_tracker().ready_count(api_key)
+                        if ready_count == seen_count:
+                            return gr.skip(), gr.skip(), seen_count
+                        choices, _ = get_finetune_choices(api_key)
+                        if not choices:
+                            return gr.skip(), gr.skip(), seen_count
+                        # Only the choices change, the current selection is kept
+                        return gr.update(choices=choices), gr.update(choices=choices), ready_count
+
+                    finetune_ready_timer.tick(
+                        refresh_ready_finetunes,
+                        inputs=[api_key_input, finetune_ready_count],
+                        outputs=[finetune_dropdown, compare_finetunes_input, finetune_ready_count],
+                        show_progress="hidden",
+                        concurrency_limit=QUEUE_CONCURRENCY["finetunes"],
+                        concurrency_id="finetunes",
                     )
 
                 with gr.Column(visible=False) as ultra_settings:
@@ -145,13 +279,18 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
 
             with gr.Column(variant="panel", scale=3) as main_column:
                 infer_gallery = gr.Gallery(
-                    format="png",
                     label="Results",
                     interactive=False,
                     object_fit="contain",
                     height=768,
                     elem_classes=["resizable_vertical"],
                 )
+                generation_status_output = gr.Markdown("")
+                cache_stats_output = gr.Markdown(format_cache_stats())
+                with gr.Accordion("Client metrics", open=False):
+                    metrics_output = gr.Markdown(format_metrics())
+                    refresh_metrics_btn = gr.Button("Refresh metrics")
+                    refresh_metrics_btn.click(format_metrics, outputs=metrics_output)
                 with gr.Row(equal_height=True):
                     prompt_input = gr.TextArea(
                         label="Prompt",
@@ -161,12 +300,13 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
                     )
                     generate_button = gr.Button(value="Generate", variant="primary")
                 ip_input = gr.Image(
+                    type="filepath",
                     label="Image prompt (Redux)",
                     interactive=True,
                     sources=["upload", "clipboard"],
                 )
 
-        def generate_images(
+        async def generate_images(
             model_name,
             api_key,
             prompt,
@@ -180,34 +320,228 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
             finetune_strength,
             use_raw_mode,
             prompt_upsample,
-            interval
+            interval,
+            batch_count,
+            split_prompt_lines,
+            batch_concurrency,
+            bypass_cache
         ):
             if not api_key:
                 raise gr.Error("Please enter your API key")
-            if not prompt:
+            if not prompt or not prompt.strip():
                 raise gr.Error("Please enter a prompt")
 
+            jobs = expand_jobs(prompt, seed, batch_count, split_prompt_lines)
+            if len(jobs) > BATCH_MAX_SIZE:
+                raise gr.Error(f"Batch too large: {len(jobs)} images requested, the maximum is {BATCH_MAX_SIZE}")
+
+            results = [None] * len(jobs)
+
+            def batch(on_status):
+                return agenerate_batch(
+                    jobs,
+                    concurrency=batch_concurrency,
+                    on_status=on_status,
+                    api_key=api_key,
+                    model_id=AVAILABLE_MODELS[model_name],
+                    width=width,
+                    height=height,
+                    steps=steps,
+                    guidance_scale=guidance_scale,
+                    image_prompt=image_prompt,
+                    finetune_id=finetune_id,
+                    finetune_strength=finetune_strength,
+                    use_raw_mode=use_raw_mode,
+                    prompt_upsample=prompt_upsample,
+                    interval=interval,
+                    use_cache=not bypass_cache
+                )
+
+            def label(job):
+                text = job["prompt"] if len(jobs) > 1 else "Generated image"
+                return f"{text} (seed {job['seed']})" if job["seed"] != -1 else text
+
+            async for update in stream_batch(jobs, results, batch, label):
+                yield update
+
+        async def stream_batch(jobs, results, batch, label):
+            """
+            Run batch(on_status) (an agenerate_batch iterator) and stream (gallery, status) updates as it
+            goes. The images of jobs[i] are stored in results[i], labeled label(job).
+            """
+            statuses = [None] * len(jobs)
+            errors = []
+            changed = asyncio.Event()
+
+            def on_status(index, stage, progress):
+                statuses[index] = (stage, progress)
+                changed.set()
+
+            async def run_batch():
+                async for index, job, images, error in batch(on_status):
+                    if error is not None:
+                        errors.append(error)
+                        statuses[index] = ("failed", None)
+                        gr.Warning(f"Generation {index + 1}/{len(jobs)} failed: {str(error)}")
+                    else:
+                        results[index] = [(img, label(job)) for img in images]
+                    changed.set()
+
+            # Status updates and finished images are streamed to the UI, in job order, as they come
+            batch_task = asyncio.create_task(run_batch())
             try:
-                model_id = AVAILABLE_MODELS[model_name]
-                images = generate_image(
+                while True:
+                    status_changed = asyncio.ensure_future(changed.wait())
+                    await asyncio.wait({batch_task, status_changed}, return_when=asyncio.FIRST_COMPLETED)
+                    status_changed.cancel()
+                    changed.clear()
+                    yield [item for items in results if items for item in items], format_generation_status(statuses)
+                    if batch_task.done():
+                        break
+                    # Coalesce bursts of updates from concurrent jobs
+                    await asyncio.sleep(UI_STATUS_INTERVAL)
+                batch_task.result()
+            finally:
+                batch_task.cancel()
+
+            if len(errors) == len(jobs):
+                raise gr.Error(f"Failed to generate images: {str(errors[0])}")
+
+        async def run_sweep(
+            model_name,
+            api_key,
+            prompt,
+            width,
+            height,
+            steps,
+            guidance_scale,
+            seed,
+            image_prompt,
+            finetune_id,
+            finetune_strength,
+            use_raw_mode,
+            prompt_upsample,
+            interval,
+            bypass_cache,
+            *sweep_specs
+        ):
+            if not api_key:
+                raise gr.Error("Please enter your API key")
+            if not prompt or not prompt.strip():
+                raise gr.Error("Please enter a prompt")
+            try:
+                axes = {name: parse_values(name, spec) for name, spec in zip(SWEEP_PARAMETERS, sweep_specs)}
+                axes = {name: values for name, values in axes.items() if values}
+                if "finetune_strength" in axes and not (finetune_id or "").strip():
+                    raise ValueError("Sweeping the finetune strength needs a finetune ID")
+                jobs = sweep_jobs(prompt.strip(), seed, axes)
+            except ValueError as e:
+                raise gr.Error(str(e))
+
+            results = [None] * len(jobs)
+
+            def batch(on_status):
+                return agenerate_sweep(
+                    jobs,
+                    on_status=on_status,
                     api_key=api_key,
-                    model_id=model_id,
-                    prompt=prompt,
+                    model_id=AVAILABLE_MODELS[model_name],
                     width=width,
                     height=height,
                     steps=steps,
                     guidance_scale=guidance_scale,
-                    seed=seed,
                     image_prompt=image_prompt,
                     finetune_id=finetune_id,
                     finetune_strength=finetune_strength,
                     use_raw_mode=use_raw_mode,
                     prompt_upsample=prompt_upsample,
+                    interval=interval,
+                    use_cache=not bypass_cache
+                )
+
+            def label(job):
+                return " · ".join(format_value(name, job[name]) for name in axes)
+
+            async for update in stream_batch(jobs, results, batch, label):
+                yield update
+
+            # The sheet is composed off the event loop: decoding the cells takes a moment
+            images = [items[0][0] if items else None for items in results]
+            sheet = await asyncio.to_thread(
+                lambda: save_contact_sheet(contact_sheet(jobs, images, axes, aspect_ratio=height / width))
+            )
+            yield (
+                [(sheet, "Contact sheet")] + [item for items in results if items for item in items],
+                f"{sum(1 for items in results if items)}/{len(jobs)} done (seed {jobs[0]['seed']}) · contact sheet saved to `{sheet}`",
+            )
+
+        def finetune_names(api_key):
+            """
+            Comments of the key's finetunes ({id: comment}), to name the comparison columns
+            """
+            try:
+                return {finetune["id"]: finetune["comment"] for finetune in get_finetune_catalog().get(api_key) if finetune["comment"]}
+            except Exception:
+                return {}
+
+        async def compare_finetunes(
+            api_key,
+            prompt,
+            width,
+            height,
+            steps,
+            guidance_scale,
+            seed,
+            use_raw_mode,
+            prompt_upsample,
+            interval,
+            bypass_cache,
+            finetune_ids,
+            strengths_spec,
+            prompts,
+            seeds_per_prompt
+        ):
+            if not api_key:
+                raise gr.Error("Please enter your API key")
+            try:
+                strengths = parse_values("finetune_strength", strengths_spec)
+                jobs = evaluation_jobs((prompts or prompt or "").splitlines(), finetune_ids or [], strengths, seeds_per_prompt, seed)
+            except ValueError as e:
+                raise gr.Error(str(e))
+
+            results = [None] * len(jobs)
+            names = await asyncio.to_thread(finetune_names, api_key)
+
+            def batch(on_status):
+                return aevaluate(
+                    jobs,
+                    api_key,
+                    on_status=on_status,
+                    use_cache=not bypass_cache,
+                    width=width,
+                    height=height,
+                    steps=steps,
+                    guidance_scale=guidance_scale,
+                    use_raw_mode=use_raw_mode,
+                    prompt_upsample=prompt_upsample,
                     interval=interval
                 )
-                return [(img, f"Generated image {i+1}") for i, img in enumerate(images)]
-            except Exception as e:
-                raise gr.Error(f"Failed to generate images: {str(e)}")
+
+            def label(job):
+                name = names.get(job["finetune_id"]) or job["finetune_id"]
+                return f"{name} · Strength {job['finetune_strength']:g} · {job['prompt']} (seed {job['seed']})"
+
+            async for update in stream_batch(jobs, results, batch, label):
+                yield update
+
+            images = [items[0][0] if items else None for items in results]
+            sheet = await asyncio.to_thread(
+                lambda: save_comparison_sheet(comparison_sheet(jobs, images, names, aspect_ratio=height / width))
+            )
+            yield (
+                [(sheet, "Comparison")] + [item for items in results if items for item in items],
+                f"{sum(1 for items in results if items)}/{len(jobs)} done · comparison saved to `{sheet}`",
+            )
 
         generate_button.click(
             fn=generate_images,
@@ -226,9 +560,68 @@ def create_inference_view(model_state: gr.State, api_key_input: gr.Textbox):
                 use_raw_mode_input,
                 prompt_upsample_input,
                 interval_input,
+                batch_count_input,
+                split_prompt_lines_input,
+                batch_concurrency_input,
+                bypass_cache_input,
+            ],
+            outputs=[infer_gallery, generation_status_output],
+            # Handlers are async and mostly wait on the API: many clicks can run at once
+            concurrency_limit=QUEUE_CONCURRENCY["generate"],
+            concurrency_id="generate",
+        ).then(format_cache_stats, outputs=cache_stats_output)
+
+        sweep_button.click(
+            fn=run_sweep,
+            inputs=[
+                model_state,
+                api_key_input,
+                prompt_input,
+                width_input,
+                height_input,
+                steps_input,
+                guidance_input,
+                seed_input,
+                ip_input,
+                finetune_id_input,
+                finetune_strength_input,
+                use_raw_mode_input,
+                prompt_upsample_input,
+                interval_input,
+                bypass_cache_input,
+                sweep_guidance_input,
+                sweep_steps_input,
+                sweep_interval_input,
+                sweep_strength_input,
+            ],
+            outputs=[infer_gallery, generation_status_output],
+            concurrency_limit=QUEUE_CONCURRENCY["generate"],
+            concurrency_id="generate",
+        ).then(format_cache_stats, outputs=cache_stats_output)
+
+        compare_button.click(
+            fn=compare_finetunes,
+            inputs=[
+                api_key_input,
+                prompt_input,
+                width_input,
+                height_input,
+                steps_input,
+                guidance_input,
+                seed_input,
+                use_raw_mode_input,
+                prompt_upsample_input,
+                interval_input,
+                bypass_cache_input,
+                compare_finetunes_input,
+                compare_strengths_input,
+                compare_prompts_input,
+                compare_seeds_input,
             ],
-            outputs=infer_gallery,
-        )
+            outputs=[infer_gallery, generation_status_output],
+            concurrency_limit=QUEUE_CONCURRENCY["generate"],
+            concurrency_id="generate",
+        ).then(format_cache_stats, outputs=cache_stats_output)
 
     # Show Ultra settings iff the model is Flux Pro 1.1 Ultra
     model_state.change(
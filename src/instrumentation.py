@@ -0,0 +1,181 @@
+"""
+Structured logging and lightweight metrics for the API client.
+
+- `get_logger` returns loggers under the "flux_pro_gui" namespace. `log_event`
+  attaches key=value fields, redacting API keys and truncating long values
+  (e.g. base64 image prompts), and does no work at all when the level is disabled.
+- Counters and histograms are kept in memory; `span` times a phase (submit,
+  queue wait, generation, download, decode, ...) into the histogram of the same name.
+
+Set the log level with the FLUX_GUI_LOG_LEVEL environment variable.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import LOG_MAX_FIELD_LENGTH
+
+ROOT_LOGGER = "flux_pro_gui"
+REDACTED_KEYS = ("x-key", "api_key", "authorization")
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}" if name else ROOT_LOGGER)
+
+
+def redact(value, max_length: int = LOG_MAX_FIELD_LENGTH):
+    """
+    Copy of a (nested) value safe to log: secrets replaced, long strings truncated
+    """
+    if isinstance(value, dict) or hasattr(value, "items"):
+        return {
+            key: "***" if str(key).lower() in REDACTED_KEYS else redact(item, max_length)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, max_length) for item in value]
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > max_length:
+        return f"{value[:max_length]}... ({len(value)} chars)"
+    return value
+
+
+def log_event(logger: logging.Logger, level: int, message: str, **fields):
+    """
+    Log a message with structured fields, redacted and truncated only if the level is enabled
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": redact(fields)})
+
+
+class _FieldsFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(level: str = None):
+    """
+    Send the client logs to stderr, at FLUX_GUI_LOG_LEVEL (WARNING by default)
+    """
+    level = level or os.environ.get("FLUX_GUI_LOG_LEVEL", "WARNING")
+    logger = get_logger()
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(_FieldsFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    In-memory counters and histograms
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time the enclosed block into the `name` histogram (also usable inside coroutines)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(name, time.perf_counter() - start)
+
+
+def format_metrics() -> str:
+    """
+    Markdown table of the current metrics
+    """
+    snapshot = metrics.snapshot()
+    lines = ["| Phase | Count | Mean (s) | p50 (s) | p95 (s) | Max (s) |", "|---|---|---|---|---|---|"]
+    for name, summary in sorted(snapshot["histograms"].items()):
+        lines.append(
+            f"| {name} | {summary['count']} | {summary['mean']:.3f} | {summary['p50']:.3f} | {summary['p95']:.3f} | {summary['max']:.3f} |"
+        )
+    counters = ", ".join(f"{name}: {value}" for name, value in sorted(snapshot["counters"].items()))
+    return "\n".join(lines) + (f"\n\n{counters}" if counters else "")
@@ -0,0 +1,236 @@
+"""
+Persistent local registry of submitted generations and finetunes.
+
+Every task or finetune ID returned by the API is recorded in an embedded SQLite
+database with its parameters, status, timestamps, result URL and local file,
+so nothing is lost when the process restarts mid-poll. API keys are never
+stored, only a short fingerprint used to resume a key's unfinished tasks.
+
+Several processes may share the registry (e.g. the web workers started by
+serve.py). Each job is owned by the process that submitted it; processes
+heartbeat while they run, and only the unfinished jobs of processes that went
+silent are claimed by another one, so a task is never tracked twice.
+"""
+import atexit
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from config import JOB_OWNER_HEARTBEAT, JOB_OWNER_TIMEOUT, JOB_REGISTRY_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key_fingerprint TEXT,
+    model_id TEXT,
+    params TEXT,
+    status TEXT NOT NULL,
+    progress REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result_url TEXT,
+    local_path TEXT,
+    error TEXT,
+    polling_url TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_kind_created ON jobs (kind, created_at);
+CREATE TABLE IF NOT EXISTS owners (
+    owner TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+# Columns added after the first release, created on older registries
+ADDED_COLUMNS = {"polling_url": "TEXT", "owner": "TEXT"}
+
+UPDATABLE_FIELDS = ("status", "progress", "result_url", "local_path", "error")
+# Statuses of jobs that may still complete
+UNFINISHED_STATUSES = ("Pending",)
+
+
+def key_fingerprint(api_key: str) -> str:
+    """
+    Short, non-reversible identifier of an API key
+    """
+    return hashlib.sha256(api_key.strip().encode()).hexdigest()[:16]
+
+
+class JobRegistry:
+    """
+    SQLite-backed store of generation ("generation") and finetune ("finetune") jobs
+    """
+
+    def __init__(self, path: str = JOB_REGISTRY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        for name, column_type in ADDED_COLUMNS.items():
+            if name not in columns:
+                self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+        self._heartbeat_thread = None
+
+    def _execute(self, query: str, args=()):
+        with self._lock:
+            return self._connection.execute(query, args).fetchall()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        return job
+
+    @property
+    def owner(self) -> str:
+        # Read on every use: a forked child is a different owner
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def heartbeat(self):
+        """
+        Mark this process as alive, and keep doing so in the background from now on
+        """
+        self._execute("INSERT OR REPLACE INTO owners (owner, heartbeat) VALUES (?, ?)", (self.owner, time.time()))
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="job-registry-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+            # On a clean exit, other processes may take over the unfinished jobs right away
+            atexit.register(self._execute, "DELETE FROM owners WHERE owner = ?", (self.owner,))
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_OWNER_HEARTBEAT)
+            try:
+                self._execute("INSERT OR REPLACE INTO owners (owner, heartbeat) VALUES (?, ?)", (self.owner, time.time()))
+                self._execute("DELETE FROM owners WHERE heartbeat < ?", (time.time() - 24 * 3600,))
+            except sqlite3.Error:
+                # Database busy: the next heartbeat comes well before the owner times out
+                pass
+
+    def record_job(self, job_id: str, kind: str, api_key: str = None, model_id: str = None, params: dict = None, status: str = "Pending", polling_url: str = None):
+        """
+        Record a newly submitted job, owned by this process, with the URL its result is polled
+        at when the API gave one
+        """
+        if self._heartbeat_thread is None:
+            self.heartbeat()
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO jobs (id, kind, key_fingerprint, model_id, params, status, created_at, updated_at, polling_url, owner) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, key_fingerprint(api_key) if api_key else None, model_id, json.dumps(params or {}), status, now, now, polling_url, self.owner),
+        )
+
+    def claim_unfinished(self, kind: str, api_key: str = None, since: float = None) -> list:
+        """
+        Take over the unfinished jobs whose owner process stopped (or that have none), most
+        recent first. Jobs of live processes, including this one, are left to them.
+        """
+        self.heartbeat()
+        statuses = ", ".join("?" * len(UNFINISHED_STATUSES))
+        conditions = [
+            "kind = ?",
+            f"status IN ({statuses})",
+            "(owner IS NULL OR owner NOT IN (SELECT owner FROM owners WHERE heartbeat >= ?))",
+        ]
+        args = [kind, *UNFINISHED_STATUSES, time.time() - JOB_OWNER_TIMEOUT]
+        if api_key is not None:
+            conditions.append("key_fingerprint = ?")
+            args.append(key_fingerprint(api_key))
+        if since is not None:
+            conditions.append("created_at >= ?")
+            args.append(since)
+        where = " AND ".join(conditions)
+        with self._lock:
+            # One write transaction: two processes resuming at once never claim the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(f"SELECT * FROM jobs WHERE {where} ORDER BY created_at DESC", args).fetchall()
+                self._connection.executemany("UPDATE jobs SET owner = ? WHERE id = ?", [(self.owner, row["id"]) for row in rows])
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return [{**self._to_dict(row), "owner": self.owner} for row in rows]
+
+    def update_job(self, job_id: str, **fields):
+        """
+        Update some of the status, progress, result_url, local_path and error of a job
+        """
+        unknown = set(fields) - set(UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), time.time(), job_id),
+        )
+
+    def get_job(self, job_id: str) -> dict:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list_jobs(self, status=None, kind: str = None, api_key: str = None, since: float = None, until: float = None, limit: int = 100, offset: int = 0) -> list:
+        """
+        Jobs matching the filters, most recent first. status may be a single status or a list.
+        """
+        conditions, args = [], []
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else list(status)
+            conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+            args.extend(statuses)
+        if kind is not None:
+            conditions.append("kind = ?")
+            args.append(kind)
+        if api_key is not None:
+            conditions.append("key_fingerprint = ?")
+            args.append(key_fingerprint(api_key))
+        if since is not None:
+            conditions.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            args.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._execute(
+            f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (*args, limit, offset),
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def expire_stale(self, max_age: float, kind: str = "generation") -> int:
+        """
+        Mark unfinished jobs older than max_age seconds as "Expired", returns how many were
+        """
+        statuses = ", ".join("?" * len(UNFINISHED_STATUSES))
+        with self._lock:
+            cursor = self._connection.execute(
+                f"UPDATE jobs SET status = 'Expired', updated_at = ? WHERE kind = ? AND status IN ({statuses}) AND created_at < ?",
+                (time.time(), kind, *UNFINISHED_STATUSES, time.time() - max_age),
+            )
+            return cursor.rowcount
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_job_registry() -> JobRegistry:
+    """
+    Get the process-wide job registry, creating it on first use
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = JobRegistry()
+    return _registry
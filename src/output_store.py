@@ -0,0 +1,273 @@
+"""
+Local archive of every generated image, browsed in the History tab.
+
+Originals are kept under content-addressed paths (`originals/ab/<sha256>.jpg`),
+hard-linked from the output directory when the file system allows it, so an
+image is stored once however many generations returned it. The metadata of
+every generation (prompt, model, seed, finetune, parameters, timestamps) is
+indexed in an SQLite database with an FTS5 index over prompts. Thumbnails are generated in a background
+process pool, so browsing tens of thousands of past generations only ever
+loads small files.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import OUTPUT_STORE_DIR, OUTPUT_THUMBNAIL_QUALITY, OUTPUT_THUMBNAIL_SIZE, OUTPUT_THUMBNAIL_WORKERS
+from instrumentation import get_logger, log_event, metrics
+
+logger = get_logger("output_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    thumbnail_path TEXT,
+    task_id TEXT,
+    prompt TEXT,
+    model_id TEXT,
+    seed TEXT,
+    finetune_id TEXT,
+    params TEXT,
+    bytes INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS images_task ON images (task_id);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+CREATE INDEX IF NOT EXISTS images_model ON images (model_id, id);
+CREATE INDEX IF NOT EXISTS images_finetune ON images (finetune_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(prompt, content='images', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts (rowid, prompt) VALUES (new.id, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+END;
+"""
+
+
+def make_thumbnail(source: str, target: str, size: int = OUTPUT_THUMBNAIL_SIZE, quality: int = OUTPUT_THUMBNAIL_QUALITY) -> str:
+    """
+    Write a WebP thumbnail of an image (run in the thumbnail processes), returns its path
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.tmp"
+        image.save(tmp_path, format="WEBP", quality=quality)
+    os.replace(tmp_path, target)
+    return target
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fts_query(text: str) -> str:
+    """
+    FTS5 query matching prompts that contain every word of text (as word prefixes)
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+class OutputStore:
+    """
+    Content-addressed image archive with an SQLite metadata index
+    """
+
+    def __init__(self, directory: str = OUTPUT_STORE_DIR, thumbnail_workers: int = OUTPUT_THUMBNAIL_WORKERS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, "store.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._thumbnail_workers = thumbnail_workers
+        self._pool = None
+        self._pending_thumbnails = set()
+        self._failed_thumbnails = set()  # not retried before the next restart
+
+    def _execute(self, query: str, args=()):
+        with self._lock:
+            return self._connection.execute(query, args).fetchall()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        record = dict(row)
+        record["params"] = json.loads(record["params"]) if record["params"] else {}
+        return record
+
+    def _paths(self, digest: str, extension: str):
+        original = os.path.join(self.directory, "originals", digest[:2], f"{digest}{extension}")
+        thumbnail = os.path.join(self.directory, "thumbnails", digest[:2], f"{digest}.webp")
+        return original, thumbnail
+
+    def add(self, image_path: str, task_id: str = None, model_id: str = None, params: dict = None) -> dict:
+        """
+        Archive a generated image with its generation parameters, returns its record.
+        A task already archived keeps its record.
+        """
+        params = params or {}
+        if task_id is not None:
+            existing = self._execute("SELECT * FROM images WHERE task_id = ?", (task_id,))
+            if existing:
+                return self._to_dict(existing[0])
+        digest = _file_hash(image_path)
+        original, thumbnail = self._paths(digest, os.path.splitext(image_path)[1].lower() or ".jpg")
+        if not os.path.exists(original):
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            tmp_path = f"{original}.{threading.get_ident()}.tmp"
+            try:
+                os.link(image_path, tmp_path)
+            except OSError:
+                shutil.copyfile(image_path, tmp_path)
+            os.replace(tmp_path, original)
+        seed = params.get("seed")
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO images (sha256, path, thumbnail_path, task_id, prompt, model_id, seed, finetune_id, params, bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    digest, original, thumbnail if os.path.exists(thumbnail) else None, task_id,
+                    params.get("prompt", ""), model_id, None if seed is None else str(seed),
+                    params.get("finetune_id"), json.dumps(params), os.path.getsize(original), time.time(),
+                ),
+            )
+            # Nothing inserted when another thread archived the same task first
+            rows = self._connection.execute(
+                "SELECT * FROM images WHERE id = ?" if cursor.rowcount else "SELECT * FROM images WHERE task_id = ?",
+                (cursor.lastrowid if cursor.rowcount else task_id,),
+            ).fetchall()
+        record = self._to_dict(rows[0])
+        if not record["thumbnail_path"]:
+            self._schedule_thumbnail(record)
+        metrics.increment("output_store.added")
+        return record
+
+    def _schedule_thumbnail(self, record: dict):
+        digest = record["sha256"]
+        _, thumbnail = self._paths(digest, "")
+        with self._lock:
+            if digest in self._pending_thumbnails or digest in self._failed_thumbnails:
+                return
+            self._pending_thumbnails.add(digest)
+            if self._pool is None:
+                # Spawned, not forked: the parent runs threads (poller, web server) whose
+                # locks a forked child could inherit in a held state
+                self._pool = ProcessPoolExecutor(self._thumbnail_workers, mp_context=multiprocessing.get_context("spawn"))
+            future = self._pool.submit(make_thumbnail, record["path"], thumbnail)
+        future.add_done_callback(lambda future: self._thumbnail_done(digest, future))
+
+    def _thumbnail_done(self, digest: str, future):
+        with self._lock:
+            self._pending_thumbnails.discard(digest)
+        try:
+            thumbnail = future.result()
+        except Exception as e:
+            with self._lock:
+                self._failed_thumbnails.add(digest)
+            log_event(logger, logging.WARNING, "Thumbnail generation failed", sha256=digest, error=str(e))
+            return
+        self._execute("UPDATE images SET thumbnail_path = ? WHERE sha256 = ?", (thumbnail, digest))
+        metrics.increment("output_store.thumbnails")
+
+    def _filters(self, query: str = "", model_id: str = None, finetune_id: str = None):
+        conditions, args = [], []
+        fts_query = _fts_query(query or "")
+        if fts_query:
+            conditions.append("id IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)")
+            args.append(fts_query)
+        if model_id:
+            conditions.append("model_id = ?")
+            args.append(model_id)
+        if finetune_id:
+            conditions.append("finetune_id = ?")
+            args.append(finetune_id)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), args
+
+    def search(self, query: str = "", model_id: str = None, finetune_id: str = None, limit: int = 50, offset: int = 0) -> list:
+        """
+        Archived images whose prompt contains every word of query (prefix match) and matching
+        the filters, most recent first. Thumbnails not generated yet are scheduled again.
+        """
+        where, args = self._filters(query, model_id, finetune_id)
+        rows = self._execute(f"SELECT * FROM images {where} ORDER BY id DESC LIMIT ? OFFSET ?", (*args, limit, offset))
+        records = [self._to_dict(row) for row in rows]
+        for record in records:
+            if not record["thumbnail_path"] or not os.path.exists(record["thumbnail_path"]):
+                # Generated in the background, the original is shown meanwhile
+                record["thumbnail_path"] = None
+                self._schedule_thumbnail(record)
+        return records
+
+    def count(self, query: str = "", model_id: str = None, finetune_id: str = None) -> int:
+        where, args = self._filters(query, model_id, finetune_id)
+        return self._execute(f"SELECT COUNT(*) FROM images {where}", args)[0][0]
+
+    def get(self, image_id: int) -> dict:
+        rows = self._execute("SELECT * FROM images WHERE id = ?", (image_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def archived_task_ids(self) -> set:
+        return {row[0] for row in self._execute("SELECT task_id FROM images WHERE task_id IS NOT NULL")}
+
+    def import_jobs(self, jobs: list) -> int:
+        """
+        Archive the downloaded results of job registry records not archived yet (e.g. images
+        generated before the store existed). Returns the number of images added.
+        """
+        archived = self.archived_task_ids()
+        added = 0
+        for job in jobs:
+            if job["id"] in archived or not job.get("local_path") or not os.path.isfile(job["local_path"]):
+                continue
+            try:
+                self.add(job["local_path"], job["id"], job["model_id"], job["params"])
+                added += 1
+            except OSError as e:
+                log_event(logger, logging.WARNING, "Could not archive a past result", task_id=job["id"], error=str(e))
+        return added
+
+
+def archive_past_results() -> int:
+    """
+    Archive the downloaded generations of the job registry that are not in the store yet
+    """
+    from job_registry import get_job_registry
+
+    return get_output_store().import_jobs(get_job_registry().list_jobs(status="Ready", kind="generation", limit=-1))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_output_store() -> OutputStore:
+    """
+    Get the process-wide output store, creating it on first use
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutputStore()
+    return _store
@@ -0,0 +1,209 @@
+"""
+Centralized result poller.
+
+A single background event loop polls every in-flight task ID. Callers register
+a task and get a future back instead of running their own polling loop. Each
+task is polled on an adaptive schedule: fast first polls, exponential backoff
+capped at POLL_MAX_DELAY, earlier polls when the reported progress says the
+task is about to finish, and a ceiling that depends on the model and priority.
+Rate-limit (429) responses pause polling for every task of that API key.
+"""
+import asyncio
+import logging
+import threading
+
+from config import (
+    POLL_BACKOFF,
+    POLL_DEFAULT_TIMEOUT,
+    POLL_INITIAL_DELAY,
+    POLL_MAX_DELAY,
+    POLL_MAX_ERRORS,
+    POLL_TIMEOUT_FACTORS,
+    POLL_TIMEOUTS,
+)
+from http_client import api_url, get_async_client
+from instrumentation import get_logger, log_event, metrics
+
+logger = get_logger("poller")
+
+FAILED_STATUSES = ("Error", "Request Moderated", "Content Moderated", "Task not found")
+
+
+class TaskFailedError(Exception):
+    """
+    A tracked task did not produce a result; `status` is the API status, "Timeout" or "Failed"
+    """
+
+    def __init__(self, message: str, status: str = "Failed"):
+        super().__init__(message)
+        self.status = status
+
+
+def poll_timeout(model_id: str = None, priority: str = "interactive") -> float:
+    """
+    Seconds a task may take before it is reported as timed out
+    """
+    return POLL_TIMEOUTS.get(model_id, POLL_DEFAULT_TIMEOUT) * POLL_TIMEOUT_FACTORS.get(priority, 1.0)
+
+
+def normalize_progress(progress) -> float:
+    """
+    Progress as a fraction in [0, 1], or None when the API did not report any
+    """
+    if progress is None:
+        return None
+    try:
+        progress = float(progress)
+    except (TypeError, ValueError):
+        return None
+    if progress > 1:
+        progress /= 100
+    return min(max(progress, 0.0), 1.0)
+
+
+def next_delay(attempt: int, elapsed: float, progress: float = None) -> float:
+    """
+    Delay before the next poll of a task
+    """
+    delay = min(POLL_INITIAL_DELAY * POLL_BACKOFF ** attempt, POLL_MAX_DELAY)
+    if progress:
+        # Estimated time left, from the time spent so far to reach `progress`
+        remaining = elapsed * (1 - progress) / progress
+        delay = min(delay, max(POLL_INITIAL_DELAY, remaining))
+    return delay
+
+
+class ResultPoller:
+    """
+    Background service multiplexing the polling of every in-flight task
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # API key -> loop time until which polling is paused after a 429
+        self._paused_until = {}
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="result-poller", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def register(self, api_key: str, task_id: str, model_id: str = None, priority: str = "interactive", timeout: float = None, on_progress=None, polling_url: str = None):
+        """
+        Start tracking a task. Returns a concurrent.futures.Future resolved with the final
+        result dict, or failed if the task errors, is moderated or times out.
+        on_progress(result) is called from the poller thread after every non-final poll.
+        polling_url is the result URL returned with the task ID, in the region that accepted
+        it; without one, the task is polled on API_BASE_URL.
+        """
+        if timeout is None:
+            timeout = poll_timeout(model_id, priority)
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._track(api_key.strip(), task_id, timeout, on_progress, polling_url), loop)
+
+    async def _wait_rate_limit(self, api_key: str):
+        while True:
+            pause = self._paused_until.get(api_key, 0) - self._loop.time()
+            if pause <= 0:
+                return
+            await asyncio.sleep(pause)
+
+    def _pause(self, api_key: str, seconds: float):
+        until = self._loop.time() + seconds
+        self._paused_until[api_key] = max(self._paused_until.get(api_key, 0), until)
+
+    async def _track(self, api_key: str, task_id: str, timeout: float, on_progress, polling_url: str = None):
+        import httpx
+
+        client = get_async_client(api_key)
+        # The returned polling URL already carries the task ID
+        params = None if polling_url else {"id": task_id}
+        polling_url = polling_url or api_url("get_result")
+        start = self._loop.time()
+        attempt = 0
+        errors = 0
+        status = None
+        # Loop time at which the task left the queue, i.e. first reported progress
+        started_at = None
+        self._in_flight += 1
+        try:
+            while True:
+                await self._wait_rate_limit(api_key)
+                if self._loop.time() - start > timeout:
+                    raise TaskFailedError(f"Task {task_id} did not complete within {timeout:.0f} seconds (last status: {status})", "Timeout")
+                elapsed = self._loop.time() - start
+                delay = next_delay(attempt, elapsed)
+                try:
+                    response = await client.get(polling_url, params=params)
+                    metrics.increment("requests.poll")
+                    if response.status_code == 429:
+                        metrics.increment("poll.rate_limited")
+                        retry_after = response.headers.get("Retry-After")
+                        self._pause(api_key, float(retry_after) if retry_after and retry_after.isdigit() else delay * 2)
+                        continue
+                    response.raise_for_status()
+                    result = response.json()
+                    errors = 0
+                except (httpx.TransportError, httpx.HTTPStatusError, ValueError) as e:
+                    # Transient network or server errors must not lose a task that is already paid for
+                    transient = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                    errors += 1
+                    metrics.increment("poll.errors")
+                    log_event(logger, logging.WARNING, "Polling error", task_id=task_id, error=str(e), attempt=errors)
+                    if not transient or errors > POLL_MAX_ERRORS:
+                        raise TaskFailedError(f"Polling request failed: {str(e)}")
+                    result = {}
+
+                status = result.get("status", status)
+                progress = normalize_progress(result.get("progress"))
+                log_event(logger, logging.DEBUG, "Polled task", task_id=task_id, status=status, progress=progress)
+                now = self._loop.time()
+                if started_at is None and progress:
+                    started_at = now
+                    metrics.observe("queue_wait", now - start)
+                if status == "Ready":
+                    metrics.observe("result_wait", now - start)
+                    if started_at is not None:
+                        metrics.observe("generation", now - started_at)
+                    return result
+                elif status in FAILED_STATUSES:
+                    raise TaskFailedError(f"Task failed with status: {status}", status)
+
+                if result and on_progress is not None:
+                    try:
+                        on_progress(result)
+                    except Exception:
+                        # A broken progress consumer must not lose the task
+                        pass
+                delay = next_delay(attempt, elapsed, progress)
+                attempt += 1
+                if self._loop.time() + delay - start > timeout:
+                    raise TaskFailedError(f"Task {task_id} did not complete within {timeout:.0f} seconds (last status: {status})", "Timeout")
+                await asyncio.sleep(delay)
+        finally:
+            self._in_flight -= 1
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller() -> ResultPoller:
+    """
+    Get the process-wide poller, creating it on first use
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = ResultPoller()
+    return _poller
@@ -0,0 +1,173 @@
+"""
+Content-addressed on-disk cache of generation results.
+
+With a fixed seed, a generation is fully determined by its parameters, so the
+result metadata and the downloaded image file are stored under a hash of the
+model ID and the request payload. Repeat requests are served from disk without
+calling the API, and images are linked into the cache rather than copied when
+the file system allows it. The cache is bounded in size and evicts the least recently
+used entries first. Processes sharing the cache directory see each other's entries.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES
+
+
+def cache_key(model_id: str, payload: dict) -> str:
+    """
+    Cache key of a generation, or None if it is not deterministic (random seed)
+    """
+    if payload.get("seed") is None:
+        return None
+    params = dict(payload)
+    if params.get("image_prompt"):
+        # Hash the (large) encoded image prompt instead of embedding it in the key material
+        params["image_prompt"] = hashlib.sha256(params["image_prompt"].encode()).hexdigest()
+    material = json.dumps({"model_id": model_id, **params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of (metadata, image file) entries on local disk
+    """
+
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> total size on disk, least recently used first
+        self._entries = None
+        self._total_bytes = 0
+
+    def _paths(self, key: str):
+        folder = os.path.join(self.directory, key[:2])
+        return folder, os.path.join(folder, f"{key}.json")
+
+    def _load_index(self):
+        if self._entries is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for folder, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    key = name[:-5]
+                    size = sum(os.path.getsize(os.path.join(folder, f)) for f in files if f.startswith(key))
+                    entries.append((os.path.getmtime(os.path.join(folder, name)), key, size))
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._total_bytes = sum(self._entries.values())
+
+    def _remove(self, key: str):
+        folder, _ = self._paths(key)
+        self._total_bytes -= self._entries.pop(key, 0)
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                if name.startswith(key):
+                    os.remove(os.path.join(folder, name))
+
+    def get(self, key: str):
+        """
+        Return (metadata, image path) for a key, or None on a miss
+        """
+        with self._lock:
+            self._load_index()
+            folder, meta_path = self._paths(key)
+            if key not in self._entries:
+                if not os.path.exists(meta_path):
+                    self.misses += 1
+                    return None
+                # Stored by another process sharing the cache directory (e.g. another web worker)
+                self._entries[key] = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder) if name.startswith(key))
+                self._total_bytes += self._entries[key]
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                image_path = os.path.join(folder, meta["image_file"])
+                if not os.path.isfile(image_path):
+                    raise OSError(f"Missing cached image {image_path}")
+            except (OSError, ValueError, KeyError):
+                # Entry removed or corrupted behind our back
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            # The modification time persists the LRU order across restarts
+            os.utime(meta_path)
+            self.hits += 1
+            return meta, image_path
+
+    def put(self, key: str, meta: dict, image_path: str):
+        """
+        Store the metadata and image file of a result, evicting old entries if needed
+        The image is hard-linked into the cache (copied across file systems)
+        Returns the path of the cached image
+        """
+        folder, meta_path = self._paths(key)
+        image_file = f"{key}{os.path.splitext(image_path)[1] or '.jpg'}"
+        meta = {**meta, "image_file": image_file, "cached_at": time.time()}
+        encoded_meta = json.dumps(meta).encode()
+        with self._lock:
+            self._load_index()
+            if key in self._entries:
+                self._remove(key)
+            os.makedirs(folder, exist_ok=True)
+            # Store the image first and the metadata last, each atomically, so readers
+            # never see an entry without its image
+            cached_path = os.path.join(folder, image_file)
+            tmp_path = f"{cached_path}.tmp"
+            try:
+                os.link(image_path, tmp_path)
+            except OSError:
+                shutil.copyfile(image_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+            tmp_path = f"{meta_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded_meta)
+            os.replace(tmp_path, meta_path)
+            self._entries[key] = os.path.getsize(cached_path) + len(encoded_meta)
+            self._total_bytes += self._entries[key]
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+        return cached_path
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Get the process-wide result cache, creating it on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+    return _cache
@@ -0,0 +1,327 @@
+"""
+Per-API-key job scheduling.
+
+Every generation holds a slot of its API key from submit until its result is
+downloaded, so at most SCHEDULER_MAX_CONCURRENCY tasks per key are in flight
+whoever started them, and submit requests are paced by a token bucket. Excess
+work waits in a queue instead of failing with 429s: interactive generations
+go before batch jobs, and within a priority, queue groups (e.g. the jobs of
+one batch) are served round-robin so one large batch cannot starve others.
+
+Slots can be awaited from threads (`slot`) and from any event loop (`aslot`).
+
+When several web workers share the data directory (see serve.py), each one
+gets its share of the concurrency slots, and the submit token buckets live in
+an SQLite database so that the API key's rate is enforced across processes.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from config import (
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_PRIORITIES,
+    SCHEDULER_SHARED_STATE,
+    SCHEDULER_STATE_PATH,
+    SCHEDULER_SUBMIT_BURST,
+    SCHEDULER_SUBMIT_RATE,
+    WEB_WORKERS,
+)
+from instrumentation import metrics
+from job_registry import key_fingerprint
+
+
+class TokenBucket:
+    """
+    Token bucket handing out reservations: tokens may go negative, and each caller is
+    told how long to wait before using its token, which keeps callers in arrival order
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token, returns the seconds to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        """
+        Hold every reservation for `seconds` (e.g. after a 429) and drop the saved burst
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket whose state is kept in an SQLite database, shared by every process using it
+    """
+
+    _connections = {}  # database path -> connection, one per process
+    _connections_lock = threading.Lock()
+
+    def __init__(self, name: str, rate: float, burst: int, path: str = SCHEDULER_STATE_PATH):
+        self.name = name
+        self.rate = rate
+        self.capacity = burst
+        self.path = path
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with _connections_lock held
+        connection = self._connections.get(self.path)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, paused_until REAL NOT NULL)"
+            )
+            self._connections[self.path] = connection
+        return connection
+
+    def _update(self, update) -> float:
+        # Wall clock time: monotonic clocks are not comparable between processes
+        with self._connections_lock:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT tokens, updated, paused_until FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+                now = time.time()
+                tokens, updated, paused_until = row or (float(self.capacity), now, 0.0)
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                tokens, paused_until, wait = update(now, tokens, paused_until)
+                connection.execute(
+                    "INSERT OR REPLACE INTO token_buckets (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                    (self.name, tokens, now, paused_until),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return wait
+
+    def reserve(self) -> float:
+        """
+        Take a token, returns the seconds to wait before using it
+        """
+        def take(now, tokens, paused_until):
+            tokens -= 1
+            return tokens, paused_until, max(0.0, -tokens / self.rate, paused_until - now)
+
+        return self._update(take)
+
+    def pause(self, seconds: float):
+        """
+        Hold every reservation for `seconds` (e.g. after a 429) and drop the saved burst
+        """
+        self._update(lambda now, tokens, paused_until: (min(tokens, 0.0), max(paused_until, now + seconds), 0.0))
+
+
+class _Waiter:
+    __slots__ = ("grant", "granted", "cancelled")
+
+    def __init__(self, grant):
+        self.grant = grant
+        self.granted = False
+        self.cancelled = False
+
+
+class _KeyState:
+    def __init__(self, bucket):
+        self.in_flight = 0
+        self.queue = []  # heap of (priority rank, round, sequence, waiter)
+        self.group_rounds = {}  # queue group -> round of its last queued job
+        self.served_round = 0
+        self.bucket = bucket
+
+
+class JobScheduler:
+    """
+    Concurrency slots and submit rate limits per API key, with priority and fair queueing
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = math.ceil(SCHEDULER_MAX_CONCURRENCY / WEB_WORKERS),
+        rate: float = SCHEDULER_SUBMIT_RATE,
+        burst: int = SCHEDULER_SUBMIT_BURST,
+        shared_state: bool = SCHEDULER_SHARED_STATE,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.shared_state = shared_state
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._sequence = itertools.count()
+
+    def _state(self, api_key: str) -> _KeyState:
+        fingerprint = key_fingerprint(api_key)
+        state = self._keys.get(fingerprint)
+        if state is None:
+            bucket = SharedTokenBucket(fingerprint, self.rate, self.burst) if self.shared_state else TokenBucket(self.rate, self.burst)
+            state = self._keys[fingerprint] = _KeyState(bucket)
+        return state
+
+    def _enqueue(self, api_key: str, priority: str, group, grant) -> _Waiter:
+        waiter = _Waiter(grant)
+        with self._lock:
+            state = self._state(api_key)
+            # Queued waiters only exist while every slot is taken (cancelled ones are skipped)
+            if state.in_flight < self.max_concurrency:
+                state.in_flight += 1
+                waiter.granted = True
+            else:
+                # A group's next job is queued one round after its previous one, so groups interleave
+                job_round = max(state.group_rounds.get(group, 0), state.served_round) + 1
+                if group is not None:
+                    state.group_rounds[group] = job_round
+                rank = SCHEDULER_PRIORITIES.get(priority, max(SCHEDULER_PRIORITIES.values()))
+                heapq.heappush(state.queue, (rank, job_round, next(self._sequence), waiter))
+                metrics.increment("scheduler.queued")
+        if waiter.granted:
+            grant()
+        return waiter
+
+    def _release(self, api_key: str):
+        granted = []
+        with self._lock:
+            state = self._state(api_key)
+            state.in_flight -= 1
+            while state.queue and state.in_flight < self.max_concurrency:
+                _, job_round, _, waiter = heapq.heappop(state.queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                state.in_flight += 1
+                state.served_round = max(state.served_round, job_round)
+                granted.append(waiter)
+            if not state.queue:
+                state.group_rounds.clear()
+        for waiter in granted:
+            waiter.grant()
+
+    def _cancel(self, waiter: _Waiter) -> bool:
+        """
+        Withdraw a queued waiter. Returns False if it was granted its slot in the meantime.
+        """
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            return True
+
+    @contextmanager
+    def slot(self, api_key: str, priority: str = "interactive", group=None):
+        """
+        Hold one of the API key's concurrency slots, blocking the thread until one is free
+        """
+        start = time.perf_counter()
+        event = threading.Event()
+        self._enqueue(api_key, priority, group, event.set)
+        event.wait()
+        metrics.observe("scheduler_wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release(api_key)
+
+    @asynccontextmanager
+    async def aslot(self, api_key: str, priority: str = "interactive", group=None):
+        """
+        Async counterpart of slot; cancelling a queued waiter withdraws it from the queue
+        """
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(api_key, priority, group, grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not self._cancel(waiter):
+                self._release(api_key)
+            raise
+        metrics.observe("scheduler_wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release(api_key)
+
+    def throttle(self, api_key: str):
+        """
+        Block until the API key may send its next submit request
+        """
+        with self._lock:
+            bucket = self._state(api_key).bucket
+        time.sleep(bucket.reserve())
+
+    async def athrottle(self, api_key: str):
+        """
+        Async counterpart of throttle
+        """
+        with self._lock:
+            bucket = self._state(api_key).bucket
+        if isinstance(bucket, SharedTokenBucket):
+            # The shared bucket may wait on another process's transaction: keep it off the loop
+            await asyncio.sleep(await asyncio.to_thread(bucket.reserve))
+        else:
+            await asyncio.sleep(bucket.reserve())
+
+    def rate_limited(self, api_key: str, retry_after: float):
+        """
+        Report a 429 on a submit: pause every submit of the API key for retry_after seconds
+        """
+        metrics.increment("scheduler.rate_limited")
+        with self._lock:
+            bucket = self._state(api_key).bucket
+        bucket.pause(retry_after)
+
+    def stats(self) -> dict:
+        """
+        In-flight and queued job counts, per API key fingerprint
+        """
+        with self._lock:
+            return {
+                fingerprint: {"in_flight": state.in_flight, "queued": sum(1 for *_, waiter in state.queue if not waiter.cancelled)}
+                for fingerprint, state in self._keys.items()
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    """
+    Get the process-wide job scheduler, creating it on first use
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+    return _scheduler
@@ -0,0 +1,79 @@
+"""
+Run the web UI as several worker processes sharing one data directory.
+
+Each worker is a full `webui.py` process listening on its own port (port,
+port + 1, ...). They share the job registry, result cache, History archive and
+submit rate limits through the data directory (see scheduler.py and
+job_registry.py), so any worker can resume, cache and show any user's
+results. Put a reverse proxy with sticky sessions in front of them: a Gradio
+session (its queue connection and per-tab state) lives in one worker. See the
+README for an nginx example.
+
+Workers that exit are restarted after WEB_RESTART_DELAY seconds; Ctrl+C or
+SIGTERM stops them all.
+
+Usage:
+    export BFL_API_KEY=<your api key>  # optional, resumes its unfinished jobs at startup
+    python serve.py --workers=4 --port=7860 --host=127.0.0.1
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from config import WEB_RESTART_DELAY
+
+WEBUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webui.py")
+
+
+def _start_worker(index: int, workers: int, port: int, host: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "FLUX_GUI_WORKERS": str(workers),
+        "FLUX_GUI_WORKER_INDEX": str(index),
+        "FLUX_GUI_PORT": str(port + index),
+        "FLUX_GUI_HOST": host,
+    }
+    return subprocess.Popen([sys.executable, WEBUI_PATH], env=env)
+
+
+def serve(workers: int = 2, port: int = 7860, host: str = "127.0.0.1"):
+    """
+    Start `workers` web UI processes on ports port .. port + workers - 1 and keep them running
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    # SIGTERM (e.g. from a service manager) stops the workers like Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    processes = [_start_worker(index, workers, port, host) for index in range(workers)]
+    print(f"Started {workers} workers on {', '.join(f'http://{host}:{port + index}' for index in range(workers))}", flush=True)
+    exited_at = {}
+    try:
+        while True:
+            time.sleep(1)
+            for index, process in enumerate(processes):
+                if process.poll() is None:
+                    continue
+                if index not in exited_at:
+                    print(f"Worker {index} exited with code {process.returncode}, restarting in {WEB_RESTART_DELAY:.0f} s", flush=True)
+                    exited_at[index] = time.monotonic()
+                elif time.monotonic() - exited_at[index] >= WEB_RESTART_DELAY:
+                    processes[index] = _start_worker(index, workers, port, host)
+                    del exited_at[index]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    import cli
+    cli.main(serve, __doc__)
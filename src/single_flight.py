@@ -0,0 +1,153 @@
+"""
+In-process deduplication ("single flight") of identical concurrent calls.
+
+When several users or tabs ask for the same thing at the same moment (e.g. a
+fixed-seed generation with identical parameters, or the finetune list of one
+API key), only the first caller does the work; the others attach to its
+flight and receive the same result, or the same exception, when it finishes.
+Nothing is cached: a call made after the flight landed starts a new one.
+
+Sync and async callers can share a flight, whichever of them leads it.
+Status updates of the leader (see api_utils.GENERATION_STAGES) are fanned out
+to the on_status callbacks of every attached caller.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+from instrumentation import get_logger, log_event, metrics
+
+logger = get_logger("single_flight")
+
+
+class FlightCancelled(Exception):
+    """
+    The leader of a flight was cancelled before finishing: attached callers start over
+    """
+
+
+class _Flight:
+    def __init__(self):
+        self.future = Future()
+        self.listeners = []
+        self.last_status = None
+        self.lock = threading.Lock()
+
+    def listen(self, on_status):
+        if on_status is None:
+            return
+        with self.lock:
+            self.listeners.append(on_status)
+            last_status = self.last_status
+        if last_status is not None:
+            # Late joiners first catch up with the current stage
+            self._call(on_status, last_status)
+
+    def notify(self, *status):
+        with self.lock:
+            self.last_status = status
+            listeners = list(self.listeners)
+        for on_status in listeners:
+            self._call(on_status, status)
+
+    @staticmethod
+    def _call(on_status, status: tuple):
+        try:
+            on_status(*status)
+        except Exception:
+            # A broken status consumer must not fail the flight for the others
+            log_event(logger, logging.DEBUG, "Status callback failed", status=status)
+
+
+class SingleFlight:
+    """
+    Group of flights keyed by any hashable value
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key, on_status):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        flight.listen(on_status)
+        if not leader:
+            metrics.increment("single_flight.joined")
+            log_event(logger, logging.DEBUG, "Joined an identical call in flight", key=str(key))
+        return flight, leader
+
+    def _land(self, key, flight: _Flight, result=None, error: BaseException = None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is None:
+            flight.future.set_result(result)
+        elif isinstance(error, Exception):
+            flight.future.set_exception(error)
+        else:
+            # Cancellation or interpreter exit of the leader only: the others start over
+            flight.future.set_exception(FlightCancelled(str(key)))
+
+    def do(self, key, fn, on_status=None):
+        """
+        Call fn(notify) unless an identical call (same key) is in flight, then wait for its
+        result instead. notify(*status) forwards status updates to the on_status callbacks
+        of every caller sharing the flight. The result is shared: callers must not mutate it.
+        """
+        while True:
+            flight, leader = self._join(key, on_status)
+            if leader:
+                try:
+                    result = fn(flight.notify)
+                except BaseException as e:
+                    self._land(key, flight, error=e)
+                    raise
+                self._land(key, flight, result)
+                return result
+            try:
+                return flight.future.result()
+            except FlightCancelled:
+                continue
+
+    async def ado(self, key, fn, on_status=None):
+        """
+        Async counterpart of do: fn(notify) returns a coroutine, awaited by the leader only
+        """
+        while True:
+            flight, leader = self._join(key, on_status)
+            if leader:
+                try:
+                    result = await fn(flight.notify)
+                except BaseException as e:
+                    self._land(key, flight, error=e)
+                    raise
+                self._land(key, flight, result)
+                return result
+            try:
+                # Shielded: a cancelled follower must not cancel the flight of the others
+                return await asyncio.shield(asyncio.wrap_future(flight.future))
+            except FlightCancelled:
+                continue
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Get the process-wide single flight group, creating it on first use
+    """
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+    return _single_flight
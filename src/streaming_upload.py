@@ -0,0 +1,61 @@
+"""
+Streaming JSON request bodies embedding a base64-encoded file.
+
+The finetune endpoint expects the dataset ZIP base64-encoded inside a JSON
+object. Building that object in memory costs several times the archive size
+(raw bytes, base64 bytes, decoded str, serialized JSON). `Base64JsonBody`
+instead encodes the file chunk by chunk while the request is being sent, so
+peak memory stays at a few chunks whatever the dataset size.
+"""
+import asyncio
+import base64
+import json
+import os
+
+# Multiple of 3 so that every chunk encodes to base64 without padding
+CHUNK_SIZE = 3 * 256 * 1024
+
+
+class Base64JsonBody:
+    """
+    Iterable JSON body: `fields` plus `file_field` holding the base64 content of `path`.
+    It has a known length (sent as Content-Length) and can be iterated more than once,
+    which keeps connection retries working.
+    """
+
+    def __init__(self, path: str, fields: dict, file_field: str = "file_data", chunk_size: int = CHUNK_SIZE):
+        if chunk_size % 3:
+            raise ValueError("chunk_size must be a multiple of 3")
+        self.path = path
+        self.fields = fields
+        self.chunk_size = chunk_size
+        encoded_fields = json.dumps(fields)
+        separator = ", " if fields else ""
+        self._prefix = f"{encoded_fields[:-1]}{separator}{json.dumps(file_field)}: \"".encode()
+        self._suffix = b"\"}"
+        file_size = os.path.getsize(path)
+        self._length = len(self._prefix) + 4 * ((file_size + 2) // 3) + len(self._suffix)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        yield self._prefix
+        with open(self.path, "rb") as file:
+            while chunk := file.read(self.chunk_size):
+                yield base64.b64encode(chunk)
+        yield self._suffix
+
+    async def aiter_chunks(self):
+        """
+        Async iterator over the body, reading the file off the event loop
+        """
+        yield self._prefix
+        with open(self.path, "rb") as file:
+            while chunk := await asyncio.to_thread(file.read, self.chunk_size):
+                yield base64.b64encode(chunk)
+        yield self._suffix
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": "application/json", "Content-Length": str(self._length)}
@@ -0,0 +1,201 @@
+"""
+Parameter sweeps: generate every combination of a few values of the
+generation settings and compare them side by side on one contact sheet.
+
+A sweep takes value lists (or ranges) for any of SWEEP_PARAMETERS, expands
+their Cartesian grid, and runs all the cells concurrently through the batch
+runner, so under the scheduler's limits a 5 × 5 grid takes about as long as a
+single generation. Every cell uses the same seed, so only the swept settings
+change between images; fixed seeds also make cells reusable from the result
+cache when a sweep is extended.
+
+The contact sheet puts the last swept parameter on the columns and the
+combinations of the others on the rows. Cells are decoded and scaled once,
+then the sheet is composed in NumPy (grid reshape, label strips
+concatenated) instead of pasting images pixel block by pixel block.
+"""
+import itertools
+import os
+import random
+import time
+
+from batch import agenerate_batch
+from config import MAX_SEED, SWEEP_CELL_SIZE, SWEEP_DIR, SWEEP_LABEL_SIZE, SWEEP_MAX_CELLS, SWEEP_SHEET_QUALITY
+
+# Sweepable settings: name -> (label, type, minimum, maximum), as bounded in the Inference tab
+SWEEP_PARAMETERS = {
+    "guidance_scale": ("Guidance", float, 1.5, 5.0),
+    "steps": ("Steps", int, 1, 50),
+    "interval": ("Interval", float, 1.0, 4.0),
+    "finetune_strength": ("Strength", float, 0.0, 2.0),
+}
+BACKGROUND = 255
+GUTTER = 4  # pixels between cells
+LABEL_PADDING = 6
+
+
+def parse_values(name: str, spec: str) -> list:
+    """
+    Values of a sweep parameter from "2, 3.5, 4" (a list) or "1.5:4.5:7" (7 evenly spaced
+    values from 1.5 to 4.5, both included). Raises ValueError for invalid or out of range values.
+    """
+    label, cast, minimum, maximum = SWEEP_PARAMETERS[name]
+    spec = (spec or "").strip()
+    if not spec:
+        return []
+    try:
+        if ":" in spec:
+            start, stop, count = (part.strip() for part in spec.split(":"))
+            start, stop, count = float(start), float(stop), int(count)
+            if count < 1:
+                raise ValueError
+            values = [start + (stop - start) * i / max(count - 1, 1) for i in range(count)]
+        else:
+            values = [float(value) for value in spec.split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"{label}: expected values like \"2, 3, 4\" or a range like \"2:4:5\", got \"{spec}\"")
+    values = [round(value) if cast is int else round(value, 3) for value in values]
+    out_of_range = [value for value in values if not minimum <= value <= maximum]
+    if out_of_range:
+        raise ValueError(f"{label}: {out_of_range[0]} is outside [{minimum}, {maximum}]")
+    # Identical values (e.g. a step range rounded to integers) would only duplicate cells
+    return list(dict.fromkeys(values))
+
+
+def expand_grid(axes: dict) -> list:
+    """
+    Every combination of the axes ({name: values}), as {name: value} dicts in row-major order
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def sweep_jobs(prompt: str, seed: int, axes: dict) -> list:
+    """
+    Jobs ({"prompt", "seed", **cell}) of a sweep. A random seed (-1) is drawn once for the
+    whole grid, so that the cells only differ by the swept settings.
+    """
+    if not axes:
+        raise ValueError("Enter values for at least one parameter to sweep")
+    cells = expand_grid(axes)
+    if len(cells) > SWEEP_MAX_CELLS:
+        raise ValueError(f"Sweep too large: {len(cells)} combinations, the maximum is {SWEEP_MAX_CELLS}")
+    seed = random.randint(0, MAX_SEED) if seed is None or int(seed) == -1 else int(seed)
+    return [{"prompt": prompt, "seed": seed, **cell} for cell in cells]
+
+
+async def agenerate_sweep(jobs: list, on_status=None, **params):
+    """
+    Run every cell of a sweep at once, paced by the API key's scheduler only. `params` are the
+    settings shared by every cell; the prompt, seed and swept ones are taken from the jobs.
+    Yields the same (index, job, images, error) tuples as agenerate_batch.
+    """
+    params = {name: value for name, value in params.items() if not jobs or name not in jobs[0]}
+    async for item in agenerate_batch(jobs, concurrency=max(1, len(jobs)), on_status=on_status, **params):
+        yield item
+
+
+def format_value(name: str, value) -> str:
+    label = SWEEP_PARAMETERS[name][0]
+    return f"{label} {value:g}" if isinstance(value, float) else f"{label} {value}"
+
+
+def _text_strip(lines: list, width: int, height: int, align_center: bool = True):
+    """
+    RGB array of width x height holding the lines of text, vertically centered
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("RGB", (width, height), (BACKGROUND,) * 3)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=SWEEP_LABEL_SIZE)
+    line_height = SWEEP_LABEL_SIZE + 4
+    y = (height - line_height * len(lines)) // 2
+    for line in lines:
+        text_width = draw.textlength(line, font=font)
+        x = (width - text_width) / 2 if align_center else LABEL_PADDING
+        draw.text((x, y), line, fill=(20, 20, 20), font=font)
+        y += line_height
+    return np.asarray(image)
+
+
+def _load_cell(path: str, cell_width: int, cell_height: int):
+    """
+    Image scaled to fit the cell (aspect ratio kept), as an RGB array, None if unreadable
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(path) as image:
+            return np.asarray(ImageOps.contain(image.convert("RGB"), (cell_width, cell_height), Image.Resampling.LANCZOS))
+    except (OSError, ValueError):
+        return None
+
+
+def compose_sheet(images: list, columns: int, column_labels: list, row_labels: list = None, aspect_ratio: float = 1.0,
+                  cell_size: int = SWEEP_CELL_SIZE, row_label_width: int = None):
+    """
+    Labeled grid of image files as a PIL image, filled row by row. images[i] is a file path
+    or None (a failed cell, greyed out). column_labels and row_labels hold the lines of text
+    of each column and row; without row_labels there is no label column.
+    aspect_ratio is the images' height / width.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rows = -(-len(images) // columns)
+    cell_width, cell_height = cell_size, max(1, round(cell_size * aspect_ratio))
+
+    # (rows, columns, height, width, RGB) block of cells, each image centered in its cell
+    cells = np.full((rows, columns, cell_height, cell_width, 3), BACKGROUND, dtype=np.uint8)
+    failed = np.zeros((rows, columns), dtype=bool)
+    for index, path in enumerate(images):
+        row, column = divmod(index, columns)
+        pixels = _load_cell(path, cell_width, cell_height) if path else None
+        if pixels is None:
+            failed[row, column] = True
+            continue
+        top, left = (cell_height - pixels.shape[0]) // 2, (cell_width - pixels.shape[1]) // 2
+        cells[row, column, top:top + pixels.shape[0], left:left + pixels.shape[1]] = pixels
+    # Failed cells are greyed out in one masked assignment
+    cells[failed] = 200
+    cells = np.pad(cells, ((0, 0), (0, 0), (GUTTER, GUTTER), (GUTTER, GUTTER), (0, 0)), constant_values=BACKGROUND)
+    block_height, block_width = cells.shape[2], cells.shape[3]
+    grid = cells.transpose(0, 2, 1, 3, 4).reshape(rows * block_height, columns * block_width, 3)
+
+    label_height = (SWEEP_LABEL_SIZE + 4) * max(len(lines) for lines in column_labels) + 2 * LABEL_PADDING
+    header = np.concatenate([_text_strip(lines, block_width, label_height) for lines in column_labels], axis=1)
+    if not row_labels:
+        return Image.fromarray(np.concatenate([header, grid], axis=0))
+    row_label_width = row_label_width or max(160, cell_size // 2)
+    labels = np.concatenate(
+        [_text_strip(lines, row_label_width, block_height, align_center=False) for lines in row_labels], axis=0
+    )
+    corner = np.full((label_height, row_label_width, 3), BACKGROUND, dtype=np.uint8)
+    sheet = np.concatenate([np.concatenate([corner, header], axis=1), np.concatenate([labels, grid], axis=1)], axis=0)
+    return Image.fromarray(sheet)
+
+
+def contact_sheet(jobs: list, images: list, axes: dict, aspect_ratio: float = 1.0, cell_size: int = SWEEP_CELL_SIZE):
+    """
+    Contact sheet of a sweep: the last swept parameter on the columns, the combinations
+    of the others on the rows. images[i] is the file of jobs[i] (None when it failed).
+    """
+    names = list(axes)
+    column_name, row_names = names[-1], names[:-1]
+    columns = len(axes[column_name])
+    column_labels = [[format_value(column_name, value)] for value in axes[column_name]]
+    row_labels = [[format_value(name, job[name]) for name in row_names] for job in jobs[::columns]] if row_names else None
+    return compose_sheet(images, columns, column_labels, row_labels, aspect_ratio, cell_size)
+
+
+def save_contact_sheet(image, directory: str = SWEEP_DIR, prefix: str = "sweep") -> str:
+    """
+    Save a contact sheet as a JPEG in the sweeps directory, returns its path
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(24):06x}.jpg")
+    image.save(path, format="JPEG", quality=SWEEP_SHEET_QUALITY)
+    return path
@@ -1,8 +1,24 @@
+import os
+import threading
 import gradio as gr
+from api_utils import resume_pending_jobs
+from finetune_tracker import get_finetune_tracker
+from instrumentation import configure_logging
+from output_store import archive_past_results
 from inference_view import create_inference_view
 from finetuning_view import create_finetuning_view
+from history_view import create_history_view
 
-from config import AVAILABLE_MODELS
+from config import (
+    AVAILABLE_MODELS,
+    DATA_DIR,
+    QUEUE_DEFAULT_CONCURRENCY,
+    QUEUE_MAX_SIZE,
+    WEB_HOST,
+    WEB_PORT,
+    WEB_WORKER_INDEX,
+    WEB_WORKERS,
+)
 
 css = """
 .resizable_vertical {
@@ -12,32 +28,56 @@ css = """
 """
 
 
-with gr.Blocks(css=css) as demo:
-    gr.Markdown("# Flux Pro GUI")
-    with gr.Row():
-        model_state = gr.State(list(AVAILABLE_MODELS.keys())[0])
-        model_input = gr.Dropdown(
-            label="Model",
-            info="Please note that finetuning is not available for Flux 1.1 Pro",
-            choices=AVAILABLE_MODELS.keys(),
-            interactive=True,
-        )
-        model_input.change(lambda x: x, model_input, model_state)
-        api_key_input = gr.Textbox(
-            label="API key",
-            info="Get your BFL API key at https://docs.bfl.ml/",
-            interactive=True,
-            max_lines=1,
-            type="password",
-            scale=4,
-        )
+def create_demo() -> gr.Blocks:
+    """
+    Build the Gradio app. Kept out of module level so that processes importing this
+    module (e.g. spawned pool workers) do not build the whole UI.
+    """
+    with gr.Blocks(css=css) as demo:
+        gr.Markdown("# Flux Pro GUI")
+        with gr.Row():
+            model_state = gr.State(list(AVAILABLE_MODELS.keys())[0])
+            model_input = gr.Dropdown(
+                label="Model",
+                info="Please note that finetuning is not available for Flux 1.1 Pro",
+                choices=AVAILABLE_MODELS.keys(),
+                interactive=True,
+            )
+            model_input.change(lambda x: x, model_input, model_state)
+            api_key_input = gr.Textbox(
+                label="API key",
+                info="Get your BFL API key at https://docs.bfl.ml/",
+                interactive=True,
+                max_lines=1,
+                type="password",
+                scale=4,
+            )
 
-    with gr.Tabs():
-        with gr.Tab(label="Inference", id="inference_tab"):
-            create_inference_view(model_state, api_key_input)
-        with gr.Tab(label="Finetuning", id="finetuning_tab"):
-            create_finetuning_view(model_state, api_key_input)
+        with gr.Tabs():
+            with gr.Tab(label="Inference", id="inference_tab"):
+                create_inference_view(model_state, api_key_input)
+            with gr.Tab(label="Finetuning", id="finetuning_tab"):
+                create_finetuning_view(model_state, api_key_input)
+            with gr.Tab(label="History", id="history_tab") as history_tab:
+                create_history_view(history_tab)
+    return demo
 
 
 if __name__ == "__main__":
-    demo.launch(inbrowser=True)
+    configure_logging()
+    # Resume the generations and finetunes left unfinished by a previous run (other keys resume on first use)
+    resume_pending_jobs(os.environ.get("BFL_API_KEY"))
+    get_finetune_tracker().resume(os.environ.get("BFL_API_KEY"))
+    if WEB_WORKER_INDEX == 0:
+        # Add the images generated before the History tab existed to it (once, when started by serve.py)
+        threading.Thread(target=archive_past_results, name="history-import", daemon=True).start()
+    demo = create_demo()
+    # Handlers set their own limits (QUEUE_CONCURRENCY), the others share this default
+    demo.queue(default_concurrency_limit=QUEUE_DEFAULT_CONCURRENCY, max_size=QUEUE_MAX_SIZE)
+    # Generated images are served to the gallery straight from the data directory, by any worker
+    demo.launch(
+        server_name=WEB_HOST,
+        server_port=WEB_PORT,
+        inbrowser=WEB_WORKERS == 1,
+        allowed_paths=[DATA_DIR],
+    )
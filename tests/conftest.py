@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The application modules import each other by their flat names (see src/webui.py)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+# Caches, registries and outputs of the tests never land in ~/.flux-pro-gui
+os.environ.setdefault("FLUX_GUI_DATA_DIR", tempfile.mkdtemp(prefix="flux-gui-tests-"))
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Start a local mock BFL API (benchmarks/mock_bfl_server.py): mock_server(**settings)
+    """
+    from mock_bfl_server import MockBFLServer, MockSettings
+
+    servers = []
+
+    def start(**settings):
+        settings.setdefault("latency", 0)
+        server = MockBFLServer(settings=MockSettings(**settings)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def mock_api(mock_server, monkeypatch):
+    """
+    Send the generations of the test to a mock BFL API: mock_api(**settings) returns the server
+    """
+    import endpoints
+
+    def start(**settings):
+        settings.setdefault("queue_time", 0)
+        settings.setdefault("generation_time", 0.2)
+        settings.setdefault("image_size", 64)
+        server = mock_server(**settings)
+        monkeypatch.setattr(endpoints, "_registry", endpoints.EndpointRegistry({"default": server.url}))
+        return server
+
+    return start
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+from api_utils import agenerate_image, generate_image
+
+GENERATION = dict(model_id="flux-pro-1.1", prompt="a red fox", width=256, height=256, steps=20, guidance_scale=2.5, interval=0.1)
+
+
+def test_identical_generations_share_a_task_without_cache(mock_api):
+    server = mock_api(generation_time=0.5)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(generate_image("key", seed=11, use_cache=False, **GENERATION)))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert server.stats["/v1/flux-pro-1.1"] == 1
+    assert len(results) == 3 and all(result == results[0] for result in results)
+
+
+def test_follower_status_on_its_event_loop(mock_api):
+    server = mock_api(generation_time=0.5)
+    leader = threading.Thread(target=generate_image, args=("key",), kwargs=dict(seed=12, use_cache=False, **GENERATION))
+
+    async def follow():
+        loop_thread = threading.get_ident()
+        statuses = []
+
+        def on_status(stage, progress):
+            statuses.append((stage, threading.get_ident() == loop_thread))
+
+        leader.start()
+        await asyncio.sleep(0.2)
+        images = await agenerate_image("key", seed=12, use_cache=False, on_status=on_status, **GENERATION)
+        await asyncio.sleep(0)
+        return images, statuses
+
+    images, statuses = asyncio.run(follow())
+    leader.join(10)
+    assert images and server.stats["/v1/flux-pro-1.1"] == 1
+    assert statuses and all(on_loop for stage, on_loop in statuses)
+    assert statuses[-1][0] == "done"
@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from batch_cli import load_jobs
+
+
+def _write_jobs(tmp_path, jobs):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text("".join(json.dumps(job) + "\n" for job in jobs), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("ids", [("a b", "a_b"), ("x/y", "x_y"), ("Cat", "cat"), ("same", "same")])
+def test_load_jobs_rejects_ids_sharing_an_output_file(tmp_path, ids):
+    path = _write_jobs(tmp_path, [{"id": job_id, "prompt": "a cat"} for job_id in ids])
+    with pytest.raises(ValueError):
+        load_jobs(path)
+
+
+def test_load_jobs_defaults(tmp_path):
+    path = _write_jobs(tmp_path, [{"prompt": "a cat"}, {"id": "dog 1", "prompt": "a dog", "raw": "yes"}])
+    jobs = load_jobs(path)
+    assert [job["id"] for job in jobs] == ["0", "dog 1"]
+    assert jobs[0]["model"] == "flux-pro-1.1" and jobs[0]["raw"] is False
+    assert jobs[1]["raw"] is True
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import fire
+import pytest
+
+import cli
+
+calls = []
+
+
+def request_finetuning(file_path, finetune_comment, trigger_word="TOK", captioning: bool = True, iterations: int = 300):
+    """
+    Stand-in for bfl_finetune.request_finetuning
+    """
+    calls.append((file_path, finetune_comment, trigger_word, captioning, iterations))
+
+
+COMMANDS = {"request_finetuning": request_finetuning}
+
+
+@pytest.mark.parametrize("argv", [
+    ["request_finetuning", "d.zip", "c", "--captioning", "False"],
+    ["request_finetuning", "d.zip", "c", "--captioning=False"],
+    ["request_finetuning", "d.zip", "c", "--nocaptioning", "--iterations", "500"],
+    ["request_finetuning", "d.zip", "c", "--captioning", "--trigger_word", "SKS"],
+    ["request_finetuning", "d.zip", "c", "SKS", "--iterations=1e3"],
+    ["request_finetuning", "--file_path=d.zip", "--finetune_comment", "a,b"],
+])
+def test_main_calls_command_like_fire(argv):
+    calls.clear()
+    cli.main(COMMANDS, argv=argv)
+    fire.Fire(COMMANDS, command=argv)
+    assert len(calls) == 2
+    assert calls[0] == calls[1]
+
+
+def test_bool_flag_takes_following_value():
+    calls.clear()
+    cli.main(COMMANDS, argv=["request_finetuning", "d.zip", "c", "--captioning", "False"])
+    assert calls == [("d.zip", "c", "TOK", False, 300)]
+
+
+def test_help_text():
+    assert cli.help_text(COMMANDS, "Doc", ["--help"]).startswith("Doc\n\nCommands:\n  request_finetuning(")
+    assert "Stand-in" in cli.help_text(COMMANDS, None, ["request_finetuning", "--help"])
+    assert cli.help_text(COMMANDS, None, ["request_finetuning", "d.zip", "c"]) is None
+    assert cli.help_text(request_finetuning, None, ["d.zip"]) is None
+
+
+def test_help_does_not_import_fire():
+    code = (
+        "import sys, cli\n"
+        "cli.main({'f': lambda: None}, 'Doc', ['--help'])\n"
+        "assert 'fire' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(cli.__file__), capture_output=True)
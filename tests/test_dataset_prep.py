@@ -0,0 +1,51 @@
+import random
+import zipfile
+from io import BytesIO
+
+from PIL import Image
+
+from dataset_prep import output_stems, preprocess_dataset
+
+
+def _image_bytes(seed: int, format: str) -> bytes:
+    # Noise of different seeds: far apart perceptually, never deduplicated
+    generator = random.Random(seed)
+    image = Image.new("RGB", (64, 64))
+    image.putdata([(generator.randrange(256),) * 3 for _ in range(64 * 64)])
+    output = BytesIO()
+    image.save(output, format=format)
+    return output.getvalue()
+
+
+def test_output_stems_keep_extension_on_collision():
+    assert output_stems(["dog.png", "cat.png", "cat.jpg", "bird.JPG", "bird.jpeg"]) == {
+        "dog.png": "dog",
+        "cat.png": "cat_png",
+        "cat.jpg": "cat_jpg",
+        "bird.JPG": "bird_jpg",
+        "bird.jpeg": "bird_jpeg",
+    }
+    # A suffixed stem that exists already is numbered
+    assert output_stems(["cat.png", "cat.PNG", "cat_png.jpg"]) == {
+        "cat.PNG": "cat_png",
+        "cat.png": "cat_png_2",
+        "cat_png.jpg": "cat_png_3",
+    }
+
+
+def test_preprocess_dataset_colliding_stems(tmp_path):
+    source = tmp_path / "dataset.zip"
+    with zipfile.ZipFile(source, "w") as archive:
+        archive.writestr("cat.png", _image_bytes(1, "PNG"))
+        archive.writestr("cat.jpg", _image_bytes(2, "JPEG"))
+        archive.writestr("cat.txt", "a cat")
+        archive.writestr("dog.png", _image_bytes(3, "PNG"))
+
+    output_path, report = preprocess_dataset(str(source), str(tmp_path / "out.zip"), near_duplicate_distance=0, workers=1)
+
+    with zipfile.ZipFile(output_path) as archive:
+        names = archive.namelist()
+        assert len(names) == len(set(names))
+        assert sorted(names) == ["cat_jpg.jpg", "cat_jpg.txt", "cat_png.jpg", "cat_png.txt", "dog.jpg"]
+        assert archive.read("cat_png.txt") == b"a cat"
+    assert report["images_out"] == 3
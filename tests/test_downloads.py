@@ -0,0 +1,100 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import downloads
+from downloads import DownloadError, download_file, validate_image_file
+
+
+def _encoded(format: str) -> bytes:
+    output = BytesIO()
+    Image.effect_noise((64, 64), 64).convert("RGB").save(output, format=format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def delivery(monkeypatch):
+    """
+    Serve one JPEG at /image.jpg, cutting the first `cuts` responses halfway; returns
+    (url, image bytes, Range headers received)
+    """
+    monkeypatch.setattr(downloads, "DOWNLOAD_BACKOFF", 0)
+    # Chunks much smaller than the image, so that the first half is on disk when the transfer is cut
+    monkeypatch.setattr(downloads, "DOWNLOAD_CHUNK_SIZE", 256)
+    data = _encoded("JPEG")
+    ranges = []
+    state = {"cuts": 1}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested = self.headers.get("Range")
+            ranges.append(requested)
+            start = int(requested[len("bytes="):-1]) if requested else 0
+            body = data[start:]
+            self.send_response(206 if requested else 200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"v1"')
+            if requested:
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            self.end_headers()
+            if state["cuts"]:
+                state["cuts"] -= 1
+                body = body[:len(body) // 2]
+                self.close_connection = True
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/image.jpg", data, ranges
+    server.shutdown()
+    server.server_close()
+
+
+def test_cut_download_resumes_with_a_range_request(delivery, tmp_path):
+    url, data, ranges = delivery
+    path = download_file(url, "task", str(tmp_path))
+    assert path == str(tmp_path / "task.jpg")
+    with open(path, "rb") as f:
+        assert f.read() == data
+    # The second request only asks for the bytes after the chunks already written
+    assert len(ranges) == 2 and ranges[0] is None
+    assert 0 < int(ranges[1][len("bytes="):-1]) <= len(data) // 2
+    assert not (tmp_path / "task.part").exists()
+
+
+@pytest.mark.parametrize("format, extension", [("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp")])
+def test_validate_complete_and_truncated_images(tmp_path, format, extension):
+    data = _encoded(format)
+    path = tmp_path / "image"
+    path.write_bytes(data)
+    assert validate_image_file(str(path), len(data)) == extension
+    path.write_bytes(data[:-20])
+    with pytest.raises(DownloadError) as error:
+        validate_image_file(str(path))
+    assert error.value.retryable
+    with pytest.raises(DownloadError):
+        validate_image_file(str(path), len(data))
+
+
+def test_validate_rejects_other_content(tmp_path):
+    path = tmp_path / "image"
+    path.write_bytes(b"<html>Access denied</html>")
+    with pytest.raises(DownloadError) as error:
+        validate_image_file(str(path))
+    assert not error.value.retryable
+
+
+def test_expired_url_is_not_retried(mock_server, tmp_path):
+    server = mock_server()
+    with pytest.raises(DownloadError) as error:
+        download_file(f"{server.url}/v1/expired", "task", str(tmp_path))
+    assert not error.value.retryable
+    assert server.stats["/v1/expired"] == 1
@@ -0,0 +1,22 @@
+from endpoints import EndpointRegistry
+
+
+def test_probe_counts_a_5xx_without_retrying(mock_server):
+    server = mock_server(http_error_rate=1.0)
+    registry = EndpointRegistry({"a": server.url, "b": server.url})
+    region = registry.regions[0]
+    registry.probe(region)
+    registry.probe(region)
+    assert server.stats["/v1/get_result"] == 2
+    assert region.failures == 2 and not region.healthy
+    assert region.latency is None
+
+
+def test_probe_latency_orders_regions(mock_server):
+    fast, slow = mock_server(), mock_server(latency=0.05)
+    registry = EndpointRegistry({"slow": slow.url, "fast": fast.url})
+    for region in registry.regions:
+        registry.probe(region)
+    assert [region.name for region in sorted(registry.regions, key=lambda region: region.latency)] == ["fast", "slow"]
+    registry._prober = object()  # no background probing in the test
+    assert registry.submit_order()[0].name == "fast"
@@ -0,0 +1,19 @@
+import job_registry
+from finetune_tracker import FinetuneTracker
+from job_registry import JobRegistry
+
+
+def test_resume_claims_each_finetune_once(tmp_path, monkeypatch):
+    registry = JobRegistry(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(job_registry, "_registry", registry)
+    registry.record_job("ft-orphan", "finetune", "key", params={"finetune_comment": "orphan"})
+    registry.record_job("ft-live", "finetune", "key")
+    # The process that submitted ft-orphan stopped heartbeating
+    registry._execute("UPDATE jobs SET owner = 'gone:1' WHERE id = 'ft-orphan'")
+
+    first, second = FinetuneTracker(), FinetuneTracker()  # e.g. two web workers
+    assert first.resume("key") == 1
+    assert first.get("ft-orphan")["comment"] == "orphan"
+    assert first.get("ft-live") is None
+    assert second.resume("key") == 0
+    assert registry.get_job("ft-orphan")["owner"] == registry.owner
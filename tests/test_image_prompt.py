@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+from PIL import Image
+
+import image_prompt
+from image_prompt import encode_image_prompt
+
+
+def test_key_locks_released_on_hit_miss_and_error(tmp_path, monkeypatch):
+    path = str(tmp_path / "reference.png")
+    Image.new("RGB", (32, 32), (200, 10, 10)).save(path)
+    first = encode_image_prompt(path, quality=71)
+    assert encode_image_prompt(path, quality=71) == first
+    assert image_prompt._key_locks == {}
+
+    def fail(*args):
+        raise OSError("broken image")
+
+    monkeypatch.setattr(image_prompt, "_encode", fail)
+    with pytest.raises(OSError):
+        encode_image_prompt(path, quality=72)
+    assert image_prompt._key_locks == {}
+
+
+def test_concurrent_requests_encode_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "reference.png")
+    Image.new("RGB", (32, 32), (10, 200, 10)).save(path)
+    encode = image_prompt._encode
+    started, release, encodings = threading.Event(), threading.Event(), []
+
+    def slow_encode(*args):
+        encodings.append(args)
+        started.set()
+        release.wait(5)
+        return encode(*args)
+
+    monkeypatch.setattr(image_prompt, "_encode", slow_encode)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(encode_image_prompt(path, quality=73))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(encodings) == 1
+    assert len(set(results)) == 1 and len(results) == 4
+    assert image_prompt._key_locks == {}
@@ -0,0 +1,96 @@
+import time
+
+import httpx
+import pytest
+
+import poller
+from config import POLL_INITIAL_DELAY, POLL_MAX_DELAY
+from poller import ResultPoller, TaskFailedError, next_delay
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """
+    Answer the polls with respond(task_id, poll number) -> httpx.Response; returns the polls made
+    """
+    polls = []
+
+    def use(respond):
+        def handle(request):
+            task_id = request.url.params["id"]
+            polls.append((task_id, time.monotonic()))
+            return respond(task_id, sum(1 for polled, _ in polls if polled == task_id))
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+        monkeypatch.setattr(poller, "get_async_client", lambda api_key: client)
+        return polls
+
+    return use
+
+
+def test_next_delay_backs_off_up_to_the_cap():
+    delays = [next_delay(attempt, elapsed=0) for attempt in range(12)]
+    assert delays[0] == POLL_INITIAL_DELAY
+    assert delays == sorted(delays)
+    assert delays[-1] == POLL_MAX_DELAY
+
+
+def test_next_delay_polls_sooner_near_the_end():
+    # 90% done after 9 seconds: about one second left
+    assert next_delay(10, elapsed=9, progress=0.9) == pytest.approx(1.0)
+    assert next_delay(10, elapsed=9, progress=0.999) == POLL_INITIAL_DELAY
+
+
+def test_ready_after_pending(fake_api):
+    polls = fake_api(lambda task_id, n: httpx.Response(200, json={"status": "Ready" if n == 3 else "Pending", "progress": n * 30}))
+    progress = []
+    result = ResultPoller().register("key", "t1", on_progress=progress.append).result(10)
+    assert result["status"] == "Ready"
+    assert len(polls) == 3 and [update["progress"] for update in progress] == [30, 60]
+
+
+def test_failed_status(fake_api):
+    fake_api(lambda task_id, n: httpx.Response(200, json={"status": "Content Moderated"}))
+    with pytest.raises(TaskFailedError) as error:
+        ResultPoller().register("key", "t1").result(10)
+    assert error.value.status == "Content Moderated"
+
+
+def test_timeout(fake_api):
+    fake_api(lambda task_id, n: httpx.Response(200, json={"status": "Pending"}))
+    start = time.monotonic()
+    with pytest.raises(TaskFailedError) as error:
+        ResultPoller().register("key", "t1", timeout=1.0).result(10)
+    assert error.value.status == "Timeout"
+    assert time.monotonic() - start < 1.5
+
+
+def test_transient_errors_are_retried(fake_api):
+    fake_api(lambda task_id, n: httpx.Response(503) if n < 3 else httpx.Response(200, json={"status": "Ready"}))
+    assert ResultPoller().register("key", "t1").result(10)["status"] == "Ready"
+
+
+def test_client_error_fails_at_once(fake_api):
+    polls = fake_api(lambda task_id, n: httpx.Response(403))
+    with pytest.raises(TaskFailedError):
+        ResultPoller().register("key", "t1").result(10)
+    assert len(polls) == 1
+
+
+def test_rate_limit_pauses_every_task_of_the_key(fake_api):
+    def respond(task_id, n):
+        if task_id == "t1" and n == 1:
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        if task_id == "t2" and n == 1:
+            return httpx.Response(200, json={"status": "Pending"})
+        return httpx.Response(200, json={"status": "Ready"})
+
+    polls = fake_api(respond)
+    result_poller = ResultPoller()
+    first = result_poller.register("key", "t1")
+    second = result_poller.register("key", "t2")
+    first.result(10), second.result(10)
+    # Both tasks are polled once right away, then nothing of the key until Retry-After has passed
+    rate_limited_at = next(at for task_id, at in polls if task_id == "t1")
+    later = [at for _, at in polls[2:]]
+    assert len(later) == 2 and min(later) - rate_limited_at >= 0.95
@@ -0,0 +1,47 @@
+import os
+
+from result_cache import ResultCache, cache_key
+
+
+def _image(tmp_path, name: str, size: int = 1000) -> str:
+    path = tmp_path / f"{name}.jpg"
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_cache_key():
+    payload = {"prompt": "a cat", "seed": 1, "width": 512}
+    assert cache_key("flux-pro-1.1", payload) == cache_key("flux-pro-1.1", dict(reversed(payload.items())))
+    assert cache_key("flux-pro-1.1", payload) != cache_key("flux-pro", payload)
+    assert cache_key("flux-pro-1.1", {**payload, "seed": None}) is None
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    for name in "ab":
+        cache.put(name * 64, {"name": name}, _image(tmp_path, name))
+    # Using "a" makes "b" the least recently used entry
+    assert cache.get("a" * 64)[0]["name"] == "a"
+    cache.put("c" * 64, {"name": "c"}, _image(tmp_path, "c"))
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) is not None and cache.get("c" * 64) is not None
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] <= 2500
+    assert os.listdir(tmp_path / "cache" / "bb") == []
+
+
+def test_entry_larger_than_the_cache_is_kept_alone(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=500)
+    cache.put("a" * 64, {}, _image(tmp_path, "a"))
+    cache.put("b" * 64, {}, _image(tmp_path, "b"))
+    assert cache.get("a" * 64) is None and cache.get("b" * 64) is not None
+
+
+def test_shared_directory(tmp_path):
+    writer, reader = ResultCache(str(tmp_path / "cache")), ResultCache(str(tmp_path / "cache"))
+    assert reader.get("a" * 64) is None
+    cached_path = writer.put("a" * 64, {"name": "a"}, _image(tmp_path, "a"))
+    meta, image_path = reader.get("a" * 64)
+    assert meta["name"] == "a" and image_path == cached_path
+    # An entry removed by another process is a miss, not an error
+    os.remove(cached_path)
+    assert reader.get("a" * 64) is None
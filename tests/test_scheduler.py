@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from job_registry import key_fingerprint
+from scheduler import JobScheduler, SharedTokenBucket, TokenBucket
+
+
+def _grant_order(scheduler: JobScheduler, jobs: list, cancel: tuple = ()) -> list:
+    """
+    Names of the jobs ([(name, priority, group)]) in the order they get the single slot, queued
+    while it is held; the jobs named in cancel give up while queued
+    """
+    order = []
+
+    async def job(name, priority, group):
+        async with scheduler.aslot("key", priority, group):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        async with scheduler.aslot("key"):
+            tasks = {name: asyncio.create_task(job(name, priority, group)) for name, priority, group in jobs}
+            await asyncio.sleep(0.01)
+            assert scheduler.stats()[key_fingerprint("key")]["queued"] == len(jobs)
+            for name in cancel:
+                tasks[name].cancel()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    asyncio.run(run())
+    return order
+
+
+def test_interactive_jobs_go_first():
+    scheduler = JobScheduler(max_concurrency=1, shared_state=False)
+    jobs = [("b1", "batch", None), ("i1", "interactive", None), ("b2", "batch", None), ("i2", "interactive", None)]
+    assert _grant_order(scheduler, jobs) == ["i1", "i2", "b1", "b2"]
+
+
+def test_queue_groups_are_served_round_robin():
+    scheduler = JobScheduler(max_concurrency=1, shared_state=False)
+    jobs = [("a1", "batch", "a"), ("a2", "batch", "a"), ("a3", "batch", "a"), ("b1", "batch", "b"), ("b2", "batch", "b")]
+    assert _grant_order(scheduler, jobs) == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_cancelled_waiters_are_skipped():
+    scheduler = JobScheduler(max_concurrency=1, shared_state=False)
+    jobs = [("j1", "batch", None), ("j2", "batch", None), ("j3", "batch", None)]
+    assert _grant_order(scheduler, jobs, cancel=("j2",)) == ["j1", "j3"]
+    assert scheduler.stats()[key_fingerprint("key")] == {"in_flight": 0, "queued": 0}
+
+
+def test_concurrency_limit():
+    scheduler = JobScheduler(max_concurrency=3, shared_state=False)
+    running, peak = 0, 0
+
+    async def job():
+        nonlocal running, peak
+        async with scheduler.aslot("key"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*(job() for _ in range(10)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_token_bucket(tmp_path, shared):
+    if shared:
+        bucket = SharedTokenBucket("key", rate=10, burst=2, path=str(tmp_path / "state.sqlite3"))
+    else:
+        bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    # The burst is free, then one token every 1/rate seconds, in reservation order
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02) and waits[3] == pytest.approx(0.2, abs=0.02)
+    bucket.pause(1.0)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_shared_token_bucket_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    # e.g. the buckets of one API key in two web workers
+    first, second = (SharedTokenBucket("key", rate=10, burst=2, path=path) for _ in range(2))
+    other_key = SharedTokenBucket("other", rate=10, burst=2, path=path)
+    assert first.reserve() == 0 and second.reserve() == 0
+    assert first.reserve() == pytest.approx(0.1, abs=0.02)
+    assert other_key.reserve() == 0
+    second.pause(1.0)
+    assert first.reserve() == pytest.approx(1.0, abs=0.05)
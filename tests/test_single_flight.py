@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _run_threads(count: int, target) -> list:
+    results = []
+
+    def run():
+        try:
+            results.append(target())
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_identical_calls_share_one_flight():
+    flights, release = SingleFlight(), threading.Event()
+    calls, statuses = [], []
+
+    def fn(notify):
+        calls.append(1)
+        notify("generating", 0.5)
+        release.wait(5)
+        return ["image.jpg"]
+
+    threading.Timer(0.1, release.set).start()
+    results = _run_threads(4, lambda: flights.do("key", fn, lambda *status: statuses.append(status)))
+    assert len(calls) == 1
+    assert results == [["image.jpg"]] * 4
+    # Followers that joined after the update caught up with it
+    assert statuses == [("generating", 0.5)] * 4
+    assert flights.in_flight() == 0
+
+
+def test_leader_failure_fails_the_followers_once():
+    flights, release = SingleFlight(), threading.Event()
+    calls = []
+
+    def fn(notify):
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("API down")
+
+    threading.Timer(0.1, release.set).start()
+    results = _run_threads(3, lambda: flights.do("key", fn))
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    # The failure is not cached: the next call starts a new flight
+    assert flights.do("key", lambda notify: "ok") == "ok"
+
+
+class _Interrupted(BaseException):
+    pass
+
+
+def test_followers_start_over_when_the_leader_is_interrupted():
+    flights = SingleFlight()
+    leading, release = threading.Event(), threading.Event()
+    calls = []
+
+    def interrupted(notify):
+        calls.append("interrupted")
+        leading.set()
+        release.wait(5)
+        raise _Interrupted
+
+    def leader():
+        with pytest.raises(_Interrupted):
+            flights.do("key", interrupted)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leading.wait(5)
+
+    def follow():
+        return flights.do("key", lambda notify: calls.append("retried") or "ok")
+
+    follower = threading.Thread(target=lambda: calls.append(follow()))
+    follower.start()
+    time.sleep(0.1)  # the follower is waiting on the leader's flight
+    release.set()
+    thread.join(5)
+    follower.join(5)
+    assert calls == ["interrupted", "retried", "ok"]
+
+
+def test_async_followers_start_over_when_the_leader_is_cancelled():
+    flights = SingleFlight()
+    calls = []
+
+    async def fn(notify):
+        calls.append(1)
+        await asyncio.sleep(0.2 if len(calls) == 1 else 0)
+        return len(calls)
+
+    async def run():
+        leader = asyncio.create_task(flights.ado("key", fn))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.create_task(flights.ado("key", fn)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    # One follower leads the second flight, the others share it
+    assert asyncio.run(run()) == [2, 2, 2]
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_does_not_cancel_the_flight():
+    flights = SingleFlight()
+
+    async def fn(notify):
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def run():
+        leader = asyncio.create_task(flights.ado("key", fn))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.ado("key", fn))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(run()) == "ok"